@@ -0,0 +1,110 @@
+import io
+import os
+import random
+from typing import Callable, Dict
+
+import fitz
+from PIL import Image, ImageDraw
+
+WORDS = (
+    "revenue margin quarter forecast contract clause party agreement schedule "
+    "amendment liability payment invoice balance total annual report section"
+).split()
+
+LETTER = (612, 792)
+# A1, drawings and posters
+LARGE_FORMAT = (1684, 2384)
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _text_page(doc: fitz.Document, rng: random.Random):
+    page = doc.new_page(width=LETTER[0], height=LETTER[1])
+    page.insert_text((72, 72), "Section heading", fontsize=18)
+    page.insert_textbox(
+        fitz.Rect(72, 100, LETTER[0] - 72, LETTER[1] - 72),
+        "\n\n".join(_paragraph(rng, 60) for _ in range(6)),
+        fontsize=10,
+    )
+
+
+def _table_page(doc: fitz.Document, rng: random.Random):
+    page = doc.new_page(width=LETTER[0], height=LETTER[1])
+    page.insert_text((72, 72), "Quarterly figures", fontsize=14)
+    columns, rows = 4, 20
+    left, top, cell_width, cell_height = 72, 96, 117, 24
+
+    for row in range(rows + 1):
+        y = top + row * cell_height
+        page.draw_line((left, y), (left + columns * cell_width, y))
+
+    for column in range(columns + 1):
+        x = left + column * cell_width
+        page.draw_line((x, top), (x, top + rows * cell_height))
+
+    for row in range(rows):
+        for column in range(columns):
+            text = rng.choice(WORDS) if row == 0 else str(rng.randint(0, 99999))
+            page.insert_text(
+                (left + column * cell_width + 4, top + (row + 1) * cell_height - 8),
+                text,
+                fontsize=9,
+            )
+
+
+def _scanned_page(doc: fitz.Document, rng: random.Random, size=LETTER):
+    # a raster of text with speckle noise and no text layer, like a scanner makes
+    dpi_scale = 150 / 72
+    width, height = int(size[0] * dpi_scale), int(size[1] * dpi_scale)
+    image = Image.new("L", (width, height), 245)
+    draw = ImageDraw.Draw(image)
+
+    for line in range(0, height - 150, 28):
+        draw.text((100, 100 + line), _paragraph(rng, 14), fill=20)
+
+    for _ in range(width * height // 400):
+        draw.point((rng.randrange(width), rng.randrange(height)), fill=180)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=70)
+
+    page = doc.new_page(width=size[0], height=size[1])
+    page.insert_image(page.rect, stream=buffer.getvalue())
+
+
+def _large_format_page(doc: fitz.Document, rng: random.Random):
+    _scanned_page(doc, rng, size=LARGE_FORMAT)
+
+
+PAGE_KINDS: Dict[str, Callable[[fitz.Document, random.Random], None]] = {
+    "text": _text_page,
+    "tables": _table_page,
+    "scans": _scanned_page,
+    "large_format": _large_format_page,
+}
+
+
+def build_corpus(directory: str, pages: int, seed: int = 0) -> Dict[str, str]:
+    """
+    Writes one synthetic PDF per page kind plus a mixed document, and returns
+    their paths keyed by name. The same seed always builds the same corpus.
+    """
+    os.makedirs(directory, exist_ok=True)
+    documents = {name: [name] * pages for name in PAGE_KINDS}
+    documents["mixed"] = [list(PAGE_KINDS)[i % len(PAGE_KINDS)] for i in range(pages)]
+    paths = {}
+
+    for name, kinds in documents.items():
+        rng = random.Random(f"{seed}:{name}")
+        doc = fitz.open()
+
+        for kind in kinds:
+            PAGE_KINDS[kind](doc, rng)
+
+        paths[name] = os.path.join(directory, f"{name}.pdf")
+        doc.save(paths[name], garbage=3, deflate=True)
+        doc.close()
+
+    return paths
@@ -0,0 +1,326 @@
+"""
+End-to-end benchmark of process_remote_document against local stand-ins:
+storage is a directory, inference and the jobs API are a local HTTP server
+with configurable latency and error rate.
+
+    python -m benchmarks.run --pages 20 --latency 0.2
+    python -m benchmarks.run --save-baseline benchmarks/baselines/local.json
+    python -m benchmarks.run --baseline benchmarks/baselines/local.json
+    PAGE_RENDER_PROCESSES=4 python -m benchmarks.run --documents large_format
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.corpus import build_corpus
+from benchmarks.stand_ins import FakeInferenceServer
+
+# metric name -> True when higher is better
+COMPARED_METRICS = {
+    "pages_per_second": True,
+    "latency_p50_ms": False,
+    "latency_p99_ms": False,
+    "peak_rss_mb": False,
+    "bytes_per_page": False,
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    rank = max(math.ceil(p / 100 * len(values)) - 1, 0)
+    return values[rank]
+
+
+def get_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # peak for the whole process, the best we get without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler:
+    def __init__(self, interval: float = 0.01):
+        self.peak = get_rss_bytes()
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self.peak = max(self.peak, get_rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_rss_bytes())
+
+
+@contextlib.contextmanager
+def page_timer(processor):
+    """
+    Times image pages from the start of their first render to their
+    converted markdown, retries at a higher resolution included. Each page
+    is converted on a single pipeline thread, so the start is thread local.
+    """
+    latencies = []
+    state = threading.local()
+    encode_page = processor.encode_page
+    convert_page_to_markdown = processor.convert_page_to_markdown
+
+    def timed_encode_page(*args, **kwargs):
+        if getattr(state, "started", None) is None:
+            state.started = time.perf_counter()
+
+        return encode_page(*args, **kwargs)
+
+    def timed_convert_page_to_markdown(*args, **kwargs):
+        try:
+            page = convert_page_to_markdown(*args, **kwargs)
+        except Exception:
+            state.started = None
+            raise
+
+        if page is not None and state.started is not None:
+            latencies.append(time.perf_counter() - state.started)
+            state.started = None
+
+        return page
+
+    processor.encode_page = timed_encode_page
+    processor.convert_page_to_markdown = timed_convert_page_to_markdown
+
+    try:
+        yield latencies
+    finally:
+        processor.encode_page = encode_page
+        processor.convert_page_to_markdown = convert_page_to_markdown
+
+
+@contextlib.contextmanager
+def local_worker(storage_dir: str, server_url: str, **overrides):
+    """
+    Points the worker at local storage and the stand-in server, with Redis
+    backed features off. Config is restored and cached clients dropped on
+    exit.
+    """
+    from worker import cache, clients, config, http_client, notifications, render_pool
+
+    settings = {
+        "STORAGE_BACKEND": "local",
+        "LOCAL_STORAGE_DIR": storage_dir,
+        "INFERENCE_API_ENDPOINT": server_url,
+        "API_ENDPOINT": server_url,
+        "INFERENCE_STREAMING": False,
+        "PAGE_CACHE_BACKEND": "none",
+        "DOCUMENT_DEDUP_ENABLED": False,
+        "CHECKPOINTS_ENABLED": False,
+        **overrides,
+    }
+    previous = {name: getattr(config, name) for name in settings}
+    cached_getters = [
+        cache.get_page_cache,
+        clients.get_storage,
+        http_client.get_inference_client,
+        http_client.get_inference_limiter,
+        http_client.get_api_client,
+        render_pool.get_render_pool,
+    ]
+
+    def clear_caches():
+        # render processes outlive the cache entry, stop them first
+        if render_pool.get_render_pool.cache_info().currsize > 0:
+            pool = render_pool.get_render_pool()
+
+            if pool is not None:
+                pool.close()
+
+        for getter in cached_getters:
+            getter.cache_clear()
+
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+    clear_caches()
+
+    try:
+        yield
+    finally:
+        notifications.get_status_reporter().flush(config.STATUS_FLUSH_TIMEOUT)
+
+        for name, value in previous.items():
+            setattr(config, name, value)
+
+        clear_caches()
+
+
+def run_benchmark(
+    pages: int = 10,
+    latency: float = 0.05,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    documents: Optional[List[str]] = None,
+    seed: int = 0,
+    verbose: bool = False,
+    **overrides,
+) -> Dict[str, dict]:
+    from worker import processor
+    from worker.types import ParseJob
+
+    results = {}
+    server = FakeInferenceServer(latency, jitter, error_rate, seed=seed)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus = build_corpus(os.path.join(workdir, "corpus"), pages, seed=seed)
+        storage_dir = os.path.join(workdir, "storage")
+        uploads_dir = os.path.join(storage_dir, "uploads")
+        os.makedirs(uploads_dir)
+
+        try:
+            with local_worker(storage_dir, server.url, **overrides):
+                for name in documents or list(corpus):
+                    shutil.copyfile(
+                        corpus[name], os.path.join(uploads_dir, f"{name}.pdf")
+                    )
+                    server.reset_counters()
+
+                    job = ParseJob(
+                        job_id=f"benchmark-{name}",
+                        output_format="md",
+                        source_file=f"{name}.pdf",
+                    )
+
+                    # the worker prints every page, too much for a benchmark
+                    output = (
+                        contextlib.nullcontext(sys.stdout)
+                        if verbose
+                        else open(os.devnull, "w")
+                    )
+
+                    with output as stdout, contextlib.redirect_stdout(stdout):
+                        with page_timer(processor) as latencies, RSSSampler() as rss:
+                            started = time.perf_counter()
+                            report = processor.process_remote_document(job)
+                            elapsed = time.perf_counter() - started
+
+                    results[name] = {
+                        "pages": report.total_pages,
+                        "image_pages": report.image_pages,
+                        "text_pages": report.text_pages,
+                        "failed_pages": report.failed_pages,
+                        "seconds": round(elapsed, 3),
+                        "pages_per_second": round(report.total_pages / elapsed, 2),
+                        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                        "peak_rss_mb": round(rss.peak / 1024**2, 1),
+                        "bytes_per_page": round(
+                            server.request_bytes / max(report.total_pages, 1)
+                        ),
+                        "inference_requests": server.inference_requests,
+                        "inference_errors": server.inference_errors,
+                    }
+        finally:
+            server.close()
+
+    return results
+
+
+def compare_to_baseline(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    regressions = []
+
+    for name, metrics in results.items():
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            expected = baseline.get(name, {}).get(metric)
+
+            if not expected:
+                continue
+
+            change = (metrics[metric] - expected) / expected
+
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(
+                    f"{name}.{metric}: {metrics[metric]} vs baseline {expected} "
+                    f"({change:+.0%})"
+                )
+
+    return regressions
+
+
+def print_results(results: Dict[str, dict]):
+    columns = ["pages", "pages_per_second", "latency_p50_ms", "latency_p99_ms"]
+    columns += ["peak_rss_mb", "bytes_per_page", "failed_pages"]
+
+    print(f"{'document':<14}" + "".join(f"{column:>18}" for column in columns))
+
+    for name, metrics in results.items():
+        print(f"{name:<14}" + "".join(f"{metrics[column]:>18}" for column in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=10, help="pages per document")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--documents", nargs="*", help="default: the whole corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--save-baseline", help="write results as a baseline")
+    parser.add_argument("--baseline", help="fail on regressions against this")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="show worker output")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        pages=args.pages,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        documents=args.documents,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    print_results(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+            with open(path, "w") as fp:
+                json.dump(results, fp, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            regressions = compare_to_baseline(results, json.load(fp), args.tolerance)
+
+        for regression in regressions:
+            print("regression:", regression)
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from worker import wire
+from worker.types import InferenceRequest
+
+PAGE_OUTPUT = (
+    "```markdown\n# Page\n\nSome text.\n\n| a | b |\n|---|---|\n| 1 | 2 |\n```"
+)
+OVERLAP_OUTPUT = "```markdown\n| a | b |\n|---|---|\n| 1 | 2 |\n```\n```markdown\n\n```"
+
+
+class FakeInferenceServer:
+    """
+    Local stand-in for the inference endpoint and the jobs API. Inference
+    requests wait latency +- jitter seconds and fail with error_rate, status
+    updates always succeed. Counts requests and request bytes.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.inference_requests = 0
+        self.inference_errors = 0
+        self.request_bytes = 0
+        self.status_updates = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def _respond(self, status: int, payload: dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                status, payload = server.handle_inference(
+                    self.headers.get("Content-Type", ""), self._read_body()
+                )
+                self._respond(status, payload)
+
+            def do_PUT(self):
+                self._read_body()
+
+                with server._lock:
+                    server.status_updates += 1
+
+                self._respond(200, {})
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def handle_inference(self, content_type: str, body: bytes):
+        if content_type.startswith(wire.CONTENT_TYPE):
+            request, _ = wire.decode_request(body)
+        else:
+            request = InferenceRequest.model_validate_json(body)
+
+        with self._lock:
+            self.inference_requests += 1
+            self.request_bytes += len(body)
+            delay = max(self.latency + self._rng.uniform(-1, 1) * self.jitter, 0)
+            failed = self._rng.random() < self.error_rate
+
+            if failed:
+                self.inference_errors += 1
+
+        time.sleep(delay)
+
+        if failed:
+            return 503, {"error": "injected failure"}
+
+        if request.stop_after_markdown_blocks == 2:
+            return 200, {"outputs": [OVERLAP_OUTPUT]}
+
+        return 200, {"outputs": [PAGE_OUTPUT]}
+
+    def reset_counters(self):
+        with self._lock:
+            self.inference_requests = 0
+            self.inference_errors = 0
+            self.request_bytes = 0
+            self.status_updates = 0
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,125 @@
+import pytest
+
+
+def _encode(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self._redis = redis_client
+        self._calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self._calls.append((getattr(self._redis, name), args, kwargs))
+            return self
+
+        return call
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self._calls]
+
+
+class FakeRedis:
+    """
+    The subset of the redis client the worker uses, in memory. Values come
+    back as bytes like they do from a server, expiry is ignored.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+        self.lists = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = _encode(value)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+    def incrby(self, key, amount):
+        self.values[key] = int(self.values.get(key, 0)) + amount
+        return self.values[key]
+
+    def decrby(self, key, amount):
+        return self.incrby(key, -amount)
+
+    def hset(self, key, field, value):
+        self.values.setdefault(key, {})[_encode(field)] = _encode(value)
+
+    def hget(self, key, field):
+        return self.values.get(key, {}).get(_encode(field))
+
+    def hmget(self, key, fields):
+        return [self.hget(key, field) for field in fields]
+
+    def hgetall(self, key):
+        return dict(self.values.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.values.get(key, {}).pop(_encode(field), None)
+
+    def zadd(self, key, mapping, xx=False):
+        members = self.sorted_sets.setdefault(key, {})
+
+        for member, score in mapping.items():
+            if not xx or member in members:
+                members[member] = score
+
+    def zrem(self, key, member):
+        self.sorted_sets.get(key, {}).pop(member, None)
+
+    def zcard(self, key):
+        return len(self.sorted_sets.get(key, {}))
+
+    def zremrangebyscore(self, key, minimum, maximum):
+        members = self.sorted_sets.get(key, {})
+
+        for member, score in list(members.items()):
+            if float(minimum) <= score <= float(maximum):
+                del members[member]
+
+    def zpopmin(self, key, count=1):
+        members = self.sorted_sets.get(key, {})
+        popped = sorted(members.items(), key=lambda item: item[1])[:count]
+
+        for member, _ in popped:
+            del members[member]
+
+        return [(_encode(member), score) for member, score in popped]
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakeStatusReporter:
+    def __init__(self):
+        self.reports = []
+
+    def report(self, job_id, status, **kwargs):
+        self.reports.append((job_id, status, kwargs))
+
+    def flush(self, timeout=None):
+        return True
+
+
+@pytest.fixture
+def redis_client():
+    return FakeRedis()
+
+
+@pytest.fixture
+def status_reporter():
+    return FakeStatusReporter()
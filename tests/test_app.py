@@ -0,0 +1,267 @@
+import os
+
+import fitz
+import pytest
+
+from worker import app, clients, config, processor, scheduling
+from worker.storage import LocalStorage
+from worker.types import ParseJob
+
+
+@pytest.fixture
+def fake_worker(tmp_path, monkeypatch, redis_client, status_reporter):
+    pdf_path = str(tmp_path / "source.pdf")
+    doc = fitz.open()
+
+    for i in range(7):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+
+    doc.save(pdf_path)
+    doc.close()
+
+    with fitz.open(pdf_path) as doc:
+        images = [processor.encode_page(doc, i) for i in range(doc.page_count)]
+
+    uploads = {}
+
+    def fake_upload_files(files):
+        for source, destination in files:
+            with open(source) as fp:
+                uploads[destination] = fp.read()
+
+    def read_range(offset, length):
+        with open(pdf_path, "rb") as fp:
+            fp.seek(offset)
+            return fp.read(length)
+
+    def fake_convert_page_to_markdown(image):
+        return f"| row {images.index(image)} |"
+
+    monkeypatch.setattr(
+        processor, "convert_page_to_markdown", fake_convert_page_to_markdown
+    )
+    monkeypatch.setattr(
+        processor,
+        "correct_page_overlap",
+        lambda last, current: (last, current.replace("row", "corrected row")),
+    )
+    monkeypatch.setattr(
+        processor,
+        "download_file",
+        lambda source, destination: fitz.open(pdf_path).save(destination),
+    )
+    monkeypatch.setattr(processor, "upload_files", fake_upload_files)
+    monkeypatch.setattr(
+        processor,
+        "get_file_metadata",
+        lambda source: {"size": os.path.getsize(pdf_path)},
+    )
+    monkeypatch.setattr(processor, "get_range_reader", lambda source: read_range)
+    monkeypatch.setattr(processor, "get_document_index", lambda digest: None)
+    monkeypatch.setattr(processor, "get_checkpoint_store", lambda: None)
+    monkeypatch.setattr(processor, "get_status_reporter", lambda: status_reporter)
+    monkeypatch.setattr(app, "get_status_reporter", lambda: status_reporter)
+    monkeypatch.setattr(app.app.conf, "task_always_eager", True)
+    # page ranges are handed to assemble_pdf through storage
+    storage = LocalStorage(str(tmp_path / "storage"))
+    monkeypatch.setattr(clients, "get_storage", lambda: storage)
+    monkeypatch.setattr(
+        scheduling,
+        "get_dispatch_log",
+        lambda: scheduling.DispatchLog(redis_client, ttl_seconds=60),
+    )
+
+    return uploads, status_reporter
+
+
+def test_get_page_ranges(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / "doc.pdf")
+    doc = fitz.open()
+
+    for _ in range(7):
+        doc.new_page()
+
+    doc.save(pdf_path)
+
+    monkeypatch.setattr(config, "FANOUT_MIN_PAGES", 8)
+    assert processor.get_page_ranges(pdf_path) == [(0, 7)]
+
+    monkeypatch.setattr(config, "FANOUT_MIN_PAGES", 5)
+    monkeypatch.setattr(config, "FANOUT_PAGES_PER_TASK", 3)
+    assert processor.get_page_ranges(pdf_path) == [(0, 3), (3, 6), (6, 7)]
+
+
+def test_process_pdf_fans_out_large_documents(fake_worker, tmp_path, monkeypatch):
+    uploads, reporter = fake_worker
+    monkeypatch.setattr(config, "FANOUT_MIN_PAGES", 5)
+    monkeypatch.setattr(config, "FANOUT_PAGES_PER_TASK", 3)
+
+    result = app.process_pdf(
+        {"job_id": "a", "output_format": "md", "source_file": "uploads/a.pdf"}
+    )
+
+    assert result["result"] == "dispatched"
+    assert result["report"]["page_ranges"] == 3
+
+    # every page after the first was corrected against its neighbour, either
+    # inside its range or at a range boundary
+    pages = ["| row 0 |"] + [f"| corrected row {i} |" for i in range(1, 7)]
+    assert uploads["jobs/a/a.md"] == "\n".join(pages)
+    assert uploads["jobs/a/page_7.md"] == "| corrected row 6 |"
+    assert reporter.reports[-1] == (
+        "a",
+        "completed",
+        {"pages_done": 7, "pages_total": 7},
+    )
+    # the ranges' pages went through storage and are gone once assembled
+    assert os.listdir(tmp_path / "storage" / "jobs" / "jobs" / "a" / "ranges") == []
+
+
+def test_page_ranges_pass_references_to_the_assembler(fake_worker, monkeypatch):
+    monkeypatch.setattr(config, "FANOUT_MIN_PAGES", 5)
+    monkeypatch.setattr(config, "FANOUT_PAGES_PER_TASK", 3)
+    job = {"job_id": "a", "output_format": "md", "source_file": "uploads/a.pdf"}
+
+    result = app.process_pdf_page_range(job, 3, 6)
+
+    assert result["pages_path"] == "jobs/a/ranges/pages-3-6.mdpack"
+    assert "pages" not in result
+
+
+def test_redelivered_job_is_not_dispatched_twice(fake_worker, monkeypatch):
+    uploads, reporter = fake_worker
+    dispatched = []
+    monkeypatch.setattr(config, "FANOUT_MIN_PAGES", 5)
+    monkeypatch.setattr(config, "FANOUT_PAGES_PER_TASK", 3)
+    monkeypatch.setattr(
+        app,
+        "chord",
+        lambda tasks: lambda callback: dispatched.append(list(tasks)),
+    )
+    request = {"job_id": "a", "output_format": "md", "source_file": "uploads/a.pdf"}
+
+    assert app.convert_pdf(request)["result"] == "dispatched"
+    assert app.convert_pdf(request) == {"result": "dispatched", "error": None}
+    assert len(dispatched) == 1
+
+
+def test_process_pdf_keeps_small_documents_on_one_worker(fake_worker, monkeypatch):
+    uploads, reporter = fake_worker
+    monkeypatch.setattr(config, "FANOUT_MIN_PAGES", 100)
+
+    result = app.process_pdf(
+        {"job_id": "a", "output_format": "md", "source_file": "uploads/a.pdf"}
+    )
+
+    assert result["result"] == "success"
+    assert result["report"]["page_ranges"] == 1
+    assert len(uploads) == 8
+
+
+def test_failed_page_range_errors_the_job(fake_worker, monkeypatch):
+    uploads, reporter = fake_worker
+    monkeypatch.setattr(config, "FANOUT_MIN_PAGES", 5)
+    monkeypatch.setattr(config, "FANOUT_PAGES_PER_TASK", 3)
+
+    def fail_page_range(job, start, end):
+        raise RuntimeError(f"pages {start}-{end} failed")
+
+    monkeypatch.setattr(processor, "process_remote_page_range", fail_page_range)
+
+    app.process_pdf(
+        {"job_id": "a", "output_format": "md", "source_file": "uploads/a.pdf"}
+    )
+
+    assert uploads == {}
+    assert reporter.reports[-1] == ("a", "errored", {"error": "pages 0-3 failed"})
+
+
+def test_process_pdf_routes_jobs_by_page_count(fake_worker, monkeypatch):
+    uploads, reporter = fake_worker
+    monkeypatch.setattr(config, "JOB_ROUTING_ENABLED", True)
+    monkeypatch.setattr(config, "SMALL_JOB_MAX_PAGES", 10)
+    monkeypatch.setattr(scheduling, "record_queue_depths", lambda: None)
+    monkeypatch.setattr(scheduling, "get_tenant_limiter", lambda: None)
+
+    result = app.process_pdf(
+        {"job_id": "a", "output_format": "md", "source_file": "uploads/a.pdf"}
+    )
+
+    # eager tasks run right away, on a worker the job waits in pdf.small
+    assert result == {"result": "routed", "error": None, "queue": "pdf.small"}
+    assert len(uploads) == 8
+    assert reporter.reports[-1][1] == "completed"
+
+
+def test_routing_reads_page_count_without_downloading(tmp_path, monkeypatch):
+    from worker import clients
+
+    def fake_download_file(source, destination):
+        raise AssertionError("the router downloaded the document")
+
+    uploads_dir = tmp_path / config.SUPABASE_UPLOADS_BUCKET
+    uploads_dir.mkdir()
+    doc = fitz.open()
+
+    for i in range(150):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+
+    doc.save(str(uploads_dir / "report.pdf"))
+    doc.close()
+    (uploads_dir / "damaged.pdf").write_bytes(b"%PDF-1.7" + b"\0" * 2492)
+
+    monkeypatch.setattr(config, "STORAGE_BACKEND", "local")
+    monkeypatch.setattr(config, "LOCAL_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "ESTIMATED_PAGE_BYTES", 1000)
+    monkeypatch.setattr(processor, "download_file", fake_download_file)
+    clients.get_storage.cache_clear()
+
+    try:
+        # far fewer bytes than the estimate would allow for 150 pages
+        job = ParseJob(job_id="a", output_format="md", source_file="report.pdf")
+        assert processor.get_remote_page_count(job) == 150
+
+        # the file size is only a fallback
+        job = ParseJob(job_id="a", output_format="md", source_file="damaged.pdf")
+        assert processor.get_remote_page_count(job) == 3
+
+        job.page_count = 40
+        assert processor.get_remote_page_count(job) == 40
+    finally:
+        clients.get_storage.cache_clear()
+
+
+def test_convert_pdf_defers_tenants_over_their_limit(fake_worker, monkeypatch):
+    uploads, reporter = fake_worker
+    deferred = []
+    monkeypatch.setattr(config, "JOB_ROUTING_ENABLED", True)
+    monkeypatch.setattr(config, "SMALL_JOB_MAX_PAGES", 10)
+    monkeypatch.setattr(scheduling, "acquire_tenant_slot", lambda job: False)
+    monkeypatch.setattr(
+        app.convert_pdf,
+        "apply_async",
+        lambda args, kwargs, **options: deferred.append((args, kwargs, options)),
+    )
+
+    request = {
+        "job_id": "a",
+        "output_format": "md",
+        "source_file": "uploads/a.pdf",
+        "tenant_id": "bulk",
+        "page_count": 7,
+    }
+    result = app.convert_pdf(request, routed_at=1.0)
+
+    assert result["result"] == "deferred"
+    assert uploads == {}
+    assert deferred == [
+        (
+            (request,),
+            {"routed_at": 1.0},
+            {
+                "countdown": config.TENANT_DEFER_SECONDS,
+                "queue": "pdf.small",
+                "priority": 3,
+            },
+        )
+    ]
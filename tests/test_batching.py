@@ -0,0 +1,140 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from worker.batching import DynamicBatcher, RequestCoalescer
+
+
+def test_batches_concurrent_submissions():
+    batches = []
+
+    def process_batch(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = DynamicBatcher(process_batch, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(6)]
+
+    results = [future.result(timeout=5) for future in futures]
+
+    assert results == [i * 2 for i in range(6)]
+    assert batches == [[0, 1, 2, 3], [4, 5]]
+
+    batcher.close()
+
+
+def test_flushes_partial_batch_after_max_wait():
+    batcher = DynamicBatcher(lambda items: items, max_batch_size=8, max_wait_ms=20)
+
+    start = time.monotonic()
+    assert batcher.submit("page").result(timeout=5) == "page"
+    assert time.monotonic() - start < 1
+
+    batcher.close()
+
+
+def test_batch_errors_reach_every_caller():
+    def process_batch(items):
+        raise ValueError("out of memory")
+
+    batcher = DynamicBatcher(process_batch, max_batch_size=2, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(2)]
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+
+    batcher.close()
+
+
+def test_bad_item_only_fails_its_caller():
+    def process_batch(items):
+        if "bad" in items:
+            raise ValueError("bad input")
+        return [item.upper() for item in items]
+
+    batcher = DynamicBatcher(process_batch, max_batch_size=3, max_wait_ms=200)
+    futures = [batcher.submit(item) for item in ("a", "bad", "c")]
+
+    assert futures[0].result(timeout=5) == "A"
+    assert futures[2].result(timeout=5) == "C"
+
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+
+    batcher.close()
+
+
+def test_close_drains_pending_items():
+    release = threading.Event()
+
+    def process_batch(items):
+        release.wait(timeout=5)
+        return items
+
+    batcher = DynamicBatcher(process_batch, max_batch_size=1, max_wait_ms=0)
+    futures = [batcher.submit(i) for i in range(3)]
+    release.set()
+    batcher.close()
+
+    assert [future.result(timeout=0) for future in futures] == [0, 1, 2]
+
+    with pytest.raises(RuntimeError):
+        batcher.submit(3)
+
+
+def test_coalescer_shares_in_flight_and_recent_results():
+    shared = Future()
+    started = []
+    coalescer = RequestCoalescer(ttl_seconds=60)
+
+    def start():
+        started.append(1)
+        return shared
+
+    first, first_outcome = coalescer.submit("page", start)
+    second, second_outcome = coalescer.submit("page", start)
+    assert (first_outcome, second_outcome) == ("started", "coalesced")
+
+    # one caller giving up doesn't cancel the generation the other waits for
+    first.cancel()
+    shared.set_result("markdown")
+
+    assert second.result(timeout=1) == "markdown"
+    assert started == [1]
+
+    third, outcome = coalescer.submit("page", start)
+    assert (third.result(timeout=1), outcome) == ("markdown", "cached")
+
+
+def test_coalescer_does_not_keep_errors():
+    coalescer = RequestCoalescer(ttl_seconds=60)
+    failed = Future()
+    failed.set_exception(ValueError("out of memory"))
+
+    future, _ = coalescer.submit("page", lambda: failed)
+
+    with pytest.raises(ValueError):
+        future.result(timeout=1)
+
+    retried = Future()
+    future, outcome = coalescer.submit("page", lambda: retried)
+    retried.set_result("markdown")
+
+    assert (future.result(timeout=1), outcome) == ("markdown", "started")
+
+
+def test_coalescer_expires_results():
+    coalescer = RequestCoalescer(ttl_seconds=0.01, max_entries=1)
+
+    for key in ("a", "b"):
+        done = Future()
+        done.set_result(key)
+        coalescer.submit(key, lambda: done)
+
+    # "a" was evicted for "b", and "b" expires
+    assert coalescer.submit("a", Future)[1] == "started"
+    time.sleep(0.02)
+    assert coalescer.submit("b", Future)[1] == "started"
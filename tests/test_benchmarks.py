@@ -0,0 +1,38 @@
+from benchmarks.run import compare_to_baseline, percentile, run_benchmark
+
+
+def test_percentile():
+    assert percentile([], 50) == 0.0
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 99) == 99
+
+
+def test_run_benchmark_converts_against_stand_ins():
+    results = run_benchmark(pages=4, latency=0, documents=["mixed"])
+
+    mixed = results["mixed"]
+    # one page of each kind: text, tables, a scan and a large format scan
+    assert mixed["pages"] == 4
+    assert mixed["failed_pages"] == 0
+    assert mixed["image_pages"] == 2 and mixed["text_pages"] == 2
+    assert mixed["inference_requests"] >= 1
+    assert mixed["bytes_per_page"] > 0
+    assert mixed["peak_rss_mb"] > 0
+
+
+def test_compare_to_baseline_flags_regressions():
+    baseline = {"scans": {"pages_per_second": 10.0, "bytes_per_page": 1000}}
+    results = {
+        "scans": {
+            "pages_per_second": 7.0,
+            "latency_p50_ms": 1.0,
+            "latency_p99_ms": 1.0,
+            "peak_rss_mb": 1.0,
+            "bytes_per_page": 1100,
+        }
+    }
+
+    assert compare_to_baseline(results, baseline, tolerance=0.2) == [
+        "scans.pages_per_second: 7.0 vs baseline 10.0 (-30%)"
+    ]
+    assert compare_to_baseline(results, baseline, tolerance=0.5) == []
@@ -0,0 +1,128 @@
+import os
+import time
+
+from worker.cache import DiskLRUCache, RedisPageCache, page_cache_key
+from worker.rendering import PageImage
+
+
+def _image(data: bytes):
+    return PageImage(data=data, mime_type="image/png", width=28, height=28)
+
+
+def test_page_cache_key_covers_image_prompt_and_model():
+    key = page_cache_key(_image(b"page"), "prompt", "model")
+
+    assert key == page_cache_key(_image(b"page"), "prompt", "model")
+    assert key != page_cache_key(_image(b"other"), "prompt", "model")
+    assert key != page_cache_key(_image(b"page"), "prompt 2", "model")
+    assert key != page_cache_key(_image(b"page"), "prompt", "model 2")
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=10, ttl_seconds=0)
+
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+
+    cache.set("c", "cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+    assert cache.stats() == {"hits": 3, "misses": 1, "errors": 0}
+
+
+def test_disk_cache_expires_entries(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024, ttl_seconds=60)
+    cache.set("a", "page")
+
+    old = time.time() - 120
+    os.utime(tmp_path / "a", (old, old))
+
+    assert cache.get("a") is None
+    assert not (tmp_path / "a").exists()
+
+
+def test_disk_cache_reloads_existing_entries(tmp_path):
+    DiskLRUCache(str(tmp_path), max_bytes=1024, ttl_seconds=0).set("a", "page")
+
+    assert DiskLRUCache(str(tmp_path), max_bytes=1024, ttl_seconds=0).get("a") == (
+        "page"
+    )
+
+
+class BrokenRedis:
+    def get(self, key):
+        raise ConnectionError("redis is down")
+
+    def set(self, key, value, ex=None):
+        raise ConnectionError("redis is down")
+
+
+def test_redis_cache_round_trip(redis_client):
+    cache = RedisPageCache(redis_client, max_bytes=1024, ttl_seconds=60)
+
+    assert cache.get("a") is None
+    cache.set("a", "page")
+    assert cache.get("a") == "page"
+    assert cache.stats() == {"hits": 1, "misses": 1, "errors": 0}
+
+
+def test_redis_cache_evicts_least_recently_used(monkeypatch, redis_client):
+    clock = iter(range(100))
+    monkeypatch.setattr(time, "time", lambda: next(clock))
+    cache = RedisPageCache(redis_client, max_bytes=10, ttl_seconds=60)
+
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+
+    cache.set("c", "cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+    assert redis_client.values["page-cache:total-bytes"] == 8
+
+    # rewriting an entry counts its new size only
+    cache.set("c", "cc")
+    assert redis_client.values["page-cache:total-bytes"] == 6
+
+
+def test_disk_caches_sharing_a_directory_stay_under_max_bytes(tmp_path):
+    caches = [
+        DiskLRUCache(str(tmp_path), max_bytes=64, ttl_seconds=0) for _ in range(4)
+    ]
+
+    for i in range(40):
+        caches[i % len(caches)].set(f"page-{i}", "x" * 8)
+
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= 64
+
+
+def test_cache_errors_are_misses():
+    cache = RedisPageCache(BrokenRedis(), max_bytes=1024, ttl_seconds=60)
+
+    cache.set("a", "page")
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 0, "misses": 1, "errors": 2}
+
+
+def test_convert_page_to_markdown_skips_inference_on_hit(tmp_path, monkeypatch):
+    from worker import processor
+
+    calls = []
+
+    def fake_call_inference_api(request, blobs=None):
+        calls.append(request)
+        return {"outputs": ["```markdown\n# page\n```"]}
+
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024, ttl_seconds=0)
+    monkeypatch.setattr(processor, "get_page_cache", lambda: cache)
+    monkeypatch.setattr(processor, "call_inference_api", fake_call_inference_api)
+
+    assert processor.convert_page_to_markdown(_image(b"page")) == "# page"
+    assert processor.convert_page_to_markdown(_image(b"page")) == "# page"
+    assert len(calls) == 1
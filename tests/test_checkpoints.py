@@ -0,0 +1,159 @@
+import fitz
+
+from worker import processor
+from worker.checkpoints import CheckpointStore
+from worker.types import ConversionCheckpoint, ConversionReport, ParseJob
+
+
+def _write_pdf(path, page_count):
+    doc = fitz.open()
+
+    for i in range(page_count):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+
+    doc.save(path)
+    doc.close()
+
+
+def _fake_conversion(monkeypatch, converted):
+    def fake_convert_page_to_markdown(image):
+        converted.append(image)
+        return f"page {len(converted)}"
+
+    monkeypatch.setattr(
+        processor, "convert_page_to_markdown", fake_convert_page_to_markdown
+    )
+    monkeypatch.setattr(
+        processor, "correct_page_overlap", lambda last, current: (last, current)
+    )
+
+
+def test_checkpoint_store_round_trip(redis_client):
+    store = CheckpointStore(redis_client, ttl_seconds=60)
+
+    store.save_page("a", "page_2.md", "two")
+    store.save_page("a", "page_1.md", "one")
+    store.save_page("a", "page_3.md", "written before the state was saved")
+    store.save_state(
+        "a",
+        ConversionCheckpoint(
+            next_page_number=4,
+            page_counter=3,
+            last_page="three",
+            report=ConversionReport(total_pages=5, image_pages=3, blank_pages=1),
+            settings_digest="v1",
+        ),
+    )
+
+    checkpoint, pages = store.load("a", "v1")
+
+    assert checkpoint.next_page_number == 4
+    assert checkpoint.last_page == "three"
+    assert checkpoint.report.pages_done == 4
+    assert pages == [("page_1.md", "one"), ("page_2.md", "two")]
+
+
+def test_checkpoint_store_drops_checkpoints_from_other_settings(redis_client):
+    store = CheckpointStore(redis_client, ttl_seconds=60)
+    store.save_page("a", "page_1.md", "one")
+    store.save_state("a", ConversionCheckpoint(page_counter=2, settings_digest="v1"))
+
+    assert store.load("a", "v2") == (None, [])
+    assert store.load("a", "v1") == (None, [])
+
+
+def test_convert_document_resumes_from_checkpoint(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, 6)
+
+    converted = []
+    checkpoints = []
+    _fake_conversion(monkeypatch, converted)
+
+    pages = processor.convert_document(
+        pdf_path, max_in_flight_pages=1, on_checkpoint=checkpoints.append
+    )
+    first_pages = [next(pages), next(pages)]
+    pages.close()
+
+    # the worker died while the consumer was handling page_2.md
+    checkpoint = checkpoints[-1]
+    assert first_pages == [("page 1", "page_1.md"), ("page 2", "page_2.md")]
+    assert checkpoint.next_page_number == 2
+    assert checkpoint.page_counter == 2
+    assert checkpoint.last_page == "page 2"
+    assert len(converted) == 3
+
+    rest = list(
+        processor.convert_document(
+            pdf_path,
+            max_in_flight_pages=1,
+            report=checkpoint.report,
+            checkpoint=checkpoint,
+        )
+    )
+
+    # page_2.md is handed over again, then the pages that were never finished
+    assert rest == [
+        ("page 2", "page_2.md"),
+        ("page 4", "page_3.md"),
+        ("page 5", "page_4.md"),
+        ("page 6", "page_5.md"),
+        ("page 7", "page_6.md"),
+    ]
+    assert len(converted) == 7
+    assert checkpoint.report.image_pages == 6
+
+
+def test_process_remote_document_resumes_job(
+    tmp_path, monkeypatch, redis_client, status_reporter
+):
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, 3)
+
+    store = CheckpointStore(redis_client, ttl_seconds=60)
+    job = ParseJob(job_id="a", output_format="md", source_file="uploads/a.pdf")
+    settings_digest = processor.get_conversion_settings_digest(job)
+
+    store.save_page("a", "page_1.md", "first")
+    store.save_state(
+        "a",
+        ConversionCheckpoint(
+            next_page_number=2,
+            page_counter=2,
+            last_page="second",
+            report=ConversionReport(total_pages=3, image_pages=2),
+            settings_digest=settings_digest,
+        ),
+    )
+
+    uploads = {}
+
+    def fake_upload_files(files):
+        for source, destination in files:
+            with open(source) as fp:
+                uploads[destination] = fp.read()
+
+    converted = []
+    _fake_conversion(monkeypatch, converted)
+    monkeypatch.setattr(processor, "get_checkpoint_store", lambda: store)
+    monkeypatch.setattr(processor, "get_document_index", lambda digest: None)
+    monkeypatch.setattr(processor, "get_status_reporter", lambda: status_reporter)
+    monkeypatch.setattr(
+        processor,
+        "download_file",
+        lambda source, destination: fitz.open(pdf_path).save(destination),
+    )
+    monkeypatch.setattr(processor, "upload_files", fake_upload_files)
+
+    report = processor.process_remote_document(job)
+
+    assert len(converted) == 1
+    assert report.image_pages == 3
+    assert uploads == {
+        "jobs/a/page_1.md": "first",
+        "jobs/a/page_2.md": "second",
+        "jobs/a/page_3.md": "page 1",
+        "jobs/a/a.md": "first\nsecond\npage 1",
+    }
+    assert store.load("a", settings_digest) == (None, [])
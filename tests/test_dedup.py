@@ -0,0 +1,178 @@
+import fitz
+
+from worker import processor
+from worker.dedup import (
+    DocumentIndex,
+    IndexedOutput,
+    get_file_fingerprint,
+    get_storage_fingerprint,
+)
+from worker.types import ParseJob
+
+
+def _pdf_bytes():
+    doc = fitz.open()
+    doc.new_page()
+    return doc.tobytes()
+
+
+PDF_BYTES = _pdf_bytes()
+
+
+def test_storage_fingerprint_uses_etag_and_size():
+    assert get_storage_fingerprint({"eTag": '"abc"', "size": 10}) == "etag:abc:10"
+    assert get_storage_fingerprint({"size": 10}) is None
+    assert get_storage_fingerprint(None) is None
+
+
+def test_file_fingerprint_hashes_content(tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"%PDF-1.7 a")
+    (tmp_path / "b.pdf").write_bytes(b"%PDF-1.7 a")
+    (tmp_path / "c.pdf").write_bytes(b"%PDF-1.7 c")
+
+    a, b, c = (get_file_fingerprint(str(tmp_path / f"{name}.pdf")) for name in "abc")
+
+    assert a == b
+    assert a != c
+    assert a.startswith("sha256:")
+
+
+def test_document_index_is_scoped_by_settings(redis_client):
+    index = DocumentIndex(redis_client, settings_digest="v1", ttl_seconds=0)
+    other_index = DocumentIndex(redis_client, settings_digest="v2", ttl_seconds=0)
+
+    index.record(["etag:abc:10", None, "sha256:def"], "jobs/a/a.md", ["page_0.md"])
+
+    assert index.lookup("etag:abc:10") == IndexedOutput("jobs/a/a.md", ["page_0.md"])
+    assert index.lookup("sha256:def") == IndexedOutput("jobs/a/a.md", ["page_0.md"])
+    assert other_index.lookup("sha256:def") is None
+
+
+def _patch_storage(monkeypatch, index, metadata, status_reporter):
+    calls = {"download": 0, "copy": [], "upload": []}
+
+    def fake_download_file(source, destination):
+        calls["download"] += 1
+
+        with open(destination, "wb") as fp:
+            fp.write(PDF_BYTES)
+
+    monkeypatch.setattr(processor, "get_document_index", lambda digest: index)
+    monkeypatch.setattr(processor, "get_checkpoint_store", lambda: None)
+    monkeypatch.setattr(processor, "get_file_metadata", lambda source: metadata)
+    monkeypatch.setattr(processor, "download_file", fake_download_file)
+    monkeypatch.setattr(
+        processor, "copy_file", lambda *args: calls["copy"].append(args)
+    )
+    monkeypatch.setattr(
+        processor, "upload_file", lambda *args: calls["upload"].append(args)
+    )
+    monkeypatch.setattr(processor, "get_status_reporter", lambda: status_reporter)
+    monkeypatch.setattr(
+        processor,
+        "convert_document",
+        lambda path, **kwargs: iter([("# page", "page_1.md")]),
+    )
+
+    return calls
+
+
+def test_duplicate_document_is_copied_before_download(
+    monkeypatch, redis_client, status_reporter
+):
+    index = DocumentIndex(redis_client, settings_digest="v1", ttl_seconds=0)
+    calls = _patch_storage(
+        monkeypatch,
+        index,
+        {"eTag": '"abc"', "size": len(PDF_BYTES)},
+        status_reporter,
+    )
+
+    processor.process_remote_document(
+        ParseJob(job_id="first", output_format="md", source_file="uploads/a.pdf")
+    )
+    processor.process_remote_document(
+        ParseJob(job_id="second", output_format="md", source_file="uploads/b.pdf")
+    )
+
+    assert calls["download"] == 1
+    assert [upload[1] for upload in calls["upload"]] == [
+        "jobs/first/page_1.md",
+        "jobs/first/first.md",
+    ]
+    assert calls["copy"] == [
+        ("jobs/first/page_1.md", "jobs/second/page_1.md"),
+        ("jobs/first/first.md", "jobs/second/second.md"),
+    ]
+
+
+def test_duplicate_document_without_metadata_is_copied_after_download(
+    monkeypatch, redis_client, status_reporter
+):
+    index = DocumentIndex(redis_client, settings_digest="v1", ttl_seconds=0)
+    calls = _patch_storage(monkeypatch, index, None, status_reporter)
+
+    processor.process_remote_document(
+        ParseJob(job_id="first", output_format="md", source_file="uploads/a.pdf")
+    )
+    processor.process_remote_document(
+        ParseJob(job_id="second", output_format="md", source_file="uploads/b.pdf")
+    )
+
+    assert calls["download"] == 2
+    assert len(calls["upload"]) == 2
+    assert calls["copy"] == [
+        ("jobs/first/page_1.md", "jobs/second/page_1.md"),
+        ("jobs/first/first.md", "jobs/second/second.md"),
+    ]
+
+
+def test_entry_without_page_files_is_converted_again(
+    monkeypatch, redis_client, status_reporter
+):
+    index = DocumentIndex(redis_client, settings_digest="v1", ttl_seconds=0)
+    calls = _patch_storage(
+        monkeypatch,
+        index,
+        {"eTag": '"abc"', "size": len(PDF_BYTES)},
+        status_reporter,
+    )
+
+    # recorded before page files were listed
+    redis_client.set(index._key(f"etag:abc:{len(PDF_BYTES)}"), b"jobs/first/first.md")
+    processor.process_remote_document(
+        ParseJob(job_id="second", output_format="md", source_file="uploads/b.pdf")
+    )
+
+    assert calls["copy"] == []
+    assert calls["download"] == 1
+
+
+def test_output_with_failed_pages_is_not_reused(
+    monkeypatch, redis_client, status_reporter
+):
+    index = DocumentIndex(redis_client, settings_digest="v1", ttl_seconds=0)
+    calls = _patch_storage(
+        monkeypatch,
+        index,
+        {"eTag": '"abc"', "size": len(PDF_BYTES)},
+        status_reporter,
+    )
+
+    def convert_with_a_failed_page(path, report, **kwargs):
+        report.failed_pages += 1
+        yield ("", "page_1.md")
+
+    monkeypatch.setattr(processor, "convert_document", convert_with_a_failed_page)
+    processor.process_remote_document(
+        ParseJob(job_id="first", output_format="md", source_file="uploads/a.pdf")
+    )
+
+    assert redis_client.values == {}
+
+    processor.process_remote_document(
+        ParseJob(job_id="second", output_format="md", source_file="uploads/b.pdf")
+    )
+
+    assert calls["copy"] == []
+    assert calls["download"] == 2
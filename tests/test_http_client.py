@@ -0,0 +1,288 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from worker.http_client import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    HttpClient,
+)
+
+
+class StandInServer:
+    """Local stand-in for the inference endpoint with scripted responses."""
+
+    def __init__(self):
+        self.statuses = []
+        self.requests = []
+        self.connections = set()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                server.requests.append(body)
+                server.connections.add(self.client_address)
+
+                status = server.statuses.pop(0) if server.statuses else 200
+                payload = json.dumps({"outputs": ["ok"]}).encode("utf-8")
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    yield server
+    server.close()
+
+
+def _client(url, **kwargs):
+    kwargs.setdefault("max_retries", 3)
+    kwargs.setdefault("backoff_factor", 0)
+    kwargs.setdefault("backoff_jitter", 0)
+    return HttpClient(url, connect_timeout=1, read_timeout=1, **kwargs)
+
+
+def test_reuses_connections(server):
+    client = _client(server.url)
+
+    for i in range(5):
+        assert client.post(data=f"{i}").json() == {"outputs": ["ok"]}
+
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
+
+
+def test_retries_retryable_statuses(server):
+    server.statuses = [503, 502]
+    client = _client(server.url)
+
+    response = client.post(data="page")
+
+    assert response.status_code == 200
+    assert server.requests == [b"page", b"page", b"page"]
+
+
+def test_counts_retries(server, monkeypatch):
+    from worker import http_client
+    from worker.telemetry import Telemetry
+
+    telemetry = Telemetry()
+    monkeypatch.setattr(http_client, "get_telemetry", lambda: telemetry)
+    server.statuses = [503, 502]
+
+    _client(server.url, name="inference").post(data="page")
+
+    assert telemetry.get_counter("http_retries_total", client="inference") == 2
+    assert (
+        telemetry.get_counter("http_requests_total", client="inference", status=200)
+        == 1
+    )
+
+
+def test_returns_last_response_when_retries_run_out(server):
+    server.statuses = [500, 500, 500]
+    client = _client(server.url, max_retries=2)
+
+    response = client.post(data="page")
+
+    assert response.status_code == 500
+    with pytest.raises(requests.exceptions.HTTPError):
+        response.raise_for_status()
+
+
+def test_circuit_breaker_fails_fast_when_endpoint_is_down():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    # nothing listens on port 9 locally, every request is a connection error
+    client = _client("http://127.0.0.1:9", max_retries=0, circuit_breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.post(data="page")
+
+    with pytest.raises(CircuitOpenError):
+        client.post(data="page")
+
+
+def test_circuit_breaker_recovers_after_trial_request(server):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    server.statuses = [500]
+    client = _client(server.url, max_retries=0, circuit_breaker=breaker)
+
+    assert client.post(data="page").status_code == 500
+    assert breaker.is_open
+
+    assert client.post(data="page").status_code == 200
+    assert not breaker.is_open
+
+
+def test_circuit_breaker_releases_trial_that_raises(server, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    client = _client(server.url, max_retries=0, circuit_breaker=breaker)
+
+    def raise_error(*args, **kwargs):
+        raise ValueError("bad request body")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(client.session, "request", raise_error)
+
+        with pytest.raises(ValueError):
+            client.post(data="page")
+
+    assert client.post(data="page").status_code == 200
+    assert not breaker.is_open
+
+
+def test_call_inference_api_uses_stand_in(server, monkeypatch):
+    from worker import http_client, processor
+    from worker.types import InferenceRequest
+
+    monkeypatch.setattr(
+        http_client, "get_inference_client", lambda: _client(server.url)
+    )
+
+    assert processor.call_inference_api(InferenceRequest(messages=[])) == {
+        "outputs": ["ok"]
+    }
+
+
+def test_limiter_sees_overload_the_client_would_have_retried(server, monkeypatch):
+    from worker import http_client, processor
+    from worker.types import InferenceRequest
+
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, backoff_ratio=0.5)
+    monkeypatch.setattr(http_client, "get_inference_limiter", lambda: limiter)
+    monkeypatch.setattr(http_client, "get_backoff_seconds", lambda attempt: 0)
+    monkeypatch.setattr(
+        http_client, "get_inference_client", lambda: _client(server.url, max_retries=0)
+    )
+    server.statuses = [503]
+
+    assert processor.call_inference_api(InferenceRequest(messages=[])) == {
+        "outputs": ["ok"]
+    }
+    assert len(server.requests) == 2
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+
+
+def test_inference_clients_leave_retries_to_the_limiter(monkeypatch):
+    from worker import config, http_client
+
+    monkeypatch.setattr(config, "INFERENCE_ADAPTIVE_CONCURRENCY", True)
+    assert http_client.get_inference_max_retries() == 0
+
+    monkeypatch.setattr(config, "INFERENCE_ADAPTIVE_CONCURRENCY", False)
+    assert http_client.get_inference_max_retries() == config.HTTP_MAX_RETRIES
+
+
+def _overload_error(status=503):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _fail(limiter, error):
+    with pytest.raises(type(error)):
+        with limiter.acquire():
+            raise error
+
+
+def test_limiter_grows_while_saturated_and_backs_off_on_overload():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=3)
+
+    for _ in range(10):
+        with limiter.acquire():
+            pass
+
+    # only a request that fills the limit shows more would help, with one
+    # at a time the limit stops at 2
+    assert limiter.limit == 2
+
+    _fail(limiter, _overload_error(429))
+    assert limiter.limit == pytest.approx(1.4)
+
+    # errors that aren't about load leave the limit alone
+    _fail(limiter, _overload_error(400))
+    _fail(limiter, ValueError("bad output"))
+    assert limiter.limit == pytest.approx(1.4)
+
+
+def test_limiter_cuts_once_per_overload(monkeypatch):
+    from worker import http_client
+
+    now = [0.0]
+    monkeypatch.setattr(http_client.time, "monotonic", lambda: now[0])
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8, backoff_ratio=0.5)
+
+    with limiter.acquire():
+        now[0] += 1
+
+    _fail(limiter, _overload_error())
+    _fail(limiter, requests.exceptions.ReadTimeout())
+    assert limiter.limit == 4
+
+    # a response far slower than the average is overload too
+    now[0] += 1
+
+    with limiter.acquire():
+        now[0] += 5
+
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+
+
+def test_limiter_blocks_requests_over_the_limit():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    release = threading.Event()
+    entered = []
+
+    def hold():
+        with limiter.acquire():
+            entered.append("first")
+            release.wait(5)
+
+    def wait():
+        with limiter.acquire():
+            entered.append("second")
+
+    first = threading.Thread(target=hold)
+    first.start()
+
+    while not entered:
+        pass
+
+    second = threading.Thread(target=wait)
+    second.start()
+    second.join(0.1)
+    assert entered == ["first"]
+
+    release.set()
+    first.join()
+    second.join()
+    assert entered == ["first", "second"]
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+from worker import clients, config, http_client, lifecycle, notifications
+from worker.telemetry import Telemetry
+
+
+def test_app_import_skips_heavy_libraries():
+    # a fresh interpreter, the test session has imported everything already
+    code = (
+        "import sys, worker.app; "
+        "print(','.join(m for m in ('fitz', 'PIL', 'supabase', 'worker.processor')"
+        " if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == ""
+
+
+def test_init_process_replaces_inherited_clients(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "STORAGE_BACKEND", "local")
+    monkeypatch.setattr(config, "LOCAL_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "PAGE_CACHE_BACKEND", "none")
+    monkeypatch.setattr(config, "CHECKPOINTS_ENABLED", False)
+    monkeypatch.setattr(config, "DOCUMENT_DEDUP_ENABLED", False)
+    metrics_dir = tmp_path / "metrics"
+    metrics_dir.mkdir()
+    monkeypatch.setattr(config, "TELEMETRY_TEXTFILE_DIR", str(metrics_dir))
+
+    inherited_client = http_client.get_inference_client()
+    inherited_reporter = notifications.get_status_reporter()
+
+    try:
+        lifecycle.init_process()
+        Telemetry().write_textfile(str(metrics_dir))
+
+        assert http_client.get_inference_client() is not inherited_client
+        assert notifications.get_status_reporter() is not inherited_reporter
+        assert clients.get_storage.cache_info().currsize == 1
+        assert clients.get_redis_client.cache_info().currsize == 0
+    finally:
+        reporter = notifications.get_status_reporter()
+        lifecycle.shutdown_process()
+
+    assert not reporter._thread.is_alive()
+    assert http_client.get_inference_client.cache_info().currsize == 0
+    assert notifications.get_status_reporter.cache_info().currsize == 0
+    assert list(metrics_dir.iterdir()) == []
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from worker.notifications import StatusReporter
+
+
+class RecordingSender:
+    def __init__(self, failures=0):
+        self.sent = []
+        self.failures = failures
+        self.sent_event = threading.Event()
+
+    def __call__(self, job_id, payload):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("api is down")
+
+        self.sent.append((job_id, payload))
+        self.sent_event.set()
+
+
+def test_coalesces_rapid_updates_per_job():
+    sender = RecordingSender()
+    reporter = StatusReporter(sender, min_interval=60, max_attempts=1)
+
+    reporter.report("a", "processing", pages_done=0, pages_total=3)
+    assert sender.sent_event.wait(timeout=5)
+
+    for pages_done in range(1, 4):
+        reporter.report("a", "processing", pages_done=pages_done, pages_total=3)
+
+    time.sleep(0.05)
+    assert len(sender.sent) == 1
+
+    assert reporter.flush(timeout=5)
+    assert sender.sent == [
+        (
+            "a",
+            {"status": "processing", "progress": {"pages_done": 0, "pages_total": 3}},
+        ),
+        (
+            "a",
+            {"status": "processing", "progress": {"pages_done": 3, "pages_total": 3}},
+        ),
+    ]
+
+    reporter.close(timeout=5)
+
+
+def test_terminal_status_skips_rate_limit_and_replaces_progress():
+    sender = RecordingSender()
+    reporter = StatusReporter(sender, min_interval=60, max_attempts=1)
+
+    reporter.report("a", "processing", pages_done=0, pages_total=3)
+    assert sender.sent_event.wait(timeout=5)
+
+    reporter.report("a", "processing", pages_done=2, pages_total=3)
+    reporter.report("a", "errored", error="boom")
+    reporter.report("b", "processing", pages_done=1, pages_total=1)
+
+    deadline = time.monotonic() + 5
+    while len(sender.sent) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert ("a", {"status": "errored", "error": "boom"}) in sender.sent
+    assert (
+        "b",
+        {"status": "processing", "progress": {"pages_done": 1, "pages_total": 1}},
+    ) in sender.sent
+    assert len(sender.sent) == 3
+
+    reporter.close(timeout=5)
+
+
+def test_terminal_status_is_retried():
+    sender = RecordingSender(failures=2)
+    reporter = StatusReporter(sender, min_interval=0, max_attempts=3, retry_delay=0)
+
+    reporter.report("a", "completed", pages_done=1, pages_total=1)
+
+    assert reporter.flush(timeout=5)
+    assert sender.sent == [
+        ("a", {"status": "completed", "progress": {"pages_done": 1, "pages_total": 1}})
+    ]
+
+    reporter.close(timeout=5)
+
+
+def test_progress_failures_are_not_retried():
+    sender = RecordingSender(failures=1)
+    reporter = StatusReporter(sender, min_interval=0, max_attempts=3, retry_delay=0)
+
+    reporter.report("a", "processing", pages_done=1, pages_total=2)
+
+    assert reporter.flush(timeout=5)
+    assert sender.sent == []
+
+    reporter.close(timeout=5)
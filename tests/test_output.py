@@ -0,0 +1,77 @@
+import io
+
+import pytest
+
+from worker import output
+from worker.output import PagePackReader, get_output_writer
+from worker.types import ParseJob
+
+
+def _write(output_format, pages):
+    buffer = io.BytesIO()
+    writer = get_output_writer(buffer, output_format)
+
+    for index, page in enumerate(pages):
+        writer.write_page(page, f"page_{index + 1}.md")
+
+    writer.finish()
+    return buffer.getvalue()
+
+
+def test_markdown_joins_pages_with_newlines():
+    assert _write("md", ["one", "twö"]) == "one\ntwö".encode("utf-8")
+
+
+def test_page_pack_reads_single_pages_with_ranged_reads():
+    pages = [f"# Page {i}\n\n" + "| a | b |\n" * 200 for i in range(50)]
+    data = _write("mdpack", pages)
+    reads = []
+
+    def read_range(offset, length):
+        reads.append(length)
+        return data[offset : offset + length]
+
+    reader = PagePackReader(read_range, len(data))
+
+    assert len(reader) == 50
+    assert reader.codec == "gzip"
+    assert reader.pages[36]["title"] == "page_37.md"
+
+    reads.clear()
+    assert reader.read_page(36) == pages[36]
+    assert sum(reads) < len(data) / 20
+
+    assert len(data) < len("\n".join(pages)) / 4
+
+
+def test_page_pack_rejects_other_files():
+    with pytest.raises(ValueError, match="Not a page pack"):
+        PagePackReader.from_file(io.BytesIO(_write("md", ["one", "two"] * 20)))
+
+
+def test_zstd_page_pack():
+    pytest.importorskip("zstandard")
+    pages = ["one", "two"]
+
+    reader = PagePackReader.from_file(io.BytesIO(_write("mdpack+zstd", pages)))
+
+    assert [reader.read_page(i) for i in range(len(reader))] == pages
+
+
+def test_unknown_output_formats_fall_back_to_markdown():
+    assert output.get_output_format("docx") == (".md", None)
+    assert output.get_output_format(None) == (".md", None)
+
+    with pytest.raises(ValueError, match="Unsupported output format: mdpack\\+lz4"):
+        output.get_output_format("mdpack+lz4")
+
+
+def test_unknown_output_format_is_reported_once_when_the_job_is_validated(capsys):
+    job = ParseJob(job_id="a", output_format="docx", source_file="a.pdf")
+
+    assert job.output_format == "md"
+    assert output.get_output_format(job.output_format) == (".md", None)
+    assert capsys.readouterr().out.count("Unknown output format 'docx'") == 1
+
+    job = ParseJob(job_id="a", output_format="mdpack+zstd", source_file="a.pdf")
+    assert job.output_format == "mdpack+zstd"
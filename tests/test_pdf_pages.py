@@ -0,0 +1,67 @@
+import fitz
+import pytest
+
+from worker.pdf_pages import PdfPageCountError, read_page_count
+
+
+def _pdf_bytes(page_count, **save_options):
+    doc = fitz.open()
+
+    for i in range(page_count):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+
+    data = doc.tobytes(**save_options)
+    doc.close()
+    return data
+
+
+def _reader(data, reads):
+    def read_range(offset, length):
+        reads.append(length)
+        return data[offset : offset + length]
+
+    return read_range
+
+
+@pytest.mark.parametrize(
+    "save_options",
+    [
+        {},
+        {"garbage": 4, "deflate": True},
+        # cross reference streams, the page tree inside an object stream
+        {"use_objstms": 1},
+        {"encryption": fitz.PDF_ENCRYPT_AES_256, "owner_pw": "o", "user_pw": "u"},
+    ],
+)
+def test_reads_page_count_with_a_few_small_reads(save_options):
+    data = _pdf_bytes(300, **save_options)
+    reads = []
+
+    assert read_page_count(_reader(data, reads), len(data)) == 300
+    assert len(reads) < 10
+    assert sum(reads) < len(data) // 2
+
+
+def test_follows_incremental_updates(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+
+    with open(path, "wb") as fp:
+        fp.write(_pdf_bytes(1, use_objstms=1))
+
+    doc = fitz.open(path)
+    doc.new_page()
+    doc.new_page()
+    doc.saveIncr()
+    doc.close()
+
+    with open(path, "rb") as fp:
+        data = fp.read()
+
+    assert read_page_count(_reader(data, []), len(data)) == 3
+
+
+def test_rejects_files_that_are_not_pdfs():
+    data = b"not a pdf" * 100
+
+    with pytest.raises(PdfPageCountError):
+        read_page_count(_reader(data, []), len(data))
@@ -1,16 +1,46 @@
+import os
+
+import pytest
+
 from worker.types import ParseJob
 from worker.processor import process_remote_document, parse_markdown_page
 
 
-def test_process_remote_document():
+def test_process_remote_document(tmp_path):
+    from benchmarks.run import local_worker
+    from benchmarks.stand_ins import FakeInferenceServer
+
+    storage_dir = tmp_path / "storage"
+    (storage_dir / "uploads").mkdir(parents=True)
+    _write_pdf(str(storage_dir / "uploads" / "doc.pdf"), ["one", "two", "three"])
+
     request = ParseJob(
         job_id="test",
         output_format="md",
-        source_file="uploads/28337a5b-c423-42fd-9b93-4d5f4fa81dd3.pdf",
+        source_file="doc.pdf",
+        text_layer_mode="off",
     )
+    server = FakeInferenceServer()
 
-    process_remote_document(request)
-    assert False
+    try:
+        with local_worker(str(storage_dir), server.url):
+            report = process_remote_document(request)
+    finally:
+        server.close()
+
+    job_dir = storage_dir / "jobs" / "jobs" / "test"
+
+    assert report.image_pages == 3 and report.failed_pages == 0
+    assert sorted(os.listdir(job_dir)) == [
+        "page_1.md",
+        "page_2.md",
+        "page_3.md",
+        "test.md",
+    ]
+    assert (job_dir / "page_1.md").read_text().startswith("# Page")
+    assert (job_dir / "test.md").read_text().count("# Page") == 3
+    assert server.inference_requests >= 3
+    assert server.status_updates > 0
 
 
 def test_parse_markdown_page():
@@ -37,3 +67,426 @@ def test_parse_markdown_page_no_markdown():
         """# hello
 ## world"""
     ]
+
+
+def _write_pdf(path, page_texts):
+    import fitz
+
+    doc = fitz.open()
+
+    for text in page_texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+
+    doc.save(path)
+    doc.close()
+
+
+def test_convert_document_keeps_page_order(tmp_path, monkeypatch):
+    import random
+    import threading
+    import time
+
+    from worker import processor
+
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, [f"page {i}" for i in range(12)])
+
+    lock = threading.Lock()
+    calls = {"count": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def fake_convert_page_to_markdown(image):
+        with lock:
+            index = calls["count"]
+            calls["count"] += 1
+            calls["in_flight"] += 1
+            calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+
+        time.sleep(random.uniform(0.02, 0.04))
+
+        with lock:
+            calls["in_flight"] -= 1
+
+        return image
+
+    corrected_pairs = []
+
+    def fake_correct_page_overlap(last_page, current_page):
+        corrected_pairs.append((last_page, current_page))
+        return last_page, current_page
+
+    monkeypatch.setattr(
+        processor, "convert_page_to_markdown", fake_convert_page_to_markdown
+    )
+    monkeypatch.setattr(processor, "correct_page_overlap", fake_correct_page_overlap)
+
+    # without the adaptive limiter a fixed number of pages convert at once
+    monkeypatch.setattr(processor.http_client, "get_inference_limiter", lambda: None)
+
+    with processor.fitz.open(pdf_path) as doc:
+        expected = [processor.encode_page(doc, i) for i in range(doc.page_count)]
+
+    pages = list(
+        processor.convert_document(
+            pdf_path,
+            max_in_flight_pages=4,
+            render_concurrency=2,
+            conversion_concurrency=3,
+        )
+    )
+
+    assert [page for page, _ in pages] == expected
+    assert [title for _, title in pages] == [f"page_{i}.md" for i in range(1, 13)]
+    assert len(corrected_pairs) == 11
+    assert 1 < calls["max_in_flight"] <= 3
+
+
+def test_inference_limit_grows_with_a_healthy_endpoint(tmp_path, monkeypatch):
+    import time
+
+    from worker import processor
+    from worker.http_client import AdaptiveConcurrencyLimiter
+
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, [f"page {i}" for i in range(60)])
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=32)
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"outputs": ["```markdown\npage\n```"]}
+
+    def fake_post_inference_request(client, request, blobs=None, **kwargs):
+        time.sleep(0.2)
+        return FakeResponse()
+
+    monkeypatch.setattr(processor.http_client, "get_inference_limiter", lambda: limiter)
+    monkeypatch.setattr(
+        processor, "post_inference_request", fake_post_inference_request
+    )
+    monkeypatch.setattr(processor, "get_page_cache", lambda: None)
+    monkeypatch.setattr(
+        processor, "correct_page_overlap", lambda last, current: (last, current)
+    )
+
+    pages = list(processor.convert_document(pdf_path, text_layer_mode="off"))
+
+    assert len(pages) == 60
+    # well past the fixed cap of 4 conversions the pipeline used to have
+    assert limiter.limit > 8
+
+
+def test_convert_document_skips_failed_pages(tmp_path, monkeypatch):
+    from worker import processor
+
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, [f"page {i}" for i in range(4)])
+
+    with processor.fitz.open(pdf_path) as doc:
+        images = [processor.encode_page(doc, i) for i in range(doc.page_count)]
+
+    def fake_convert_page_to_markdown(image):
+        if image == images[1]:
+            raise ValueError("inference failed")
+
+        return f"page {images.index(image)}"
+
+    monkeypatch.setattr(
+        processor, "convert_page_to_markdown", fake_convert_page_to_markdown
+    )
+    monkeypatch.setattr(
+        processor, "correct_page_overlap", lambda last, current: (last, current)
+    )
+
+    pages = list(processor.convert_document(pdf_path))
+
+    assert pages == [
+        ("page 0", "page_1.md"),
+        ("page 2", "page_2.md"),
+        ("page 3", "page_3.md"),
+    ]
+
+
+def test_convert_document_stops_when_the_consumer_does(tmp_path, monkeypatch):
+    from worker import processor
+
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, [f"page {i}" for i in range(20)])
+
+    opened = []
+    fitz_open = processor.fitz.open
+    calls = []
+
+    def fake_open(*args):
+        opened.append(fitz_open(*args))
+        return opened[-1]
+
+    def fake_convert_page_to_markdown(image, complete_only=False):
+        calls.append(image)
+        return "# converted"
+
+    monkeypatch.setattr(processor.fitz, "open", fake_open)
+    monkeypatch.setattr(
+        processor, "convert_page_to_markdown", fake_convert_page_to_markdown
+    )
+    monkeypatch.setattr(
+        processor, "correct_page_overlap", lambda last, current: (last, current)
+    )
+    monkeypatch.setattr(processor.http_client, "get_inference_limiter", lambda: None)
+
+    pages = processor.convert_document(
+        pdf_path, max_in_flight_pages=2, text_layer_mode="off"
+    )
+    next(pages)
+    pages.close()
+
+    assert len(calls) < 20
+    assert opened[0].is_closed
+
+
+def test_convert_document_routes_pages(tmp_path, monkeypatch):
+    from worker import processor
+    from worker.types import ConversionReport
+
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(
+        pdf_path,
+        [
+            "\n".join(f"Born digital line {i} with plenty of text." for i in range(8)),
+            "",
+            "short scan",
+        ],
+    )
+
+    calls = []
+
+    def fake_convert_page_to_markdown(image):
+        calls.append(image)
+        return "# converted"
+
+    monkeypatch.setattr(
+        processor, "convert_page_to_markdown", fake_convert_page_to_markdown
+    )
+    monkeypatch.setattr(
+        processor, "correct_page_overlap", lambda last, current: (last, current)
+    )
+
+    report = ConversionReport()
+    pages = list(
+        processor.convert_document(pdf_path, text_layer_mode="strict", report=report)
+    )
+
+    assert [title for _, title in pages] == ["page_1.md", "page_2.md"]
+    assert pages[0][0].startswith("Born digital line 0")
+    assert pages[1][0] == "# converted"
+    assert len(calls) == 1
+    assert report == ConversionReport(
+        total_pages=3, text_pages=1, image_pages=1, blank_pages=1
+    )
+
+
+def test_split_table_fragments():
+    from worker.processor import split_leading_table, split_trailing_table
+
+    assert split_trailing_table("intro\n\n| a | b |\n|---|---|\n| 1 | 2 |\n") == (
+        "intro\n",
+        "| a | b |\n|---|---|\n| 1 | 2 |",
+    )
+    assert split_trailing_table("| a |\n\nclosing") == ("| a |\n\nclosing", "")
+    assert split_leading_table("\n| 3 | 4 |\n\nrest") == ("| 3 | 4 |", "\nrest")
+    assert split_leading_table("# heading\n| 3 | 4 |") == ("", "# heading\n| 3 | 4 |")
+
+
+def test_correct_page_overlap_skips_pages_without_split_tables(monkeypatch):
+    from worker import processor
+
+    def fail_call_inference_api(request):
+        raise AssertionError("overlap correction should not call inference")
+
+    monkeypatch.setattr(processor, "call_inference_api", fail_call_inference_api)
+
+    assert processor.correct_page_overlap("| a |\n\ntext", "| b |") == (
+        "| a |\n\ntext",
+        "| b |",
+    )
+    assert processor.correct_page_overlap("| a |", "# heading\n| b |") == (
+        "| a |",
+        "# heading\n| b |",
+    )
+
+
+def test_correct_page_overlap_sends_only_table_fragments(monkeypatch):
+    from worker import processor
+
+    requests = []
+
+    def fake_call_inference_api(request):
+        requests.append(request)
+        return {
+            "outputs": [
+                "```markdown\n| a | b |\n|---|---|\n| 1 | 2 |\n| 3 | 4 |\n```\n"
+                "```markdown\n\n```"
+            ]
+        }
+
+    monkeypatch.setattr(processor, "call_inference_api", fake_call_inference_api)
+
+    last_page, current_page = processor.correct_page_overlap(
+        "# intro\n\n| a | b |\n|---|---|\n| 1 | 2 |",
+        "| a | b |\n|---|---|\n| 3 | 4 |\n\nafter the table",
+    )
+
+    assert last_page == "# intro\n\n| a | b |\n|---|---|\n| 1 | 2 |\n| 3 | 4 |"
+    assert current_page == "\nafter the table"
+
+    sent = [content.text for content in requests[0].messages[0].content]
+    assert sent[1] == "Last page: | a | b |\n|---|---|\n| 1 | 2 |"
+    assert sent[2] == "Current page: | a | b |\n|---|---|\n| 3 | 4 |"
+
+
+def test_upload_files_runs_uploads_concurrently(monkeypatch):
+    import threading
+
+    from worker import processor
+
+    barrier = threading.Barrier(3, timeout=5)
+    uploaded = []
+
+    def fake_upload_file(source, destination):
+        barrier.wait()
+        uploaded.append(destination)
+
+        if destination == "jobs/a/page_2.md":
+            raise ConnectionError("upload failed")
+
+    monkeypatch.setattr(processor, "upload_file", fake_upload_file)
+
+    with pytest.raises(ConnectionError):
+        processor.upload_files(
+            [
+                ("page_1.md", "jobs/a/page_1.md"),
+                ("page_2.md", "jobs/a/page_2.md"),
+                ("a.md", "jobs/a/a.md"),
+            ],
+            max_workers=3,
+        )
+
+    assert sorted(uploaded) == ["jobs/a/a.md", "jobs/a/page_1.md", "jobs/a/page_2.md"]
+
+
+def test_upload_document_writes_pages_as_they_arrive(
+    tmp_path, monkeypatch, status_reporter
+):
+    from worker import processor
+    from worker.types import ConversionReport
+
+    document_path = tmp_path / "a.md"
+    uploaded = []
+
+    def pages():
+        for i in range(3):
+            # earlier pages are already on disk before the next one exists
+            if i > 0:
+                assert (tmp_path / f"page_{i - 1}.md").read_text() == f"page {i - 1}"
+
+            yield (f"page {i}", f"page_{i}.md")
+
+    monkeypatch.setattr(processor, "get_status_reporter", lambda: status_reporter)
+    monkeypatch.setattr(processor, "upload_files", uploaded.extend)
+
+    processor.upload_document(
+        ParseJob(job_id="a", output_format="md", source_file="a.pdf"),
+        pages(),
+        str(tmp_path),
+        "jobs/a/a.md",
+        ConversionReport(),
+    )
+
+    assert document_path.read_text() == "page 0\npage 1\npage 2"
+    assert uploaded[-1] == (str(document_path), "jobs/a/a.md")
+    assert [destination for _, destination in uploaded[:-1]] == [
+        "jobs/a/page_0.md",
+        "jobs/a/page_1.md",
+        "jobs/a/page_2.md",
+    ]
+
+
+def test_upload_document_writes_a_page_pack(tmp_path, monkeypatch, status_reporter):
+    from worker import processor
+    from worker.output import PagePackReader
+    from worker.types import ConversionReport
+
+    uploaded = []
+    job = ParseJob(job_id="a", output_format="mdpack", source_file="a.pdf")
+    monkeypatch.setattr(processor, "get_status_reporter", lambda: status_reporter)
+    monkeypatch.setattr(processor, "upload_files", uploaded.extend)
+
+    processor.upload_document(
+        job,
+        ((f"page {i}", f"page_{i}.md") for i in range(3)),
+        str(tmp_path),
+        processor.get_output_path(job),
+        ConversionReport(),
+    )
+
+    # the pack is the only upload, its index replaces the page files
+    assert uploaded == [(str(tmp_path / "a.mdpack"), "jobs/a/a.mdpack")]
+
+    with open(tmp_path / "a.mdpack", "rb") as fp:
+        assert PagePackReader.from_file(fp).read_page(2) == "page 2"
+
+    # a markdown conversion of the same document can't be reused for a pack
+    md_job = ParseJob(job_id="a", output_format="md", source_file="a.pdf")
+    digest = processor.get_conversion_settings_digest(job)
+    assert digest != processor.get_conversion_settings_digest(md_job)
+
+
+def test_upload_document_resumes_after_a_partial_upload(
+    tmp_path, monkeypatch, status_reporter
+):
+    from worker import clients, processor
+    from worker.storage import LocalStorage
+    from worker.types import ConversionReport
+
+    storage = LocalStorage(str(tmp_path / "storage"))
+    upload_file = processor.upload_file
+    job = ParseJob(job_id="a", output_format="md", source_file="a.pdf")
+
+    def failing_upload_file(source, destination):
+        if destination == "jobs/a/a.md":
+            raise ConnectionError("worker lost")
+
+        upload_file(source, destination)
+
+    monkeypatch.setattr(clients, "get_storage", lambda: storage)
+    monkeypatch.setattr(processor, "get_status_reporter", lambda: status_reporter)
+    monkeypatch.setattr(processor, "upload_file", failing_upload_file)
+
+    for attempt in range(2):
+        attempt_dir = tmp_path / f"attempt-{attempt}"
+        attempt_dir.mkdir()
+
+        if attempt == 1:
+            monkeypatch.setattr(processor, "upload_file", upload_file)
+
+        try:
+            processor.upload_document(
+                job,
+                ((f"page {i}", f"page_{i}.md") for i in range(2)),
+                str(attempt_dir),
+                "jobs/a/a.md",
+                ConversionReport(),
+            )
+        except ConnectionError:
+            assert attempt == 0
+
+    # the redelivered job uploads over the page files the first attempt left
+    bucket = storage.from_("jobs")
+    assert bucket.download("jobs/a/page_1.md") == b"page 1"
+    assert bucket.download("jobs/a/a.md") == b"page 0\npage 1"
+
+    processor.copy_file("jobs/a/a.md", "jobs/b/b.md")
+    processor.copy_file("jobs/a/a.md", "jobs/b/b.md")
+    assert bucket.download("jobs/b/b.md") == b"page 0\npage 1"
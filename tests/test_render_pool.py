@@ -0,0 +1,123 @@
+import fitz
+import pytest
+
+from worker import config, processor, render_pool
+from worker.render_pool import RenderPool
+from worker.rendering import render_page
+from worker.resolution import ResolutionPolicy
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = RenderPool(2)
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def _write_pdf(path, page_count):
+    doc = fitz.open()
+
+    for i in range(page_count):
+        doc.new_page(width=612, height=792).insert_text((72, 72 + i * 20), f"page {i}")
+
+    doc.save(path)
+    doc.close()
+
+
+def test_renders_the_same_pixels_as_this_process(tmp_path, pool):
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, 3)
+    policy = ResolutionPolicy(mode="adaptive", adaptive_start_pixels=256 * 28 * 28)
+
+    with fitz.open(pdf_path) as doc:
+        for page_number in range(3):
+            for attempt in range(2):
+                expected = render_page(doc[page_number], policy, attempt)
+                image = pool.render(pdf_path, page_number, policy, attempt)
+
+                assert image.size == expected.size
+                assert image.tobytes() == expected.tobytes()
+
+
+def test_convert_document_keeps_page_order_with_a_pool(tmp_path, pool, monkeypatch):
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, 6)
+
+    with fitz.open(pdf_path) as doc:
+        images = [processor.encode_page(doc, i) for i in range(doc.page_count)]
+
+    monkeypatch.setattr(render_pool, "get_render_pool", lambda: pool)
+    monkeypatch.setattr(processor, "get_render_pool", lambda: pool)
+    monkeypatch.setattr(
+        processor,
+        "convert_page_to_markdown",
+        lambda image: f"page {images.index(image)}",
+    )
+    monkeypatch.setattr(
+        processor, "correct_page_overlap", lambda last, current: (last, current)
+    )
+
+    pages = list(processor.convert_document(pdf_path, text_layer_mode="off"))
+
+    assert [page for page, _ in pages] == [f"page {i}" for i in range(6)]
+
+
+def test_falls_back_when_processes_cannot_start(monkeypatch):
+    class FailingPool(RenderPool):
+        def start(self, timeout=60):
+            raise AssertionError("daemonic processes are not allowed to have children")
+
+    monkeypatch.setattr(render_pool, "RenderPool", FailingPool)
+    monkeypatch.setattr(config, "PAGE_RENDER_PROCESSES", 2)
+    render_pool.get_render_pool.cache_clear()
+
+    try:
+        assert render_pool.get_render_pool() is None
+    finally:
+        render_pool.get_render_pool.cache_clear()
+
+
+def test_broken_pool_renders_the_rest_of_the_document_here(tmp_path, monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+
+    class BrokenPool:
+        processes = 2
+
+        def __init__(self):
+            self.renders = 0
+            self.closed = 0
+
+        def render(self, path, page_number, resolution, attempt=0):
+            self.renders += 1
+            raise BrokenProcessPool("a render process died")
+
+        def close(self):
+            self.closed += 1
+
+    pdf_path = str(tmp_path / "doc.pdf")
+    _write_pdf(pdf_path, 6)
+
+    with fitz.open(pdf_path) as doc:
+        images = [processor.encode_page(doc, i) for i in range(doc.page_count)]
+
+    broken_pool = BrokenPool()
+    monkeypatch.setattr(processor, "get_render_pool", lambda: broken_pool)
+    monkeypatch.setattr(
+        processor,
+        "convert_page_to_markdown",
+        lambda image: f"page {images.index(image)}",
+    )
+    monkeypatch.setattr(
+        processor, "correct_page_overlap", lambda last, current: (last, current)
+    )
+
+    pages = list(
+        processor.convert_document(
+            pdf_path, text_layer_mode="off", max_in_flight_pages=1
+        )
+    )
+
+    assert [page for page, _ in pages] == [f"page {i}" for i in range(6)]
+    assert broken_pool.renders == 1
+    assert broken_pool.closed == 1
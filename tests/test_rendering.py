@@ -0,0 +1,55 @@
+import fitz
+import pytest
+from PIL import Image
+
+from worker.rendering import (
+    encode_image,
+    get_render_size,
+    render_page,
+    snap_to_grid,
+)
+
+
+def _letter_page():
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((72, 72), "hello world")
+    return doc, page
+
+
+def test_snap_to_grid():
+    assert snap_to_grid(0) == 28
+    assert snap_to_grid(41) == 28
+    assert snap_to_grid(43) == 56
+    assert snap_to_grid(100000) == 16384
+
+
+def test_render_page_lands_on_grid():
+    doc, page = _letter_page()
+
+    for dpi in (72, 96, 144):
+        image = render_page(page, dpi)
+
+        assert image.size == get_render_size(page, dpi)
+        assert image.width % 28 == 0
+        assert image.height % 28 == 0
+
+    doc.close()
+
+
+@pytest.mark.parametrize(
+    "image_format,magic",
+    [("png", b"\x89PNG"), ("jpeg", b"\xff\xd8"), ("webp", b"RIFF")],
+)
+def test_encode_image_formats(image_format, magic):
+    image = Image.new("RGB", (56, 84), "white")
+    page_image = encode_image(image, image_format, quality=80)
+
+    assert page_image.data.startswith(magic)
+    assert (page_image.width, page_image.height) == (56, 84)
+    assert page_image.to_data_uri().startswith(f"data:{page_image.mime_type};base64,")
+
+
+def test_encode_image_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        encode_image(Image.new("RGB", (28, 28)), "gif", quality=80)
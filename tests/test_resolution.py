@@ -0,0 +1,133 @@
+import fitz
+import pytest
+
+from worker.resolution import (
+    ResolutionPolicy,
+    apply_pixel_budget,
+    fit_to_pixel_budget,
+)
+
+LETTER = (612, 792)
+
+
+def test_fit_to_pixel_budget_stays_on_grid_and_within_budget():
+    width, height = fit_to_pixel_budget(2550, 3300, 3136, 1280 * 28 * 28)
+
+    assert width % 28 == 0 and height % 28 == 0
+    assert width * height <= 1280 * 28 * 28
+    assert abs(width / height - 2550 / 3300) < 0.05
+
+    assert fit_to_pixel_budget(10, 10, 64 * 28 * 28, 1280 * 28 * 28) == (224, 224)
+    assert fit_to_pixel_budget(616, 784, 3136, 1280 * 28 * 28) == (616, 784)
+
+
+def test_dpi_policy_is_capped():
+    assert ResolutionPolicy(dpi=72).get_size(*LETTER) == (616, 784)
+    # 300 dpi is capped at max_dpi, then at the pixel budget
+    assert ResolutionPolicy(dpi=300, max_dpi=96).get_size(*LETTER) == (812, 1064)
+
+    width, height = ResolutionPolicy(dpi=300, max_dpi=300).get_size(*LETTER)
+    assert width * height <= ResolutionPolicy().max_pixels
+
+
+def test_budget_policy_fills_budget_whatever_the_page_size():
+    policy = ResolutionPolicy(mode="budget", max_pixels=512 * 28 * 28, max_dpi=1000)
+
+    for page_size in (LETTER, (LETTER[0] * 4, LETTER[1] * 4), (200, 260)):
+        width, height = policy.get_size(*page_size)
+
+        assert 0.8 * policy.max_pixels <= width * height <= policy.max_pixels
+
+
+def test_adaptive_policy_grows_budget_until_max_pixels():
+    policy = ResolutionPolicy(
+        mode="adaptive",
+        adaptive_start_pixels=256 * 28 * 28,
+        max_pixels=1280 * 28 * 28,
+    )
+
+    assert policy.get_pixel_budgets() == [
+        256 * 28 * 28,
+        512 * 28 * 28,
+        1024 * 28 * 28,
+        1280 * 28 * 28,
+    ]
+    assert policy.attempts == 4
+
+    sizes = [policy.get_size(*LETTER, attempt) for attempt in range(policy.attempts)]
+    areas = [width * height for width, height in sizes]
+    assert areas == sorted(areas)
+
+
+def test_unknown_resolution_mode():
+    with pytest.raises(ValueError):
+        ResolutionPolicy(mode="huge")
+
+
+def test_apply_pixel_budget_caps_requests_at_deployment_budget():
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "image": "blob:0",
+                    "resized_width": 2464,
+                    "resized_height": 3192,
+                },
+                {"type": "image", "image": "blob:1", "max_pixels": 64 * 28 * 28},
+                {"type": "text", "text": "convert"},
+            ],
+        }
+    ]
+
+    content = apply_pixel_budget(messages, 3136, 1280 * 28 * 28)[0]["content"]
+
+    assert content[0]["resized_width"] * content[0]["resized_height"] <= (
+        1280 * 28 * 28
+    )
+    assert content[0]["max_pixels"] == 1280 * 28 * 28
+    assert content[1]["max_pixels"] == 64 * 28 * 28
+    assert content[2] == {"type": "text", "text": "convert"}
+
+
+def test_convert_document_retries_truncated_pages_at_higher_resolution(
+    tmp_path, monkeypatch
+):
+    from worker import processor
+
+    path = str(tmp_path / "source.pdf")
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "scanned")
+    doc.save(path)
+    doc.close()
+
+    sizes = []
+
+    def fake_call_inference_api(request, blobs=None):
+        image = request.messages[0].content[0]
+        sizes.append(image.resized_width * image.resized_height)
+
+        # truncated twice, then a complete page
+        if len(sizes) < 3:
+            return {"outputs": ["```markdown\n# page\n| a |"]}
+
+        return {"outputs": ["```markdown\n# page\n```"]}
+
+    monkeypatch.setattr(processor, "get_page_cache", lambda: None)
+    monkeypatch.setattr(processor, "call_inference_api", fake_call_inference_api)
+
+    policy = ResolutionPolicy(
+        mode="adaptive",
+        adaptive_start_pixels=64 * 28 * 28,
+        max_pixels=1024 * 28 * 28,
+    )
+    pages = list(
+        processor.convert_document(
+            path, text_layer_mode="off", resolution_policy=policy
+        )
+    )
+
+    assert [page for page, _ in pages] == ["# page"]
+    assert len(sizes) == 3
+    assert sizes == sorted(sizes) and sizes[0] < sizes[-1]
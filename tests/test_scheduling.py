@@ -0,0 +1,71 @@
+from worker import config, scheduling
+from worker.scheduling import TenantLimiter
+from worker.types import ParseJob
+
+
+def _job(page_count, priority=None):
+    return ParseJob(
+        job_id="a",
+        output_format="md",
+        source_file="a.pdf",
+        page_count=page_count,
+        priority=priority,
+    )
+
+
+def test_get_routing_by_page_count_and_priority(monkeypatch):
+    monkeypatch.setattr(config, "JOB_ROUTING_ENABLED", True)
+    monkeypatch.setattr(config, "SMALL_JOB_MAX_PAGES", 10)
+    monkeypatch.setattr(config, "MEDIUM_JOB_MAX_PAGES", 100)
+
+    assert scheduling.get_routing(_job(10)) == {"queue": "pdf.small", "priority": 3}
+    assert scheduling.get_routing(_job(11, "high")) == {
+        "queue": "pdf.medium",
+        "priority": 0,
+    }
+    assert scheduling.get_routing(_job(500, "low")) == {
+        "queue": "pdf.large",
+        "priority": 6,
+    }
+    assert scheduling.get_routing(_job(None)) == {}
+
+    monkeypatch.setattr(config, "JOB_ROUTING_ENABLED", False)
+    assert scheduling.get_routing(_job(10)) == {}
+
+
+def test_get_queue_depth_counts_every_priority(redis_client):
+    redis_client.lists = {
+        "pdf.small": [1, 2],
+        "pdf.small\x06\x163": [3],
+        "pdf.small\x06\x169": [4],
+        "pdf.medium": [5],
+    }
+
+    assert scheduling.get_queue_depths(redis_client) == {
+        "pdf.small": 4,
+        "pdf.medium": 1,
+        "pdf.large": 0,
+    }
+
+
+def test_tenant_limiter_caps_active_jobs_per_queue(redis_client):
+    limiter = TenantLimiter(redis_client, max_active_jobs=2, lease_seconds=60)
+
+    assert limiter.acquire("tenant", "pdf.large", "a")
+    assert limiter.acquire("tenant", "pdf.large", "b")
+    assert not limiter.acquire("tenant", "pdf.large", "c")
+
+    # a redelivered job keeps its slot, other queues and tenants are separate
+    assert limiter.acquire("tenant", "pdf.large", "a")
+    assert limiter.acquire("tenant", "pdf.small", "c")
+    assert limiter.acquire("other", "pdf.large", "c")
+
+    limiter.release("tenant", "pdf.large", "a")
+    assert limiter.acquire("tenant", "pdf.large", "c")
+
+
+def test_tenant_limiter_expires_leases(redis_client):
+    limiter = TenantLimiter(redis_client, max_active_jobs=1, lease_seconds=-1)
+
+    assert limiter.acquire("tenant", "pdf.large", "a")
+    assert limiter.acquire("tenant", "pdf.large", "b")
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+from worker.storage import LocalStorage
+
+
+def test_local_bucket_round_trip(tmp_path):
+    bucket = LocalStorage(str(tmp_path)).from_("jobs")
+
+    bucket.upload("job/output.md", io.BytesIO(b"# page"))
+    bucket.copy("job/output.md", "other/output.md")
+
+    assert bucket.download("other/output.md") == b"# page"
+    assert (tmp_path / "jobs" / "job" / "output.md").read_bytes() == b"# page"
+
+
+def test_local_bucket_list_reports_storage_metadata(tmp_path):
+    bucket = LocalStorage(str(tmp_path)).from_("uploads")
+    bucket.upload("folder/a.pdf", b"same bytes")
+    bucket.upload("folder/b.pdf", b"same bytes")
+
+    files = bucket.list("folder", {"search": "a.pdf"})
+
+    assert [file["name"] for file in files] == ["a.pdf"]
+    assert files[0]["metadata"]["size"] == len(b"same bytes")
+    assert (
+        files[0]["metadata"]["eTag"]
+        == bucket.list("folder", {"search": "b.pdf"})[0]["metadata"]["eTag"]
+    )
+    assert bucket.list("missing") == []
+
+
+def test_local_bucket_rejects_paths_outside_the_bucket(tmp_path):
+    bucket = LocalStorage(str(tmp_path)).from_("uploads")
+
+    with pytest.raises(ValueError):
+        bucket.download("../jobs/output.md")
+
+
+def test_local_bucket_only_overwrites_with_upsert(tmp_path):
+    bucket = LocalStorage(str(tmp_path)).from_("jobs")
+    bucket.upload("job/output.md", b"# first")
+
+    with pytest.raises(FileExistsError):
+        bucket.upload("job/output.md", b"# second")
+
+    bucket.upload("job/output.md", b"# second", file_options={"upsert": "true"})
+    assert bucket.download("job/output.md") == b"# second"
+
+    bucket.upload("job/copy.md", b"# copy")
+
+    with pytest.raises(FileExistsError):
+        bucket.copy("job/output.md", "job/copy.md")
+
+    assert bucket.remove(["job/copy.md", "job/missing.md"]) == [{"name": "job/copy.md"}]
+    bucket.copy("job/output.md", "job/copy.md")
+    assert bucket.download("job/copy.md") == b"# second"
@@ -0,0 +1,119 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from worker.streaming import (
+    collect_stream,
+    count_closed_markdown_blocks,
+    format_sse_event,
+    has_closed_markdown_blocks,
+    iter_sse_events,
+)
+
+
+def test_count_closed_markdown_blocks():
+    assert count_closed_markdown_blocks("") == 0
+    assert count_closed_markdown_blocks("```markdown\n# page\n") == 0
+    assert count_closed_markdown_blocks("```markdown\n# page\n```") == 1
+    assert count_closed_markdown_blocks("```markdown\na\n```\n```markdown\nb\n```") == 2
+
+    assert not has_closed_markdown_blocks("```markdown\n# page\n```", None)
+    assert has_closed_markdown_blocks("```markdown\n# page\n```", 1)
+
+
+def test_sse_events_round_trip():
+    body = (
+        format_sse_event({"text": "```markdown\n"})
+        + format_sse_event({"text": "line\n\nbreaks"})
+        + format_sse_event({}, event="done")
+    )
+
+    assert list(iter_sse_events(body.split("\n"))) == [
+        ("message", {"text": "```markdown\n"}),
+        ("message", {"text": "line\n\nbreaks"}),
+        ("done", {}),
+    ]
+
+
+def test_collect_stream_stops_reading_after_closed_block():
+    consumed = []
+
+    def chunks():
+        for chunk in ["```mark", "down\n# page\n", "``", "`", "\nchatter", "more"]:
+            consumed.append(chunk)
+            yield chunk
+
+    assert collect_stream(chunks(), 1) == "```markdown\n# page\n```"
+    assert consumed[-1] == "`"
+
+    consumed.clear()
+    assert collect_stream(chunks(), None).endswith("more")
+
+
+class SSEServer:
+    def __init__(self, chunks):
+        self.requests = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server.requests.append(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+
+                try:
+                    for chunk in chunks:
+                        self.wfile.write(format_sse_event({"text": chunk}).encode())
+                        self.wfile.flush()
+
+                    self.wfile.write(format_sse_event({}, event="done").encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def sse_server():
+    server = SSEServer(["```markdown\n", "# page\n", "```", "\nthat was the page"])
+    yield server
+    server.close()
+
+
+def test_call_inference_api_streams_until_block_is_closed(sse_server, monkeypatch):
+    from worker import config, http_client, processor
+    from worker.types import InferenceRequest
+
+    client = http_client.HttpClient(
+        sse_server.url, connect_timeout=1, read_timeout=1, max_retries=0
+    )
+    monkeypatch.setattr(config, "INFERENCE_STREAMING", True)
+    monkeypatch.setattr(http_client, "get_inference_stream_client", lambda: client)
+
+    response = processor.call_inference_api(
+        InferenceRequest(messages=[], stop_after_markdown_blocks=1)
+    )
+
+    assert response == {"outputs": ["```markdown\n# page\n```"]}
+    assert processor.parse_markdown_page(response["outputs"][0]) == ["# page"]
+
+    # without a stop condition the whole stream is read
+    response = processor.call_inference_api(InferenceRequest(messages=[]))
+
+    assert response["outputs"][0].endswith("that was the page")
+    assert len(sse_server.requests) == 2
@@ -0,0 +1,140 @@
+import json
+import os
+import subprocess
+import sys
+
+import fitz
+
+from worker import telemetry as telemetry_module
+from worker.telemetry import NoopTelemetry, Telemetry
+
+
+def test_counters_and_histograms_render_as_prometheus():
+    telemetry = Telemetry(prefix="test_")
+    telemetry.counter("pages_total", route="image")
+    telemetry.counter("pages_total", 2, route="image")
+    telemetry.observe("stage_duration_seconds", 0.02, buckets=(0.01, 0.1), stage="x")
+    telemetry.observe("stage_duration_seconds", 5, buckets=(0.01, 0.1), stage="x")
+
+    assert telemetry.render_prometheus().splitlines() == [
+        "# TYPE test_pages_total counter",
+        'test_pages_total{route="image"} 3',
+        "# TYPE test_stage_duration_seconds histogram",
+        'test_stage_duration_seconds_bucket{stage="x",le="0.01"} 0',
+        'test_stage_duration_seconds_bucket{stage="x",le="0.1"} 1',
+        'test_stage_duration_seconds_bucket{stage="x",le="+Inf"} 2',
+        'test_stage_duration_seconds_sum{stage="x"} 5.02',
+        'test_stage_duration_seconds_count{stage="x"} 2',
+    ]
+
+
+def test_span_logs_bound_attributes_and_errors(capsys):
+    telemetry = Telemetry(log_spans=True)
+
+    with telemetry.bind(job_id="job"):
+        with telemetry.span("render", page=3):
+            pass
+
+        try:
+            with telemetry.span("upload"):
+                raise OSError("disk full")
+        except OSError:
+            pass
+
+    render, upload = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert render["span"] == "render"
+    assert render["job_id"] == "job" and render["page"] == 3
+    assert upload["error"] == "OSError"
+    assert telemetry.get_histogram("stage_duration_seconds", stage="render").count == 1
+    assert (
+        telemetry.get_counter("stage_errors_total", stage="upload", error="OSError")
+        == 1
+    )
+
+
+def test_noop_telemetry_records_nothing(tmp_path):
+    telemetry = NoopTelemetry()
+    telemetry.counter("pages_total")
+
+    with telemetry.bind(job_id="job"), telemetry.span("render"):
+        pass
+
+    telemetry.write_textfile(str(tmp_path))
+
+    assert telemetry.render_prometheus() == "\n"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_textfile(tmp_path):
+    telemetry = Telemetry(prefix="test_")
+    telemetry.counter("tasks_total", task="job", result="success")
+
+    telemetry.write_textfile(str(tmp_path))
+
+    [path] = tmp_path.iterdir()
+    assert path.name.endswith(".prom")
+    assert 'test_tasks_total{result="success",task="job"} 1' in path.read_text()
+
+
+def test_textfiles_of_exited_processes_are_removed(tmp_path):
+    exited_pid = int(
+        subprocess.run(
+            [sys.executable, "-c", "import os; print(os.getpid())"],
+            capture_output=True,
+            text=True,
+        ).stdout
+    )
+    (tmp_path / f"worker-{exited_pid}.prom").write_text("")
+    (tmp_path / "node.prom").write_text("")
+    Telemetry().write_textfile(str(tmp_path))
+
+    telemetry_module.remove_stale_textfiles(str(tmp_path))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "node.prom",
+        f"worker-{os.getpid()}.prom",
+    ]
+
+    telemetry_module.remove_textfile(str(tmp_path))
+    assert [path.name for path in tmp_path.iterdir()] == ["node.prom"]
+
+
+def test_convert_document_records_stages(tmp_path, monkeypatch):
+    from worker import processor
+
+    path = str(tmp_path / "source.pdf")
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "scanned")
+    doc.new_page()
+    doc.save(path)
+    doc.close()
+
+    telemetry = Telemetry()
+    monkeypatch.setattr(processor, "get_telemetry", lambda: telemetry)
+    monkeypatch.setattr(
+        processor, "convert_page_to_markdown", lambda image, **kwargs: "# page"
+    )
+
+    list(processor.convert_document(path, text_layer_mode="off", job_id="job"))
+
+    assert telemetry.get_counter("pages_total", route="image") == 1
+    assert telemetry.get_counter("pages_total", route="blank") == 1
+
+    for stage in ("page", "classify", "render", "encode"):
+        assert telemetry.get_histogram("stage_duration_seconds", stage=stage)
+
+    assert telemetry.get_histogram("page_image_bytes").count == 1
+    assert telemetry.get_histogram("page_visual_tokens").count == 1
+
+
+def test_gauges_keep_the_last_value():
+    telemetry = Telemetry(prefix="test_")
+    telemetry.gauge("queue_depth", 3, queue="pdf.small")
+    telemetry.gauge("queue_depth", 1, queue="pdf.small")
+
+    assert telemetry.get_gauge("queue_depth", queue="pdf.small") == 1
+    assert telemetry.render_prometheus().splitlines() == [
+        "# TYPE test_queue_depth gauge",
+        'test_queue_depth{queue="pdf.small"} 1',
+    ]
@@ -0,0 +1,87 @@
+import fitz
+import pytest
+
+from worker.text_layer import (
+    PAGE_ROUTE_BLANK,
+    PAGE_ROUTE_IMAGE,
+    PAGE_ROUTE_TEXT,
+    classify_page,
+    get_bad_char_ratio,
+    page_text_to_markdown,
+)
+
+
+def _born_digital_page(doc):
+    page = doc.new_page()
+    page.insert_text((72, 60), "Annual Report", fontsize=24)
+
+    for i in range(8):
+        page.insert_text(
+            (72, 100 + i * 14),
+            f"Body line {i} with enough characters to count as real text.",
+            fontsize=11,
+        )
+
+    for row in range(3):
+        for column in range(2):
+            rect = fitz.Rect(
+                72 + column * 120, 260 + row * 20, 192 + column * 120, 280 + row * 20
+            )
+            page.draw_rect(rect, color=(0, 0, 0))
+            page.insert_text((rect.x0 + 4, rect.y0 + 14), f"r{row}c{column}")
+
+    page.insert_text((72, 360), "Closing paragraph.", fontsize=11)
+
+
+def _scanned_page(doc):
+    page = doc.new_page()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 200), False)
+    pix.set_rect(pix.irect, (120, 120, 120))
+    pix.set_rect(fitz.IRect(20, 20, 180, 60), (0, 0, 0))
+    page.insert_image(page.rect, pixmap=pix)
+
+
+@pytest.fixture
+def doc():
+    doc = fitz.open()
+    _born_digital_page(doc)
+    doc.new_page()
+    _scanned_page(doc)
+
+    # reopen so every page is read back the way a downloaded file would be
+    doc = fitz.open("pdf", doc.tobytes())
+    yield doc
+    doc.close()
+
+
+def test_classify_page(doc):
+    assert classify_page(doc[0], "strict") == PAGE_ROUTE_TEXT
+    assert classify_page(doc[1], "strict") == PAGE_ROUTE_BLANK
+    assert classify_page(doc[2], "lenient") == PAGE_ROUTE_IMAGE
+
+
+def test_classify_page_off_sends_text_pages_to_inference(doc):
+    assert classify_page(doc[0], "off") == PAGE_ROUTE_IMAGE
+    assert classify_page(doc[1], "off") == PAGE_ROUTE_BLANK
+
+
+def test_classify_page_rejects_unknown_mode(doc):
+    with pytest.raises(ValueError):
+        classify_page(doc[0], "loose")
+
+
+def test_bad_char_ratio():
+    assert get_bad_char_ratio("clean text") == 0
+    assert get_bad_char_ratio("\ufffd\ufffdab") == 0.5
+    assert get_bad_char_ratio("   ") == 1.0
+
+
+def test_page_text_to_markdown(doc):
+    markdown = page_text_to_markdown(doc[0])
+    heading, body, table, closing = markdown.split("\n\n")
+
+    assert heading == "# Annual Report"
+    assert body.startswith("Body line 0")
+    assert table.splitlines()[0] == "|r0c0|r0c1|"
+    assert table.splitlines()[1] == "|---|---|"
+    assert closing == "Closing paragraph."
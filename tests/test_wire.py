@@ -0,0 +1,110 @@
+import io
+
+import pytest
+from PIL import Image
+
+from worker import wire
+from worker.rendering import encode_image
+from worker.types import InferenceMessage, InferenceMessageContent, InferenceRequest
+
+
+def _request(image: str) -> InferenceRequest:
+    return InferenceRequest(
+        messages=[
+            InferenceMessage(
+                role="user",
+                content=[
+                    InferenceMessageContent(type="image", image=image),
+                    InferenceMessageContent(type="text", text="convert"),
+                ],
+            )
+        ]
+    )
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (56, 28), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_envelope_round_trip():
+    request = _request("blob:0")
+    blobs = [_png(), b""]
+
+    decoded_request, decoded_blobs = wire.decode_request(
+        wire.encode_request(request, blobs)
+    )
+
+    assert decoded_request == request
+    assert decoded_blobs == blobs
+
+
+def test_envelope_is_smaller_than_base64_json():
+    image = encode_image(Image.new("RGB", (560, 560), "white"), "png", 85)
+
+    envelope = wire.encode_request(_request("blob:0"), [image.data])
+    json_body = _request(image.to_data_uri()).model_dump_json().encode("utf-8")
+
+    assert len(envelope) < len(json_body)
+
+
+def test_decode_rejects_bad_envelopes():
+    body = wire.encode_request(_request("blob:0"), [_png()])
+
+    with pytest.raises(ValueError, match="Not an inference request envelope"):
+        wire.decode_request(b"{}" + body)
+
+    with pytest.raises(ValueError, match="Truncated"):
+        wire.decode_request(body[:-1])
+
+    with pytest.raises(ValueError, match="Trailing bytes"):
+        wire.decode_request(body + b"\0")
+
+    with pytest.raises(ValueError, match="Unsupported"):
+        wire.decode_request(wire.MAGIC + bytes([wire.VERSION + 1]) + body[5:])
+
+
+def test_load_blob_images_replaces_references():
+    messages = _request("blob:0").model_dump(exclude_none=True)["messages"]
+
+    messages = wire.load_blob_images(messages, [_png()])
+
+    assert messages[0]["content"][0]["image"].size == (56, 28)
+    assert messages[0]["content"][1] == {"type": "text", "text": "convert"}
+
+
+def test_request_digest_ignores_how_images_are_sent():
+    image = encode_image(Image.new("RGB", (56, 28), "black"), "png", 85)
+    digest = wire.request_digest(_request("blob:0"), [image.data])
+
+    assert wire.request_digest(_request(image.to_data_uri()), []) == digest
+
+    other_page = wire.request_digest(_request("blob:0"), [_png()])
+    overlap = _request("blob:0")
+    overlap.stop_after_markdown_blocks = 2
+
+    assert other_page != digest
+    assert wire.request_digest(overlap, [image.data]) != digest
+
+
+def test_convert_page_to_markdown_sends_binary_envelope(monkeypatch):
+    from worker import config, processor
+
+    calls = []
+
+    def fake_call_inference_api(request, blobs=None):
+        calls.append((request, blobs))
+        return {"outputs": ["```markdown\n# page\n```"]}
+
+    monkeypatch.setattr(config, "INFERENCE_WIRE_FORMAT", "binary")
+    monkeypatch.setattr(processor, "get_page_cache", lambda: None)
+    monkeypatch.setattr(processor, "call_inference_api", fake_call_inference_api)
+
+    image = encode_image(Image.new("RGB", (56, 28), "white"), "png", 85)
+
+    assert processor.convert_page_to_markdown(image) == "# page"
+
+    request, blobs = calls[0]
+    assert request.messages[0].content[0].image == "blob:0"
+    assert blobs == [image.data]
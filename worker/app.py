@@ -1,8 +1,23 @@
-from celery import Celery
+import functools
+import time
+from typing import Optional
 
-from worker.config import REDIS_HOST, REDIS_PORT, REDIS_DB
-from worker.processor import process_remote_document, update_status
-from worker.types import ParseJob
+from celery import Celery, chord
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from worker import config, scheduling
+from worker.config import (
+    REDIS_HOST,
+    REDIS_PORT,
+    REDIS_DB,
+    STATUS_FLUSH_TIMEOUT,
+    TASK_VISIBILITY_TIMEOUT,
+    TELEMETRY_TEXTFILE_DIR,
+    TENANT_DEFER_SECONDS,
+)
+from worker.notifications import get_status_reporter
+from worker.telemetry import get_telemetry
+from worker.types import ConversionReport, ParseJob
 
 app = Celery(
     "worker",
@@ -10,17 +25,247 @@ app = Celery(
     backend=f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}",
 )
 
+# unacknowledged jobs are redelivered after this long, it must outlast the
+# longest document we expect to convert
+app.conf.broker_transport_options = {
+    "visibility_timeout": TASK_VISIBILITY_TIMEOUT,
+    "priority_steps": list(scheduling.PRIORITY_STEPS),
+}
+
+
+# the parent process only routes tasks, the heavy imports (fitz, PIL,
+# supabase) and long lived clients belong to the forked pool processes
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    from worker import lifecycle
+
+    lifecycle.init_process()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    from worker import lifecycle
+
+    lifecycle.shutdown_process()
+
+
+def traced(stage: str):
+    # times the task, counts its results and exports metrics for this process
+    def decorator(task):
+        @functools.wraps(task)
+        def wrapper(*args, **kwargs):
+            telemetry = get_telemetry()
+            request = kwargs.get("request") or next(
+                arg for arg in args if isinstance(arg, dict)
+            )
+            result = None
+
+            try:
+                with telemetry.bind(job_id=request.get("job_id")):
+                    with telemetry.span(stage):
+                        result = task(*args, **kwargs)
+                        return result
+            finally:
+                if result is None or result.get("error"):
+                    outcome = "error"
+                else:
+                    outcome = result.get("result", "success")
+
+                telemetry.counter("tasks_total", task=stage, result=outcome)
+
+                if TELEMETRY_TEXTFILE_DIR:
+                    telemetry.write_textfile(TELEMETRY_TEXTFILE_DIR)
+
+        return wrapper
+
+    return decorator
 
-@app.task
+
+@app.task(acks_late=True, reject_on_worker_lost=True)
 def process_pdf(request: dict):
+    # every job arrives here, with routing on it's only sized up and sent to
+    # the queue for its size class. Validated once here, later tasks get the
+    # normalized request
+    request = {**request, "output_format": ParseJob(**request).output_format}
+
+    if config.JOB_ROUTING_ENABLED:
+        return route_pdf(request)
+
+    return convert_pdf(request)
+
+
+@traced("route")
+def route_pdf(request: dict):
+    from worker import processor
+
     job = ParseJob(**request)
+    status_reporter = get_status_reporter()
 
     try:
+        job.page_count = processor.get_remote_page_count(job)
+    except Exception as e:
+        print("error reading page count:", e)
+        status_reporter.report(job.job_id, "errored", error=str(e))
+        status_reporter.flush(STATUS_FLUSH_TIMEOUT)
+        return {"result": "error", "error": str(e)}
+
+    routing = scheduling.get_routing(job)
+    convert_pdf.apply_async(
+        ({**request, "page_count": job.page_count},),
+        {"routed_at": time.time()},
+        **routing,
+    )
+    print(f"routed {job.page_count} pages to {routing['queue']}:", job.source_file)
+
+    get_telemetry().counter(
+        "jobs_routed_total",
+        queue=routing["queue"],
+        priority=job.priority or config.JOB_DEFAULT_PRIORITY,
+    )
+    scheduling.record_queue_depths()
+
+    return {"result": "routed", "error": None, "queue": routing["queue"]}
+
+
+# acknowledge after the task finishes so jobs on a worker that dies are
+# redelivered, and resume from their checkpoint
+@app.task(acks_late=True, reject_on_worker_lost=True)
+@traced("job")
+def convert_pdf(request: dict, routed_at: Optional[float] = None):
+    from worker import processor
+
+    job = ParseJob(**request)
+    status_reporter = get_status_reporter()
+    routing = scheduling.get_routing(job)
+
+    if not scheduling.acquire_tenant_slot(job):
+        # back on the queue, other tenants' jobs run in the meantime
+        print(f"tenant {job.tenant_id} is at its job limit:", job.source_file)
+        get_telemetry().counter("jobs_deferred_total", queue=routing["queue"])
+        convert_pdf.apply_async(
+            (request,),
+            {"routed_at": routed_at},
+            countdown=TENANT_DEFER_SECONDS,
+            **routing,
+        )
+        return {"result": "deferred", "error": None}
+
+    if routed_at is not None:
+        get_telemetry().observe(
+            "queue_wait_seconds",
+            max(time.time() - routed_at, 0),
+            queue=routing.get("queue", "default"),
+        )
+
+    dispatched = False
+    dispatch_log = scheduling.get_dispatch_log()
+
+    def dispatch_page_ranges(page_ranges, fingerprints):
+        chord(
+            process_pdf_page_range.s(request, start, end).set(**routing)
+            for start, end in page_ranges
+        )(assemble_pdf.s(request, page_ranges, fingerprints).set(**routing))
+
+        try:
+            dispatch_log.record(job.job_id)
+        except Exception as e:
+            print("Error recording dispatched job:", e)
+
+    try:
+        try:
+            dispatched = dispatch_log.was_dispatched(job.job_id)
+        except Exception as e:
+            print("Error reading dispatched jobs:", e)
+
+        if dispatched:
+            # redelivered after its page ranges were sent, a second chord
+            # would convert and publish the document twice
+            print("already dispatched:", job.source_file)
+            return {"result": "dispatched", "error": None}
+
         print("processing pdf:", job.source_file)
-        process_remote_document(job)
-        update_status(job.job_id, "completed")
-        return {"result": "success", "error": None}
+        report = processor.process_remote_document(job, dispatch_page_ranges)
+
+        if report.page_ranges > 1:
+            # assemble_pdf gives the tenant's slot back
+            dispatched = True
+            print(f"split into {report.page_ranges} page ranges:", job.source_file)
+            return {
+                "result": "dispatched",
+                "error": None,
+                "report": report.model_dump(),
+            }
+
+        status_reporter.report(
+            job.job_id,
+            "completed",
+            pages_done=report.pages_done,
+            pages_total=report.total_pages,
+        )
+        return {"result": "success", "error": None, "report": report.model_dump()}
     except Exception as e:
         print("error processing pdf:", e)
-        update_status(job.job_id, f"errored: {str(e)}")
+        status_reporter.report(job.job_id, "errored", error=str(e))
+        return {"result": "error", "error": str(e)}
+    finally:
+        if not dispatched:
+            scheduling.release_tenant_slot(job)
+
+        # terminal statuses must not be lost if the worker goes away next
+        status_reporter.flush(STATUS_FLUSH_TIMEOUT)
+
+
+@app.task(acks_late=True, reject_on_worker_lost=True)
+@traced("page_range")
+def process_pdf_page_range(request: dict, start: int, end: int):
+    from worker import processor
+
+    job = ParseJob(**request)
+
+    # errors are returned rather than raised so the chord always reaches
+    # assemble_pdf, which reports the job as errored
+    try:
+        print(f"processing pages {start}-{end}:", job.source_file)
+        pages_path, report = processor.process_remote_page_range(job, start, end)
+        return {"pages_path": pages_path, "report": report.model_dump(), "error": None}
+    except Exception as e:
+        print(f"error processing pages {start}-{end}:", e)
+        return {"pages_path": None, "report": None, "error": str(e)}
+
+
+@app.task(acks_late=True, reject_on_worker_lost=True)
+@traced("assemble")
+def assemble_pdf(results: list, request: dict, page_ranges: list, fingerprints: list):
+    from worker import processor
+
+    job = ParseJob(**request)
+    status_reporter = get_status_reporter()
+
+    try:
+        errors = [result["error"] for result in results if result["error"]]
+
+        if errors:
+            raise RuntimeError(errors[0])
+
+        print("assembling pdf:", job.source_file)
+        report = processor.assemble_remote_document(
+            job,
+            page_ranges=[tuple(page_range) for page_range in page_ranges],
+            range_paths=[result["pages_path"] for result in results],
+            range_reports=[ConversionReport(**result["report"]) for result in results],
+            fingerprints=fingerprints,
+        )
+        status_reporter.report(
+            job.job_id,
+            "completed",
+            pages_done=report.pages_done,
+            pages_total=report.total_pages,
+        )
+        return {"result": "success", "error": None, "report": report.model_dump()}
+    except Exception as e:
+        print("error assembling pdf:", e)
+        status_reporter.report(job.job_id, "errored", error=str(e))
         return {"result": "error", "error": str(e)}
+    finally:
+        scheduling.release_tenant_slot(job)
+        status_reporter.flush(STATUS_FLUSH_TIMEOUT)
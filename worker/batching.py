@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class DynamicBatcher:
+    """
+    Collects items submitted from concurrent callers into batches of at most
+    max_batch_size, waiting at most max_wait_ms after the first item arrives,
+    and runs each batch through a single process_batch call.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: int,
+    ):
+        self._process_batch = process_batch
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[Any, Future, float]] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Batcher is closed")
+
+            self._pending.append((item, future, time.monotonic()))
+            self._condition.notify()
+
+        return future
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+        self._thread.join()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+
+            if not self._pending:
+                return []
+
+            deadline = self._pending[0][2] + self._max_wait
+
+            while len(self._pending) < self._max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    break
+
+                self._condition.wait(remaining)
+
+            batch = self._pending[: self._max_batch_size]
+            del self._pending[: self._max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+
+            if not batch:
+                return
+
+            try:
+                results = self._run_batch([item for item, _, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+
+                # one bad item fails the whole batch, run the items on their own
+                # so only its caller gets the error
+                for item, future, _ in batch:
+                    try:
+                        (result,) = self._run_batch([item])
+                    except Exception as item_error:
+                        future.set_exception(item_error)
+                    else:
+                        future.set_result(result)
+
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def _run_batch(self, items: List[Any]) -> List[Any]:
+        results = self._process_batch(items)
+
+        if len(results) != len(items):
+            raise RuntimeError(
+                f"Batch returned {len(results)} results for {len(items)} inputs"
+            )
+
+        return results
+
+
+class RequestCoalescer:
+    """
+    Runs one computation per key at a time: callers submitting a key that is
+    already in flight wait for the same result instead of starting another.
+    Results are kept for ttl_seconds, errors are not kept.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024):
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._results: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def submit(self, key: str, start: Callable[[], Future]) -> Tuple[Future, str]:
+        # every caller gets its own future, one cancelling doesn't cancel the
+        # computation the others are waiting for
+        future = Future()
+
+        with self._lock:
+            cached = self._results.get(key)
+
+            if cached is not None and cached[0] > time.monotonic():
+                future.set_result(cached[1])
+                return future, "cached"
+
+            shared = self._in_flight.get(key)
+            outcome = "coalesced"
+
+            if shared is None:
+                shared = self._in_flight[key] = start()
+                outcome = "started"
+
+        if outcome == "started":
+            shared.add_done_callback(lambda done: self._finish(key, done))
+
+        shared.add_done_callback(lambda done: _copy_result(done, future))
+        return future, outcome
+
+    def _finish(self, key: str, done: Future):
+        with self._lock:
+            if self._in_flight.get(key) is done:
+                del self._in_flight[key]
+
+            if (
+                done.cancelled()
+                or done.exception() is not None
+                or self._ttl_seconds <= 0
+            ):
+                return
+
+            now = time.monotonic()
+            self._results[key] = (now + self._ttl_seconds, done.result())
+            self._results.move_to_end(key)
+
+            while self._results and (
+                len(self._results) > self._max_entries
+                or next(iter(self._results.values()))[0] <= now
+            ):
+                self._results.popitem(last=False)
+
+
+def _copy_result(source: Future, destination: Future):
+    try:
+        if source.cancelled():
+            destination.cancel()
+        elif source.exception() is not None:
+            destination.set_exception(source.exception())
+        else:
+            destination.set_result(source.result())
+    except InvalidStateError:
+        # the caller gave up waiting
+        pass
@@ -0,0 +1,282 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from worker import config
+from worker.rendering import PageImage
+
+
+def page_cache_key(image: PageImage, prompt: str, model_name: str) -> str:
+    digest = hashlib.sha256()
+
+    for part in (model_name.encode("utf-8"), prompt.encode("utf-8"), image.data):
+        # length prefix so the parts can't run into each other
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+
+    return digest.hexdigest()
+
+
+class PageCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self._get(key)
+        except Exception as e:
+            print("Error reading page cache:", e)
+            value = None
+
+            with self._stats_lock:
+                self.errors += 1
+
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    def set(self, key: str, value: str):
+        try:
+            self._set(key, value)
+        except Exception as e:
+            print("Error writing page cache:", e)
+
+            with self._stats_lock:
+                self.errors += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    def _get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: str):
+        raise NotImplementedError
+
+
+class DiskLRUCache(PageCache):
+    """
+    Worker processes on a host can share the directory, each keeps its own
+    index of it. The index is rebuilt from the directory every max_bytes / 8
+    bytes written, so together they stay close to max_bytes rather than each
+    growing to it.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int):
+        super().__init__()
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total_bytes = 0
+        self._written_since_scan = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            self._scan()
+            self._evict()
+
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        # files from other processes in the order they were written, then the
+        # ones this process has used in the order it used them
+        known = list(self._entries)
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(entries))
+
+        for key in known:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+        self._total_bytes = sum(self._entries.values())
+        self._written_since_scan = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key)
+
+    def _remove(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self._total_bytes > self._max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+
+            path = self._path(key)
+
+            try:
+                expired = (
+                    self._ttl_seconds > 0
+                    and time.time() - os.path.getmtime(path) > self._ttl_seconds
+                )
+
+                if expired:
+                    self._remove(key)
+                    return None
+
+                with open(path, "r", encoding="utf-8") as fp:
+                    value = fp.read()
+            except FileNotFoundError:
+                self._entries.pop(key, None)
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: str):
+        data = value.encode("utf-8")
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(temp_path, "wb") as fp:
+            fp.write(data)
+
+        # other worker processes may share the directory, so swap in atomically
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._written_since_scan += len(data)
+
+            if self._written_since_scan > self._max_bytes // 8:
+                self._scan()
+
+            self._evict()
+
+
+class RedisPageCache(PageCache):
+    """
+    Entries expire after ttl_seconds. An index sorted by last use and a running
+    total of entry sizes are kept next to them, writes trim the least recently
+    used entries until the total is back under max_bytes, so the cache can't
+    push the broker's own keys out of a shared server.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        max_bytes: int,
+        ttl_seconds: int,
+        prefix: str = "page-cache:",
+    ):
+        super().__init__()
+        self._redis = redis_client
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._prefix = prefix
+        self._index_key = f"{prefix}index"
+        self._sizes_key = f"{prefix}sizes"
+        self._total_key = f"{prefix}total-bytes"
+
+    def _get(self, key: str) -> Optional[str]:
+        value = self._redis.get(self._prefix + key)
+
+        if value is None:
+            return None
+
+        self._redis.zadd(self._index_key, {key: time.time()}, xx=True)
+        return value.decode("utf-8")
+
+    def _set(self, key: str, value: str):
+        data = value.encode("utf-8")
+        previous_size = int(self._redis.hget(self._sizes_key, key) or 0)
+
+        pipeline = self._redis.pipeline()
+        pipeline.set(
+            self._prefix + key,
+            data,
+            ex=self._ttl_seconds if self._ttl_seconds > 0 else None,
+        )
+        pipeline.hset(self._sizes_key, key, len(data))
+        pipeline.zadd(self._index_key, {key: time.time()})
+        pipeline.incrby(self._total_key, len(data) - previous_size)
+        total_bytes = pipeline.execute()[3]
+
+        self._evict(total_bytes)
+
+    def _evict(self, total_bytes: int):
+        while total_bytes > self._max_bytes:
+            # popping is atomic, two workers trimming at once never both
+            # count the same entry
+            popped = self._redis.zpopmin(self._index_key)
+
+            if not popped:
+                return
+
+            keys = [
+                key.decode("utf-8") if isinstance(key, bytes) else key
+                for key, _ in popped
+            ]
+            sizes = self._redis.hmget(self._sizes_key, keys)
+            freed = sum(int(size or 0) for size in sizes)
+
+            pipeline = self._redis.pipeline()
+            pipeline.delete(*[self._prefix + key for key in keys])
+            pipeline.hdel(self._sizes_key, *keys)
+            pipeline.decrby(self._total_key, freed)
+            total_bytes = pipeline.execute()[2]
+
+
+@functools.lru_cache(maxsize=None)
+def get_page_cache() -> Optional[PageCache]:
+    if config.PAGE_CACHE_BACKEND == "disk":
+        return DiskLRUCache(
+            config.PAGE_CACHE_DIR,
+            max_bytes=config.PAGE_CACHE_MAX_BYTES,
+            ttl_seconds=config.PAGE_CACHE_TTL_SECONDS,
+        )
+
+    if config.PAGE_CACHE_BACKEND == "redis":
+        from worker import clients
+
+        if config.PAGE_CACHE_REDIS_URL:
+            import redis
+
+            redis_client = redis.Redis.from_url(config.PAGE_CACHE_REDIS_URL)
+        else:
+            redis_client = clients.get_redis_client()
+
+        return RedisPageCache(
+            redis_client,
+            max_bytes=config.PAGE_CACHE_MAX_BYTES,
+            ttl_seconds=config.PAGE_CACHE_TTL_SECONDS,
+        )
+
+    if config.PAGE_CACHE_BACKEND != "none":
+        raise ValueError(f"Unknown page cache backend: {config.PAGE_CACHE_BACKEND}")
+
+    return None
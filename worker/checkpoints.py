@@ -0,0 +1,89 @@
+import re
+from typing import List, Optional, Tuple
+
+from worker import config
+from worker.types import ConversionCheckpoint
+
+
+def page_number_from_title(title: str) -> int:
+    match = re.fullmatch(r"page_(\d+)\.md", title)
+
+    if match is None:
+        raise ValueError(f"Not a page title: {title}")
+
+    return int(match.group(1))
+
+
+class CheckpointStore:
+    """
+    Keeps the markdown of every finished page and the pipeline state needed to
+    pick a job back up, so a redelivered task only converts the pages that
+    are left.
+    """
+
+    def __init__(self, redis_client, ttl_seconds: int, prefix: str = "checkpoint:"):
+        self._redis = redis_client
+        self._ttl_seconds = ttl_seconds
+        self._prefix = prefix
+
+    def _pages_key(self, job_id: str) -> str:
+        return f"{self._prefix}{job_id}:pages"
+
+    def _state_key(self, job_id: str) -> str:
+        return f"{self._prefix}{job_id}:state"
+
+    def save_page(self, job_id: str, title: str, page: str):
+        pipeline = self._redis.pipeline()
+        pipeline.hset(self._pages_key(job_id), title, page.encode("utf-8"))
+        pipeline.expire(self._pages_key(job_id), self._ttl_seconds)
+        pipeline.execute()
+
+    def save_state(self, job_id: str, checkpoint: ConversionCheckpoint):
+        self._redis.set(
+            self._state_key(job_id),
+            checkpoint.model_dump_json().encode("utf-8"),
+            ex=self._ttl_seconds,
+        )
+
+    def load(
+        self, job_id: str, settings_digest: str
+    ) -> Tuple[Optional[ConversionCheckpoint], List[Tuple[str, str]]]:
+        state = self._redis.get(self._state_key(job_id))
+
+        if state is None:
+            return None, []
+
+        checkpoint = ConversionCheckpoint.model_validate_json(state)
+
+        # pages converted with other settings can't be mixed into this output
+        if checkpoint.settings_digest != settings_digest:
+            self.delete(job_id)
+            return None, []
+
+        pages = [
+            (title.decode("utf-8"), page.decode("utf-8"))
+            for title, page in self._redis.hgetall(self._pages_key(job_id)).items()
+        ]
+        pages = [
+            (title, page)
+            for title, page in pages
+            if page_number_from_title(title) < checkpoint.page_counter
+        ]
+        pages.sort(key=lambda item: page_number_from_title(item[0]))
+
+        return checkpoint, pages
+
+    def delete(self, job_id: str):
+        self._redis.delete(self._pages_key(job_id), self._state_key(job_id))
+
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    if not config.CHECKPOINTS_ENABLED:
+        return None
+
+    from worker import clients
+
+    return CheckpointStore(
+        clients.get_redis_client(),
+        ttl_seconds=config.CHECKPOINT_TTL_SECONDS,
+    )
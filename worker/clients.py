@@ -1,7 +1,33 @@
-from supabase import create_client, Client
+import functools
+
+import redis
 
 from worker import config
 
 
+# clients hold connection pools, so every process keeps a single instance
+@functools.lru_cache(maxsize=None)
 def get_supabase_client():
+    # supabase pulls in a large dependency tree, only import it when used
+    from supabase import create_client
+
     return create_client(config.SUPABASE_URL, config.SUPABASE_PRIVATE_KEY)
+
+
+@functools.lru_cache(maxsize=None)
+def get_storage():
+    if config.STORAGE_BACKEND == "local":
+        from worker.storage import LocalStorage
+
+        return LocalStorage(config.LOCAL_STORAGE_DIR)
+
+    return get_supabase_client().storage
+
+
+@functools.lru_cache(maxsize=None)
+def get_redis_client() -> redis.Redis:
+    return redis.Redis(
+        host=config.REDIS_HOST,
+        port=int(config.REDIS_PORT),
+        db=int(config.REDIS_DB),
+    )
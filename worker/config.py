@@ -13,9 +13,135 @@ SUPABASE_PRIVATE_KEY: str = os.getenv("SUPABASE_PRIVATE_KEY")
 SUPABASE_UPLOADS_BUCKET: str = os.getenv("SUPABASE_UPLOADS_BUCKET", "uploads")
 SUPABASE_JOBS_BUCKET: str = os.getenv("SUPABASE_JOBS_BUCKET", "jobs")
 
+# local keeps buckets as directories under LOCAL_STORAGE_DIR
+STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "supabase")  # supabase|local
+LOCAL_STORAGE_DIR: str = os.getenv("LOCAL_STORAGE_DIR", "/tmp/pdf-comparison-storage")
+
 INFERENCE_API_ENDPOINT: str = os.getenv(
     "INFERENCE_API_ENDPOINT",
     "https://herzo175--pdf-comparison-model-generate.modal.run",
 )
 
 API_ENDPOINT: str = os.getenv("API_ENDPOINT", "http://localhost:3000")
+
+PAGE_PIPELINE_MAX_IN_FLIGHT: int = int(os.getenv("PAGE_PIPELINE_MAX_IN_FLIGHT", "8"))
+PAGE_RENDER_CONCURRENCY: int = int(os.getenv("PAGE_RENDER_CONCURRENCY", "2"))
+# render pages in this many separate processes, 0 renders in the task's own
+# process. Falls back to that when the process can't start children
+PAGE_RENDER_PROCESSES: int = int(os.getenv("PAGE_RENDER_PROCESSES", "0"))
+# with INFERENCE_ADAPTIVE_CONCURRENCY on, the limiter sets how many pages convert
+# at once and pages in flight go up to INFERENCE_MAX_CONCURRENCY
+PAGE_CONVERSION_CONCURRENCY: int = int(os.getenv("PAGE_CONVERSION_CONCURRENCY", "4"))
+
+PAGE_RENDER_DPI: int = int(os.getenv("PAGE_RENDER_DPI", "72"))
+# visual tokens per page, a token covers 28x28 pixels of the page image.
+# dpi|budget|adaptive, see worker.resolution.ResolutionPolicy
+PAGE_RESOLUTION_MODE: str = os.getenv("PAGE_RESOLUTION_MODE", "dpi")
+PAGE_MAX_DPI: int = int(os.getenv("PAGE_MAX_DPI", "200"))
+PAGE_MIN_PIXELS: int = int(os.getenv("PAGE_MIN_PIXELS", str(4 * 28 * 28)))
+PAGE_MAX_PIXELS: int = int(os.getenv("PAGE_MAX_PIXELS", str(1280 * 28 * 28)))
+PAGE_ADAPTIVE_START_PIXELS: int = int(
+    os.getenv("PAGE_ADAPTIVE_START_PIXELS", str(256 * 28 * 28))
+)
+PAGE_IMAGE_FORMAT: str = os.getenv("PAGE_IMAGE_FORMAT", "png")
+PAGE_IMAGE_QUALITY: int = int(os.getenv("PAGE_IMAGE_QUALITY", "85"))
+
+# must match the model served at INFERENCE_API_ENDPOINT, cached pages are keyed on it
+INFERENCE_MODEL_NAME: str = os.getenv(
+    "INFERENCE_MODEL_NAME", "Qwen/Qwen2-VL-7B-Instruct-AWQ"
+)
+
+# json sends page images as base64 data URIs, binary as raw bytes in an envelope
+INFERENCE_WIRE_FORMAT: str = os.getenv("INFERENCE_WIRE_FORMAT", "json")  # json|binary
+# read generated text as it streams and hang up once the page's block is closed
+INFERENCE_STREAMING: bool = os.getenv("INFERENCE_STREAMING", "false") == "true"
+INFERENCE_STREAM_API_ENDPOINT: str = os.getenv(
+    "INFERENCE_STREAM_API_ENDPOINT",
+    "https://herzo175--pdf-comparison-model-generate-stream.modal.run",
+)
+
+PAGE_CACHE_BACKEND: str = os.getenv("PAGE_CACHE_BACKEND", "none")  # none|disk|redis
+PAGE_CACHE_DIR: str = os.getenv("PAGE_CACHE_DIR", "/tmp/pdf-comparison-page-cache")
+PAGE_CACHE_MAX_BYTES: int = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(512 * 1024**2)))
+PAGE_CACHE_TTL_SECONDS: int = int(os.getenv("PAGE_CACHE_TTL_SECONDS", str(7 * 86400)))
+# keeps the redis page cache off the broker's server, the broker's if unset
+PAGE_CACHE_REDIS_URL: str = os.getenv("PAGE_CACHE_REDIS_URL", "")
+
+DOCUMENT_DEDUP_ENABLED: bool = os.getenv("DOCUMENT_DEDUP_ENABLED", "true") == "true"
+DOCUMENT_DEDUP_TTL_SECONDS: int = int(
+    os.getenv("DOCUMENT_DEDUP_TTL_SECONDS", str(30 * 86400))
+)
+
+# off|strict|lenient, can be overridden per job with ParseJob.text_layer_mode
+TEXT_LAYER_MODE: str = os.getenv("TEXT_LAYER_MODE", "strict")
+
+HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_MAX_RETRIES: int = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR: float = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+HTTP_BACKOFF_JITTER: float = float(os.getenv("HTTP_BACKOFF_JITTER", "0.5"))
+INFERENCE_CONNECT_TIMEOUT: float = float(os.getenv("INFERENCE_CONNECT_TIMEOUT", "5"))
+# long enough for a full batch on the server, see REQUEST_TIMEOUT_SECONDS there
+INFERENCE_READ_TIMEOUT: float = float(os.getenv("INFERENCE_READ_TIMEOUT", "300"))
+API_CONNECT_TIMEOUT: float = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT: float = float(os.getenv("API_READ_TIMEOUT", "10"))
+CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = int(
+    os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5")
+)
+CIRCUIT_BREAKER_RESET_SECONDS: float = float(
+    os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30")
+)
+
+# requests in flight to the inference endpoint per worker process, adjusted
+# between the min and max by the error rate and latency it responds with
+INFERENCE_ADAPTIVE_CONCURRENCY: bool = (
+    os.getenv("INFERENCE_ADAPTIVE_CONCURRENCY", "true") == "true"
+)
+INFERENCE_INITIAL_CONCURRENCY: int = int(
+    os.getenv("INFERENCE_INITIAL_CONCURRENCY", "4")
+)
+INFERENCE_MIN_CONCURRENCY: int = int(os.getenv("INFERENCE_MIN_CONCURRENCY", "1"))
+INFERENCE_MAX_CONCURRENCY: int = int(os.getenv("INFERENCE_MAX_CONCURRENCY", "32"))
+INFERENCE_CONCURRENCY_BACKOFF_RATIO: float = float(
+    os.getenv("INFERENCE_CONCURRENCY_BACKOFF_RATIO", "0.7")
+)
+# responses slower than this many times the average count as overload
+INFERENCE_LATENCY_TOLERANCE: float = float(
+    os.getenv("INFERENCE_LATENCY_TOLERANCE", "2")
+)
+
+UPLOAD_CONCURRENCY: int = int(os.getenv("UPLOAD_CONCURRENCY", "8"))
+
+STATUS_UPDATES_PER_SECOND: float = float(os.getenv("STATUS_UPDATES_PER_SECOND", "1"))
+STATUS_TERMINAL_MAX_ATTEMPTS: int = int(os.getenv("STATUS_TERMINAL_MAX_ATTEMPTS", "5"))
+STATUS_FLUSH_TIMEOUT: float = float(os.getenv("STATUS_FLUSH_TIMEOUT", "10"))
+
+CHECKPOINTS_ENABLED: bool = os.getenv("CHECKPOINTS_ENABLED", "true") == "true"
+CHECKPOINT_TTL_SECONDS: int = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(86400)))
+TASK_VISIBILITY_TIMEOUT: int = int(os.getenv("TASK_VISIBILITY_TIMEOUT", str(6 * 3600)))
+
+# documents with at least FANOUT_MIN_PAGES pages are split across workers
+FANOUT_MIN_PAGES: int = int(os.getenv("FANOUT_MIN_PAGES", "100"))
+FANOUT_PAGES_PER_TASK: int = int(os.getenv("FANOUT_PAGES_PER_TASK", "50"))
+
+# route jobs to <JOB_QUEUE_PREFIX>small|medium|large by page count, with the
+# job's priority as the message priority. Workers have to consume those queues
+JOB_ROUTING_ENABLED: bool = os.getenv("JOB_ROUTING_ENABLED", "false") == "true"
+JOB_QUEUE_PREFIX: str = os.getenv("JOB_QUEUE_PREFIX", "pdf.")
+SMALL_JOB_MAX_PAGES: int = int(os.getenv("SMALL_JOB_MAX_PAGES", "10"))
+MEDIUM_JOB_MAX_PAGES: int = int(os.getenv("MEDIUM_JOB_MAX_PAGES", "100"))
+# jobs whose page count can't be read from the source file are sized up from
+# its file size, at this many bytes per page
+ESTIMATED_PAGE_BYTES: int = int(os.getenv("ESTIMATED_PAGE_BYTES", str(100 * 1024)))
+# high|normal|low, for jobs that don't set one
+JOB_DEFAULT_PRIORITY: str = os.getenv("JOB_DEFAULT_PRIORITY", "normal")
+# jobs a tenant may run at once in each queue, 0 for no limit. Jobs over the
+# limit go back on their queue after TENANT_DEFER_SECONDS
+TENANT_MAX_ACTIVE_JOBS: int = int(os.getenv("TENANT_MAX_ACTIVE_JOBS", "4"))
+TENANT_DEFER_SECONDS: float = float(os.getenv("TENANT_DEFER_SECONDS", "10"))
+
+# off swaps in a no-op recorder, metrics are exported in the Prometheus format
+TELEMETRY_ENABLED: bool = os.getenv("TELEMETRY_ENABLED", "true") == "true"
+# print every timing span as a JSON line, with job and page IDs
+TELEMETRY_LOG_SPANS: bool = os.getenv("TELEMETRY_LOG_SPANS", "false") == "true"
+# workers write worker-<pid>.prom here after every task, for node_exporter
+TELEMETRY_TEXTFILE_DIR: str = os.getenv("TELEMETRY_TEXTFILE_DIR", "")
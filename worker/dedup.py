@@ -0,0 +1,94 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from worker import config
+
+
+def get_storage_fingerprint(metadata: Optional[dict]) -> Optional[str]:
+    # storage ETags are content hashes, so two uploads of the same bytes match
+    if not metadata or not metadata.get("eTag"):
+        return None
+
+    etag = metadata["eTag"].strip('"')
+    return f"etag:{etag}:{metadata.get('size', '')}"
+
+
+def get_file_fingerprint(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as fp:
+        while chunk := fp.read(chunk_size):
+            digest.update(chunk)
+
+    return f"sha256:{digest.hexdigest()}"
+
+
+@dataclass
+class IndexedOutput:
+    output_path: str
+    # markdown outputs also publish a file per page next to the document, None
+    # for entries recorded before they were listed
+    page_files: Optional[List[str]] = field(default_factory=list)
+
+
+class DocumentIndex:
+    """
+    Maps document fingerprints to the output of the job that first converted
+    them. Keys are scoped by a digest of the conversion settings, so changing
+    the model or prompts never serves stale output.
+    """
+
+    def __init__(self, redis_client, settings_digest: str, ttl_seconds: int):
+        self._redis = redis_client
+        self._settings_digest = settings_digest
+        self._ttl_seconds = ttl_seconds
+
+    def _key(self, fingerprint: str) -> str:
+        return f"document-output:{self._settings_digest}:{fingerprint}"
+
+    def lookup(self, fingerprint: str) -> Optional[IndexedOutput]:
+        value = self._redis.get(self._key(fingerprint))
+
+        if value is None:
+            return None
+
+        value = value.decode("utf-8")
+
+        if not value.startswith("{"):
+            return IndexedOutput(output_path=value, page_files=None)
+
+        return IndexedOutput(**json.loads(value))
+
+    def record(
+        self,
+        fingerprints: Iterable[Optional[str]],
+        output_path: str,
+        page_files: Iterable[str] = (),
+    ):
+        value = json.dumps({"output_path": output_path, "page_files": list(page_files)})
+
+        for fingerprint in fingerprints:
+            if fingerprint is not None:
+                self._redis.set(
+                    self._key(fingerprint),
+                    value.encode("utf-8"),
+                    ex=self._ttl_seconds if self._ttl_seconds > 0 else None,
+                )
+
+    def forget(self, fingerprint: str):
+        self._redis.delete(self._key(fingerprint))
+
+
+def get_document_index(settings_digest: str) -> Optional[DocumentIndex]:
+    if not config.DOCUMENT_DEDUP_ENABLED:
+        return None
+
+    from worker import clients
+
+    return DocumentIndex(
+        clients.get_redis_client(),
+        settings_digest=settings_digest,
+        ttl_seconds=config.DOCUMENT_DEDUP_TTL_SECONDS,
+    )
@@ -0,0 +1,364 @@
+import contextlib
+import functools
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from worker import config
+from worker.telemetry import get_telemetry
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects requests
+    until reset_timeout has passed, then lets a single trial request through.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+
+            if (
+                time.monotonic() - self._opened_at < self._reset_timeout
+                or self._trial_in_flight
+            ):
+                raise CircuitOpenError("Circuit breaker is open, endpoint is down")
+
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+
+            if self._opened_at is not None or self._failures >= self._failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def release_trial(self):
+        # a trial that ended without an outcome, e.g. an unexpected error,
+        # mustn't keep every later request out
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def get_backoff_seconds(
+    attempt: int,
+    backoff_factor: float = config.HTTP_BACKOFF_FACTOR,
+    backoff_jitter: float = config.HTTP_BACKOFF_JITTER,
+) -> float:
+    # the same schedule urllib3 uses between retries
+    return backoff_factor * 2**attempt + random.uniform(0, backoff_jitter)
+
+
+def is_overload_error(error: Exception) -> bool:
+    if isinstance(
+        error,
+        (
+            CircuitOpenError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ConnectionError,
+        ),
+    ):
+        return True
+
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code in RETRYABLE_STATUSES
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Caps the requests in flight to an endpoint and moves the cap with what the
+    endpoint can take (AIMD). The limit grows by one per limit's worth of
+    successes while it is the bottleneck, and shrinks by backoff_ratio on
+    overload errors or a response slower than latency_tolerance times the
+    average. Cuts are at least one average latency apart, so a burst of
+    failures from one overload only counts once.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff_ratio: float = 0.7,
+        latency_tolerance: float = 2.0,
+        smoothing: float = 0.05,
+        name: str = "inference",
+    ):
+        self.name = name
+        self._limit = min(max(float(initial_limit), min_limit), max_limit)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._backoff_ratio = backoff_ratio
+        self._latency_tolerance = latency_tolerance
+        self._smoothing = smoothing
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._average_latency: Optional[float] = None
+        self._last_decrease = float("-inf")
+
+    @property
+    def limit(self) -> float:
+        with self._condition:
+            return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        with self._condition:
+            return self._in_flight
+
+    @contextlib.contextmanager
+    def acquire(self):
+        telemetry = get_telemetry()
+        waited_from = time.monotonic()
+
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+
+            self._in_flight += 1
+            saturated = self._in_flight >= int(self._limit)
+
+        started = time.monotonic()
+        telemetry.observe(
+            "limiter_wait_seconds", started - waited_from, client=self.name
+        )
+
+        try:
+            yield
+        except Exception as e:
+            outcome = "overload" if is_overload_error(e) else "error"
+            self._release(time.monotonic() - started, saturated, outcome)
+            raise
+        else:
+            self._release(time.monotonic() - started, saturated, "success")
+
+    def _release(self, latency: float, saturated: bool, outcome: str):
+        telemetry = get_telemetry()
+        decrease = None
+
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+
+            # other errors say nothing about load, they don't move the limit
+            if outcome == "error":
+                pass
+            elif outcome == "overload":
+                decrease = "overload"
+            elif self._average_latency is None:
+                self._average_latency = latency
+            else:
+                if latency > self._latency_tolerance * self._average_latency:
+                    decrease = "latency"
+
+                self._average_latency += self._smoothing * (
+                    latency - self._average_latency
+                )
+
+            if decrease is not None:
+                if now - self._last_decrease >= (self._average_latency or 0):
+                    self._limit = max(
+                        self._limit * self._backoff_ratio, self._min_limit
+                    )
+                    self._last_decrease = now
+                else:
+                    decrease = None
+            elif saturated and outcome == "success":
+                self._limit = min(self._limit + 1 / self._limit, self._max_limit)
+
+            limit, in_flight = self._limit, self._in_flight
+            self._condition.notify_all()
+
+        if decrease is not None:
+            telemetry.counter(
+                "limiter_decreases_total", client=self.name, reason=decrease
+            )
+
+        telemetry.gauge("concurrency_limit", limit, client=self.name)
+        telemetry.gauge("requests_in_flight", in_flight, client=self.name)
+
+
+class HttpClient:
+    def __init__(
+        self,
+        base_url: str,
+        connect_timeout: float,
+        read_timeout: float,
+        max_retries: int = config.HTTP_MAX_RETRIES,
+        backoff_factor: float = config.HTTP_BACKOFF_FACTOR,
+        backoff_jitter: float = config.HTTP_BACKOFF_JITTER,
+        pool_size: int = config.HTTP_POOL_SIZE,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        name: str = "http",
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(
+            failure_threshold=config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=config.CIRCUIT_BREAKER_RESET_SECONDS,
+        )
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            status_forcelist=RETRYABLE_STATUSES,
+            allowed_methods=None,  # inference and status updates are safe to repeat
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, path: str = "", **kwargs) -> requests.Response:
+        telemetry = get_telemetry()
+
+        try:
+            self.circuit_breaker.before_request()
+        except CircuitOpenError:
+            telemetry.counter("http_circuit_open_total", client=self.name)
+            raise
+
+        try:
+            return self._send(method, path, telemetry, **kwargs)
+        finally:
+            self.circuit_breaker.release_trial()
+
+    def _send(self, method: str, path: str, telemetry, **kwargs) -> requests.Response:
+        try:
+            response = self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                timeout=kwargs.pop("timeout", self.timeout),
+                **kwargs,
+            )
+        except requests.exceptions.RequestException as e:
+            self.circuit_breaker.record_failure()
+            telemetry.counter(
+                "http_requests_total", client=self.name, status=type(e).__name__
+            )
+            raise
+
+        # urllib3 records the retries it made on the way to this response
+        retries = getattr(response.raw, "retries", None)
+
+        if retries is not None and retries.history:
+            telemetry.counter(
+                "http_retries_total", len(retries.history), client=self.name
+            )
+
+        telemetry.counter(
+            "http_requests_total", client=self.name, status=response.status_code
+        )
+
+        if response.status_code in RETRYABLE_STATUSES:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+
+        return response
+
+    def post(self, path: str = "", **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str = "", **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def get_inference_max_retries() -> int:
+    # retried inside a limiter slot, an overloaded endpoint that answers on a
+    # retry looks like a success to the limiter. With it on, call_inference_api
+    # retries with a fresh slot instead
+    if config.INFERENCE_ADAPTIVE_CONCURRENCY:
+        return 0
+
+    return config.HTTP_MAX_RETRIES
+
+
+@functools.lru_cache(maxsize=None)
+def get_inference_client() -> HttpClient:
+    return HttpClient(
+        config.INFERENCE_API_ENDPOINT,
+        connect_timeout=config.INFERENCE_CONNECT_TIMEOUT,
+        read_timeout=config.INFERENCE_READ_TIMEOUT,
+        max_retries=get_inference_max_retries(),
+        name="inference",
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_inference_stream_client() -> HttpClient:
+    return HttpClient(
+        config.INFERENCE_STREAM_API_ENDPOINT,
+        connect_timeout=config.INFERENCE_CONNECT_TIMEOUT,
+        read_timeout=config.INFERENCE_READ_TIMEOUT,
+        max_retries=get_inference_max_retries(),
+        name="inference_stream",
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_inference_limiter() -> Optional[AdaptiveConcurrencyLimiter]:
+    # shared by every task and pipeline thread in this process
+    if not config.INFERENCE_ADAPTIVE_CONCURRENCY:
+        return None
+
+    return AdaptiveConcurrencyLimiter(
+        initial_limit=config.INFERENCE_INITIAL_CONCURRENCY,
+        min_limit=config.INFERENCE_MIN_CONCURRENCY,
+        max_limit=config.INFERENCE_MAX_CONCURRENCY,
+        backoff_ratio=config.INFERENCE_CONCURRENCY_BACKOFF_RATIO,
+        latency_tolerance=config.INFERENCE_LATENCY_TOLERANCE,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_api_client() -> HttpClient:
+    return HttpClient(
+        config.API_ENDPOINT,
+        connect_timeout=config.API_CONNECT_TIMEOUT,
+        read_timeout=config.API_READ_TIMEOUT,
+        name="api",
+    )
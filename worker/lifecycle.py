@@ -0,0 +1,90 @@
+from worker import (
+    cache,
+    clients,
+    config,
+    http_client,
+    notifications,
+    render_pool,
+    telemetry,
+)
+
+# process wide singletons, in the order they are created
+CACHED_FACTORIES = (
+    telemetry.get_telemetry,
+    clients.get_supabase_client,
+    clients.get_storage,
+    clients.get_redis_client,
+    http_client.get_inference_client,
+    http_client.get_inference_stream_client,
+    http_client.get_inference_limiter,
+    http_client.get_api_client,
+    cache.get_page_cache,
+    notifications.get_status_reporter,
+    render_pool.get_render_pool,
+)
+
+
+def _created(factory) -> bool:
+    return factory.cache_info().currsize > 0
+
+
+def reset_process_state():
+    # anything created before a fork shares sockets, locks and threads with
+    # the parent, a child process has to start from fresh instances
+    for factory in CACHED_FACTORIES:
+        factory.cache_clear()
+
+
+def init_process():
+    """
+    Sets up a worker process after fork: long lived clients, the status
+    reporter thread, the page cache index and fitz/PIL state, so the first
+    job doesn't pay for them.
+    """
+    from worker import processor
+
+    reset_process_state()
+
+    if config.TELEMETRY_TEXTFILE_DIR:
+        telemetry.remove_stale_textfiles(config.TELEMETRY_TEXTFILE_DIR)
+
+    clients.get_storage()
+    http_client.get_inference_client()
+    http_client.get_inference_limiter()
+    http_client.get_api_client()
+    notifications.get_status_reporter()
+
+    if (
+        config.CHECKPOINTS_ENABLED
+        or config.DOCUMENT_DEDUP_ENABLED
+        or config.PAGE_CACHE_BACKEND == "redis"
+    ):
+        clients.get_redis_client()
+
+    cache.get_page_cache()
+    processor.warm_up_rendering()
+    render_pool.get_render_pool()
+
+
+def shutdown_process():
+    if _created(notifications.get_status_reporter):
+        notifications.get_status_reporter().close(config.STATUS_FLUSH_TIMEOUT)
+
+    for factory in (
+        http_client.get_inference_client,
+        http_client.get_inference_stream_client,
+        http_client.get_api_client,
+    ):
+        if _created(factory):
+            factory().close()
+
+    if _created(clients.get_redis_client):
+        clients.get_redis_client().close()
+
+    if _created(render_pool.get_render_pool) and render_pool.get_render_pool():
+        render_pool.get_render_pool().close()
+
+    if config.TELEMETRY_TEXTFILE_DIR:
+        telemetry.remove_textfile(config.TELEMETRY_TEXTFILE_DIR)
+
+    reset_process_state()
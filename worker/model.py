@@ -1,40 +1,90 @@
-from typing import Optional, List, Dict
+import os
+import threading
+from typing import Iterator, Optional, List, Dict
 
-from transformers import AutoProcessor, AutoModel
+from transformers import (
+    AutoProcessor,
+    AutoModel,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
 from qwen_vl_utils import process_vision_info
 import torch
 
+from worker.streaming import MARKDOWN_FENCE, has_closed_markdown_blocks
+from worker.telemetry import COUNT_BUCKETS, get_telemetry
+
 MODEL_CACHE_PATH = "/model"
 PROCESSOR_CACHE_PATH = "/processor"
 MODEL_NAME = "Qwen/Qwen2-VL-7B-Instruct-AWQ"
 
+# deployment wide visual token budget, requests can ask for less but not more
+MIN_PIXELS = int(os.getenv("MODEL_MIN_PIXELS", str(4 * 28 * 28)))
+MAX_PIXELS = int(os.getenv("MODEL_MAX_PIXELS", str(1280 * 28 * 28)))
+
+MAX_NEW_TOKENS = 4096
+WARMUP_NEW_TOKENS = 8
+
+
+def has_local_snapshot(path: str) -> bool:
+    # written by save_pretrained when the image is built
+    return os.path.exists(os.path.join(path, "config.json"))
+
 
 def get_model():
-    import os
     from transformers import Qwen2VLForConditionalGeneration
 
-    return Qwen2VLForConditionalGeneration.from_pretrained(
-        MODEL_NAME,
+    model_kwargs = dict(
         # torch_dtype="auto",
         torch_dtype=torch.bfloat16,
         attn_implementation="flash_attention_2",
         device_map="auto",
         # device_map="cuda:0",
+    )
+
+    # the snapshot baked into the image loads without any hub requests, and
+    # its safetensors are memory mapped instead of read and copied
+    if has_local_snapshot(MODEL_CACHE_PATH):
+        return Qwen2VLForConditionalGeneration.from_pretrained(
+            MODEL_CACHE_PATH,
+            local_files_only=True,
+            use_safetensors=True,
+            **model_kwargs,
+        )
+
+    return Qwen2VLForConditionalGeneration.from_pretrained(
+        MODEL_NAME,
         token=os.environ["HF_TOKEN"],
         cache_dir=MODEL_CACHE_PATH,
+        **model_kwargs,
     )
 
 
 def get_processor():
     from transformers import AutoProcessor
 
-    return AutoProcessor.from_pretrained(
-        MODEL_NAME,
-        # min_pixels=min_pixels,
-        # max_pixels=max_pixels,
-        cache_dir=PROCESSOR_CACHE_PATH,
+    if has_local_snapshot(PROCESSOR_CACHE_PATH):
+        source = dict(
+            pretrained_model_name_or_path=PROCESSOR_CACHE_PATH,
+            local_files_only=True,
+        )
+    else:
+        source = dict(
+            pretrained_model_name_or_path=MODEL_NAME,
+            cache_dir=PROCESSOR_CACHE_PATH,
+        )
+
+    processor = AutoProcessor.from_pretrained(
+        **source,
+        min_pixels=MIN_PIXELS,
+        max_pixels=MAX_PIXELS,
     )
 
+    # batched generation appends new tokens on the right of every row
+    processor.tokenizer.padding_side = "left"
+
+    return processor
+
 
 # messages = [
 #     {
@@ -50,35 +100,178 @@ def get_processor():
 # ]
 
 
-def run_inference(
-    messages: List[dict],  # List[InferenceMessage]
-    processor: AutoProcessor,
-    model: AutoModel,
-) -> List[str]:
+class MarkdownBlockStoppingCriteria(StoppingCriteria):
+    """
+    Stops each row of a batch once it has closed the number of markdown
+    blocks its request asked for, or once cancelled is set.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        prompt_length: int,
+        stop_after_blocks: List[Optional[int]],
+        cancelled: Optional[threading.Event] = None,
+    ):
+        self._tokenizer = tokenizer
+        self._prompt_length = prompt_length
+        self._stop_after_blocks = stop_after_blocks
+        self._cancelled = cancelled
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs):
+        done = []
+
+        for row, blocks in zip(input_ids, self._stop_after_blocks):
+            # only decode the whole row when the newest tokens could end a fence
+            tail = self._tokenizer.decode(row[-4:], skip_special_tokens=True)
+
+            done.append(
+                MARKDOWN_FENCE[0] in tail
+                and has_closed_markdown_blocks(
+                    self._tokenizer.decode(
+                        row[self._prompt_length :], skip_special_tokens=True
+                    ),
+                    blocks,
+                )
+            )
+
+        if self._cancelled is not None and self._cancelled.is_set():
+            done = [True] * len(done)
+
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+def warmup(processor: AutoProcessor, model: AutoModel):
+    from PIL import Image
+
+    # the first generate call pays for CUDA context setup and kernel selection,
+    # run it before the container takes requests
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "image": Image.new("RGB", (56, 56), "white"),
+                    "resized_width": 56,
+                    "resized_height": 56,
+                },
+                {"type": "text", "text": "Convert this image to markdown."},
+            ],
+        }
+    ]
+    inputs = prepare_inputs([messages], processor)
+
+    with torch.inference_mode():
+        model.generate(**inputs, max_new_tokens=WARMUP_NEW_TOKENS)
+
+
+def prepare_inputs(batch: List[List[dict]], processor: AutoProcessor):
     # Preprocess the inputs
-    text = processor.apply_chat_template(
-        messages, tokenize=False, add_generation_prompt=True
-    )
+    texts = [
+        processor.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True
+        )
+        for messages in batch
+    ]
 
-    image_inputs, video_inputs = process_vision_info(messages)
+    image_inputs, video_inputs = process_vision_info(batch)
 
     # Preparation for inference
     inputs = processor(
-        text=[text],
+        text=texts,
         images=image_inputs,
         videos=video_inputs,
         padding=True,
         return_tensors="pt",
     )
-    inputs = inputs.to("cuda")
+    return inputs.to("cuda")
+
+
+def run_inference(
+    messages: List[dict],  # List[InferenceMessage]
+    processor: AutoProcessor,
+    model: AutoModel,
+) -> List[str]:
+    return run_batch_inference([messages], processor=processor, model=model)
+
+
+def run_batch_inference(
+    batch: List[List[dict]],  # List[List[InferenceMessage]]
+    processor: AutoProcessor,
+    model: AutoModel,
+    stop_after_blocks: Optional[List[Optional[int]]] = None,
+) -> List[str]:
+    telemetry = get_telemetry()
+
+    with telemetry.span("preprocess", batch_size=len(batch)):
+        inputs = prepare_inputs(batch, processor)
+
+    stopping_criteria = MarkdownBlockStoppingCriteria(
+        processor.tokenizer,
+        prompt_length=inputs.input_ids.shape[1],
+        stop_after_blocks=stop_after_blocks or [None] * len(batch),
+    )
 
     # Inference: Generation of the output
-    output_ids = model.generate(**inputs, max_new_tokens=4096)
+    with telemetry.span("generate", batch_size=len(batch)):
+        output_ids = model.generate(
+            **inputs,
+            max_new_tokens=MAX_NEW_TOKENS,
+            stopping_criteria=StoppingCriteriaList([stopping_criteria]),
+        )
+
     generated_ids = [
         output_ids[len(input_ids) :]
         for input_ids, output_ids in zip(inputs.input_ids, output_ids)
     ]
 
+    telemetry.observe("batch_size", len(batch), COUNT_BUCKETS)
+    telemetry.counter("prompt_tokens_total", int(inputs.attention_mask.sum()))
+
+    for ids in generated_ids:
+        tokens = int((ids != processor.tokenizer.pad_token_id).sum())
+        telemetry.counter("generated_tokens_total", tokens)
+        telemetry.observe("generated_tokens", tokens, COUNT_BUCKETS)
+
     return processor.batch_decode(
         generated_ids, skip_special_tokens=True, clean_up_tokenization_spaces=True
     )
+
+
+def stream_inference(
+    messages: List[dict],  # List[InferenceMessage]
+    processor: AutoProcessor,
+    model: AutoModel,
+    stop_after_blocks: Optional[int] = None,
+    cancelled: Optional[threading.Event] = None,
+) -> Iterator[str]:
+    from transformers import TextIteratorStreamer
+
+    inputs = prepare_inputs([messages], processor)
+    streamer = TextIteratorStreamer(
+        processor.tokenizer, skip_prompt=True, skip_special_tokens=True
+    )
+    stopping_criteria = MarkdownBlockStoppingCriteria(
+        processor.tokenizer,
+        prompt_length=inputs.input_ids.shape[1],
+        stop_after_blocks=[stop_after_blocks],
+        cancelled=cancelled,
+    )
+
+    # generate pushes decoded text into the streamer from its own thread
+    thread = threading.Thread(
+        target=model.generate,
+        kwargs=dict(
+            **inputs,
+            max_new_tokens=MAX_NEW_TOKENS,
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([stopping_criteria]),
+        ),
+    )
+    thread.start()
+
+    try:
+        yield from streamer
+    finally:
+        thread.join()
@@ -1,3 +1,157 @@
-def update_status(status: str, message: str):
-    # TODO: call API to update status
-    pass
+import atexit
+import functools
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from worker import config, http_client
+
+TERMINAL_STATUSES = ("completed", "errored")
+
+
+def send_status(job_id: str, payload: dict):
+    response = http_client.get_api_client().put(f"/api/jobs/{job_id}", json=payload)
+    response.raise_for_status()
+
+
+class StatusReporter:
+    """
+    Sends job status updates from a background thread. Updates for the same
+    job are coalesced into the latest one and sent at most once per
+    min_interval seconds, terminal statuses skip the rate limit and are
+    retried until they go through or max_attempts runs out.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, dict], None] = send_status,
+        min_interval: float = 1 / config.STATUS_UPDATES_PER_SECOND,
+        max_attempts: int = config.STATUS_TERMINAL_MAX_ATTEMPTS,
+        retry_delay: float = 1.0,
+    ):
+        self._send = send
+        self._min_interval = min_interval
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._condition = threading.Condition()
+        self._pending: Dict[str, dict] = {}
+        self._last_sent: Dict[str, float] = {}
+        self._sending = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def report(
+        self,
+        job_id: str,
+        status: str,
+        pages_done: Optional[int] = None,
+        pages_total: Optional[int] = None,
+        error: Optional[str] = None,
+    ):
+        payload = {"status": status}
+
+        if pages_done is not None:
+            payload["progress"] = {"pages_done": pages_done, "pages_total": pages_total}
+
+        if error is not None:
+            payload["error"] = error
+
+        with self._condition:
+            self._pending[job_id] = payload
+            self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._condition:
+            # rate limited updates are due immediately once a flush is waiting
+            self._last_sent.clear()
+            self._condition.notify_all()
+
+            while self._pending or self._sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+
+                if remaining is not None and remaining <= 0:
+                    return False
+
+                self._condition.wait(remaining)
+
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        self.flush(timeout)
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        self._thread.join(timeout)
+
+    def _is_due(self, job_id: str, payload: dict, now: float) -> bool:
+        if payload["status"] in TERMINAL_STATUSES or job_id not in self._last_sent:
+            return True
+
+        return now - self._last_sent[job_id] >= self._min_interval
+
+    def _next_update(self):
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+
+                now = time.monotonic()
+                wait = None
+
+                for job_id, payload in self._pending.items():
+                    if self._is_due(job_id, payload, now):
+                        del self._pending[job_id]
+                        self._sending += 1
+                        return job_id, payload
+
+                    due_in = self._last_sent[job_id] + self._min_interval - now
+                    wait = due_in if wait is None else min(wait, due_in)
+
+                self._condition.wait(wait)
+
+    def _deliver(self, job_id: str, payload: dict):
+        attempts = self._max_attempts if payload["status"] in TERMINAL_STATUSES else 1
+
+        for attempt in range(1, attempts + 1):
+            try:
+                self._send(job_id, payload)
+                return
+            except Exception as e:
+                print(f"Error updating job status ({attempt}/{attempts}):", e)
+
+                if attempt < attempts:
+                    time.sleep(self._retry_delay * attempt)
+
+    def _run(self):
+        while True:
+            update = self._next_update()
+
+            if update is None:
+                return
+
+            job_id, payload = update
+
+            try:
+                self._deliver(job_id, payload)
+            finally:
+                with self._condition:
+                    self._sending -= 1
+
+                    if payload["status"] in TERMINAL_STATUSES:
+                        self._last_sent.pop(job_id, None)
+                    else:
+                        self._last_sent[job_id] = time.monotonic()
+
+                    self._condition.notify_all()
+
+
+@functools.lru_cache(maxsize=None)
+def get_status_reporter() -> StatusReporter:
+    reporter = StatusReporter()
+    atexit.register(reporter.close, config.STATUS_FLUSH_TIMEOUT)
+    return reporter
@@ -0,0 +1,170 @@
+import gzip
+import json
+import struct
+from typing import BinaryIO, Callable, List, Optional
+
+# Page pack, every page compressed on its own so one page can be read with
+# ranged reads without fetching the rest of the document:
+#
+#   magic (4 bytes) | version (1 byte) | codec (1 byte)
+#   page frames, one gzip member or zstd frame per page
+#   index (JSON: codec, and offset, length and size of every page)
+#   index offset (uint64) | index length (uint32) | magic (4 bytes)
+#
+# a reader fetches the fixed size footer from the end, then the index, then
+# the frames of the pages it wants.
+MAGIC = b"PDFP"
+VERSION = 1
+CODECS = {"gzip": 1, "zstd": 2}
+HEADER = struct.Struct(">4sBB")
+FOOTER = struct.Struct(">QI4s")
+
+PAGE_PACK_CONTENT_TYPE = "application/vnd.pdf-comparison.mdpack"
+
+# output_format -> (file extension, codec)
+OUTPUT_FORMATS = {
+    "md": (".md", None),
+    "mdpack": (".mdpack", "gzip"),
+    "mdpack+gzip": (".mdpack", "gzip"),
+    "mdpack+zstd": (".mdpack", "zstd"),
+}
+
+
+def normalize_output_format(output_format: str) -> str:
+    # every job got markdown before output_format was read, older clients
+    # still send other values. Checked once when the job is validated
+    if output_format in OUTPUT_FORMATS or output_format.startswith("mdpack"):
+        return output_format
+
+    print(f"Unknown output format {output_format!r}, writing markdown")
+    return "md"
+
+
+def get_output_format(output_format: Optional[str]):
+    if output_format in OUTPUT_FORMATS:
+        return OUTPUT_FORMATS[output_format]
+
+    # a page pack asked for by name mustn't quietly turn into markdown
+    if output_format and output_format.startswith("mdpack"):
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+    return OUTPUT_FORMATS["md"]
+
+
+def _get_codec(codec: str, level: Optional[int] = None):
+    if codec == "gzip":
+        return (
+            lambda data: gzip.compress(data, compresslevel=level or 6, mtime=0),
+            gzip.decompress,
+        )
+
+    if codec == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd output needs the zstandard package")
+
+        return (
+            zstandard.ZstdCompressor(level=level or 3).compress,
+            zstandard.ZstdDecompressor().decompress,
+        )
+
+    raise ValueError(f"Unsupported codec: {codec}")
+
+
+class MarkdownWriter:
+    # the whole document as one markdown file, pages separated by a newline
+    def __init__(self, fp: BinaryIO):
+        self._fp = fp
+        self._pages = 0
+
+    def write_page(self, page: str, title: str):
+        if self._pages > 0:
+            self._fp.write(b"\n")
+
+        self._fp.write(page.encode("utf-8"))
+        self._pages += 1
+
+    def finish(self):
+        pass
+
+
+class PagePackWriter:
+    def __init__(self, fp: BinaryIO, codec: str, level: Optional[int] = None):
+        self._fp = fp
+        self._codec = codec
+        self._compress, _ = _get_codec(codec, level)
+        self._pages: List[dict] = []
+        self._offset = HEADER.size
+        fp.write(HEADER.pack(MAGIC, VERSION, CODECS[codec]))
+
+    def write_page(self, page: str, title: str):
+        data = page.encode("utf-8")
+        frame = self._compress(data)
+        self._fp.write(frame)
+        self._pages.append(
+            {
+                "title": title,
+                "offset": self._offset,
+                "length": len(frame),
+                "size": len(data),
+            }
+        )
+        self._offset += len(frame)
+
+    def finish(self):
+        index = json.dumps({"codec": self._codec, "pages": self._pages}).encode("utf-8")
+        self._fp.write(index)
+        self._fp.write(FOOTER.pack(self._offset, len(index), MAGIC))
+
+
+def get_output_writer(fp: BinaryIO, output_format: str, level: Optional[int] = None):
+    _, codec = get_output_format(output_format)
+
+    if codec is None:
+        return MarkdownWriter(fp)
+
+    return PagePackWriter(fp, codec, level)
+
+
+class PagePackReader:
+    """
+    Reads pages out of a page pack through read_range(offset, length), e.g. a
+    ranged GET against storage, fetching only the footer, index and the
+    frames that are asked for.
+    """
+
+    def __init__(self, read_range: Callable[[int, int], bytes], size: int):
+        self._read_range = read_range
+
+        if size < HEADER.size + FOOTER.size:
+            raise ValueError("Not a page pack")
+
+        index_offset, index_length, magic = FOOTER.unpack(
+            read_range(size - FOOTER.size, FOOTER.size)
+        )
+
+        if magic != MAGIC or index_offset + index_length + FOOTER.size != size:
+            raise ValueError("Not a page pack")
+
+        index = json.loads(read_range(index_offset, index_length))
+        self.codec = index["codec"]
+        self.pages = index["pages"]
+        _, self._decompress = _get_codec(self.codec)
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def read_page(self, page_number: int) -> str:
+        page = self.pages[page_number]
+        frame = self._read_range(page["offset"], page["length"])
+        return self._decompress(frame).decode("utf-8")
+
+    @classmethod
+    def from_file(cls, fp) -> "PagePackReader":
+        def read_range(offset: int, length: int) -> bytes:
+            fp.seek(offset)
+            return fp.read(length)
+
+        fp.seek(0, 2)
+        return cls(read_range, fp.tell())
@@ -0,0 +1,313 @@
+import re
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Reads a PDF's page count through read_range(offset, length), e.g. a ranged
+# GET against storage: the trailer at the end of the file points at the cross
+# reference sections, those at the catalog, and the catalog at the root of the
+# page tree, whose /Count is the number of pages. A few small reads instead of
+# downloading the document.
+
+TAIL_BYTES = 1024
+CHUNK_BYTES = 4096
+MAX_OBJECT_BYTES = 4 * 1024 * 1024
+# /Prev chains, one section per incremental update
+MAX_XREF_SECTIONS = 32
+
+STARTXREF = re.compile(rb"startxref\s+(\d+)")
+OBJECT_HEADER = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj\b")
+REFERENCE = rb"\s+(\d+)\s+\d+\s+R"
+
+
+class PdfPageCountError(ValueError):
+    pass
+
+
+def _int_entry(dictionary: bytes, name: bytes) -> Optional[int]:
+    match = re.search(rb"/" + name + rb"\s+(\d+)(?!\s+\d+\s+R)", dictionary)
+    return int(match.group(1)) if match else None
+
+
+def _reference_entry(dictionary: bytes, name: bytes) -> Optional[int]:
+    match = re.search(rb"/" + name + REFERENCE, dictionary)
+    return int(match.group(1)) if match else None
+
+
+def _array_entry(dictionary: bytes, name: bytes) -> Optional[list]:
+    match = re.search(rb"/" + name + rb"\s*\[([\d\s]*)\]", dictionary)
+    return [int(value) for value in match.group(1).split()] if match else None
+
+
+def _png_unpredict(data: bytes, columns: int) -> bytes:
+    rows = []
+    previous = bytearray(columns)
+
+    for start in range(0, len(data), columns + 1):
+        kind, row = data[start], bytearray(data[start + 1 : start + 1 + columns])
+
+        for i in range(len(row)):
+            left = row[i - 1] if i > 0 else 0
+            up = previous[i]
+            up_left = previous[i - 1] if i > 0 else 0
+
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                estimate = left + up - up_left
+                nearest = min(
+                    (abs(estimate - left), left),
+                    (abs(estimate - up), up),
+                    (abs(estimate - up_left), up_left),
+                    key=lambda candidate: candidate[0],
+                )[1]
+                row[i] = (row[i] + nearest) & 0xFF
+
+        rows.append(bytes(row))
+        previous = row
+
+    return b"".join(rows)
+
+
+class _PdfReader:
+    def __init__(self, read_range: Callable[[int, int], bytes], size: int):
+        self._read_range = read_range
+        self._size = size
+        # object number -> ("offset", offset) or ("stream", stream number, index)
+        self._locations: Dict[int, tuple] = {}
+        # cross reference table subsections as (first object, count, offset),
+        # newest first. Their entries are read when an object is looked up
+        self._subsections: List[Tuple[int, int, int]] = []
+        self._trailer = b""
+
+    def _read(self, offset: int, length: int) -> bytes:
+        length = min(length, self._size - offset)
+
+        if offset < 0 or length <= 0:
+            raise PdfPageCountError("Read outside the file")
+
+        return self._read_range(offset, length)
+
+    def _read_object_at(self, offset: int) -> Tuple[bytes, bytes]:
+        # an object's dictionary, and its stream when it has one
+        length = CHUNK_BYTES
+
+        while True:
+            data = self._read(offset, length)
+
+            if not OBJECT_HEADER.match(data):
+                raise PdfPageCountError(f"No object at offset {offset}")
+
+            stream = re.search(rb"stream\r?\n", data)
+            end = data.find(b"endobj")
+
+            if stream and (end < 0 or stream.start() < end):
+                dictionary = data[: stream.start()]
+                stream_length = _int_entry(dictionary, b"Length")
+
+                if stream_length is None:
+                    raise PdfPageCountError("Stream without a direct /Length")
+
+                stream_start = offset + stream.end()
+                return dictionary, self._read(stream_start, stream_length)
+
+            if end >= 0:
+                return data[:end], b""
+
+            if length >= MAX_OBJECT_BYTES or offset + length >= self._size:
+                raise PdfPageCountError(f"Unterminated object at offset {offset}")
+
+            length *= 2
+
+    def _decode(self, dictionary: bytes, stream: bytes) -> bytes:
+        if b"/FlateDecode" in dictionary:
+            stream = zlib.decompress(stream)
+        elif b"/Filter" in dictionary:
+            raise PdfPageCountError("Unsupported stream filter")
+
+        predictor = _int_entry(dictionary, b"Predictor") or 1
+
+        if predictor >= 10:
+            stream = _png_unpredict(stream, _int_entry(dictionary, b"Columns") or 1)
+        elif predictor != 1:
+            raise PdfPageCountError("Unsupported predictor")
+
+        return stream
+
+    def _read_xref_table(self, offset: int) -> int:
+        position = offset + len(b"xref")
+
+        while True:
+            data = self._read(position, 64)
+            subsection = re.match(rb"\s*(\d+)\s+(\d+)\s*?\r?\n", data)
+
+            if subsection is None:
+                break
+
+            start, count = int(subsection.group(1)), int(subsection.group(2))
+            entries_offset = position + subsection.end()
+            self._subsections.append((start, count, entries_offset))
+            position = entries_offset + count * 20
+
+        trailer = self._read(position, CHUNK_BYTES)
+
+        if not trailer.lstrip().startswith(b"trailer"):
+            raise PdfPageCountError("No trailer after the cross reference table")
+
+        return self._record_trailer(trailer[: trailer.find(b"startxref")])
+
+    def _read_xref_stream(self, offset: int) -> int:
+        dictionary, stream = self._read_object_at(offset)
+
+        if b"/XRef" not in dictionary:
+            raise PdfPageCountError("startxref doesn't point at cross references")
+
+        widths = _array_entry(dictionary, b"W")
+        size = _int_entry(dictionary, b"Size")
+        index = _array_entry(dictionary, b"Index") or [0, size]
+
+        if not widths or len(widths) != 3 or size is None:
+            raise PdfPageCountError("Malformed cross reference stream")
+
+        data = self._decode(dictionary, stream)
+        entry_size = sum(widths)
+        position = 0
+
+        for start, count in zip(index[::2], index[1::2]):
+            for number in range(start, start + count):
+                fields = []
+
+                for width in widths:
+                    field = data[position : position + width]
+                    fields.append(int.from_bytes(field, "big") if width else None)
+                    position += width
+
+                kind = 1 if fields[0] is None else fields[0]
+
+                if kind == 1:
+                    self._locations.setdefault(number, ("offset", fields[1]))
+                elif kind == 2:
+                    self._locations.setdefault(number, ("stream", fields[1], fields[2]))
+
+            if position > len(data) or entry_size == 0:
+                raise PdfPageCountError("Truncated cross reference stream")
+
+        return self._record_trailer(dictionary)
+
+    def _record_trailer(self, trailer: bytes) -> Optional[int]:
+        # the newest section's trailer wins, earlier ones were updated by it
+        if not self._trailer:
+            self._trailer = trailer
+
+        return _int_entry(trailer, b"Prev")
+
+    def read_xref(self):
+        tail_offset = max(self._size - TAIL_BYTES, 0)
+        matches = list(STARTXREF.finditer(self._read(tail_offset, TAIL_BYTES)))
+
+        if not matches:
+            raise PdfPageCountError("No startxref")
+
+        offset = int(matches[-1].group(1))
+        seen = set()
+
+        while offset is not None and offset not in seen:
+            if len(seen) >= MAX_XREF_SECTIONS:
+                raise PdfPageCountError("Too many cross reference sections")
+
+            seen.add(offset)
+
+            if self._read(offset, 4) == b"xref":
+                offset = self._read_xref_table(offset)
+            else:
+                offset = self._read_xref_stream(offset)
+
+    def _locate(self, number: int) -> Optional[tuple]:
+        if number in self._locations:
+            return self._locations[number]
+
+        for start, count, entries_offset in self._subsections:
+            if start <= number < start + count:
+                entry = self._read(entries_offset + (number - start) * 20, 20).split()
+
+                if len(entry) == 3 and entry[2] == b"n":
+                    return ("offset", int(entry[0]))
+
+        return None
+
+    def read_object(self, number: int) -> bytes:
+        location = self._locate(number)
+
+        if location is None:
+            raise PdfPageCountError(f"Object {number} isn't in the file")
+
+        if location[0] == "offset":
+            return self._read_object_at(location[1])[0]
+
+        _, stream_number, _ = location
+        stream_location = self._locate(stream_number)
+
+        if stream_location is None or stream_location[0] != "offset":
+            raise PdfPageCountError(f"Object stream {stream_number} isn't in the file")
+
+        dictionary, stream = self._read_object_at(stream_location[1])
+        data = self._decode(dictionary, stream)
+        first = _int_entry(dictionary, b"First")
+        count = _int_entry(dictionary, b"N")
+
+        if first is None or count is None:
+            raise PdfPageCountError("Malformed object stream")
+
+        header = [int(value) for value in data[:first].split()[: count * 2]]
+        offsets = dict(zip(header[::2], header[1::2]))
+
+        if number not in offsets:
+            raise PdfPageCountError(f"Object {number} isn't in its object stream")
+
+        later = sorted(
+            offset for offset in offsets.values() if offset > offsets[number]
+        )
+        end = first + later[0] if later else len(data)
+        return data[first + offsets[number] : end]
+
+    def read_page_count(self) -> int:
+        self.read_xref()
+        root = _reference_entry(self._trailer, b"Root")
+
+        if root is None:
+            raise PdfPageCountError("Encrypted or malformed trailer")
+
+        pages = _reference_entry(self.read_object(root), b"Pages")
+
+        if pages is None:
+            raise PdfPageCountError("Catalog without a page tree")
+
+        page_tree = self.read_object(pages)
+        count = _int_entry(page_tree, b"Count")
+
+        if count is None:
+            # /Count given as a reference to a number
+            reference = _reference_entry(page_tree, b"Count")
+
+            if reference is None:
+                raise PdfPageCountError("Page tree without /Count")
+
+            count = int(OBJECT_HEADER.sub(b"", self.read_object(reference), 1))
+
+        return count
+
+
+def read_page_count(read_range: Callable[[int, int], bytes], size: int) -> int:
+    """
+    Raises PdfPageCountError when the structure can't be followed, e.g. an
+    encrypted document or one damaged enough that a viewer would rebuild it.
+    """
+    try:
+        return _PdfReader(read_range, size).read_page_count()
+    except PdfPageCountError:
+        raise
+    except (ValueError, IndexError, zlib.error) as e:
+        raise PdfPageCountError(str(e)) from e
@@ -1,17 +1,53 @@
-import base64
+import contextlib
+import dataclasses
+import hashlib
+import json
 import tempfile
 import os
-import io
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
 # from anthropic import AsyncAnthropicBedrock, RateLimitError
 import fitz
-from PIL import Image
 import requests
 
 # import s3fs
 
-from worker import clients, config
+from worker import clients, config, http_client, streaming, wire
+from worker.cache import get_page_cache, page_cache_key
+from worker.checkpoints import get_checkpoint_store
+from worker.dedup import (
+    DocumentIndex,
+    get_document_index,
+    get_file_fingerprint,
+    get_storage_fingerprint,
+)
+from worker.notifications import get_status_reporter
+from worker.pdf_pages import read_page_count
+from worker.render_pool import RenderPool, discard_render_pool, get_render_pool
+from worker.output import (
+    PAGE_PACK_CONTENT_TYPE,
+    PagePackReader,
+    PagePackWriter,
+    get_output_format,
+    get_output_writer,
+)
+from worker.rendering import PageImage, encode_image, render_page
+from worker.resolution import ResolutionPolicy
+from worker.telemetry import BYTES_BUCKETS, COUNT_BUCKETS, get_telemetry
+from worker.text_layer import (
+    PAGE_ROUTE_BLANK,
+    PAGE_ROUTE_TEXT,
+    classify_page,
+    page_text_to_markdown,
+)
 from worker.types import (
+    ConversionCheckpoint,
+    ConversionReport,
     InferenceMessage,
     InferenceMessageContent,
     ParseJob,
@@ -27,58 +63,230 @@ Use ```markdown ...``` to format the markdown.
 """
 
 CORRECT_PAGE_OVERLAP_PROMPT = """
-Check if the current page starts with a table that continued from the previous page.
-If it does, correct the current and previous pages.
+The last page ends with a table and the current page starts with table rows.
+Check if the rows on the current page continue the table from the last page.
+If they do, correct both fragments, e.g. drop a repeated header row or merge a row that was split across the pages.
 
-Use ```markdown``` to format the markdown.
+Return the last page fragment and then the current page fragment, each in its own ```markdown``` block.
 """
 
+_render_lock = threading.Lock()
+
 
 def download_file(source: str, destination: str):
-    supabase_client = clients.get_supabase_client()
+    storage = clients.get_storage()
 
     with open(destination, "wb+") as fp:
-        res = supabase_client.storage.from_(
+        res = storage.from_(
             config.SUPABASE_UPLOADS_BUCKET,
         ).download(source)
         fp.write(res)
 
 
+def download_job_file(source: str, destination: str):
+    storage = clients.get_storage()
+
+    with open(destination, "wb") as fp:
+        res = storage.from_(
+            config.SUPABASE_JOBS_BUCKET,
+        ).download(source)
+        fp.write(res)
+
+
+def remove_job_files(paths: List[str]):
+    storage = clients.get_storage()
+
+    storage.from_(
+        config.SUPABASE_JOBS_BUCKET,
+    ).remove(paths)
+
+
+def get_range_reader(source: str) -> Callable[[int, int], bytes]:
+    bucket = clients.get_storage().from_(
+        config.SUPABASE_UPLOADS_BUCKET,
+    )
+
+    if config.STORAGE_BACKEND == "local":
+        return lambda offset, length: bucket.download_range(source, offset, length)
+
+    # the storage client only downloads whole objects, ranged reads go
+    # through a signed URL
+    url = bucket.create_signed_url(source, 60)["signedURL"]
+
+    def read_range(offset: int, length: int) -> bytes:
+        response = requests.get(
+            url,
+            headers={"Range": f"bytes={offset}-{offset + length - 1}"},
+            timeout=(config.API_CONNECT_TIMEOUT, config.API_READ_TIMEOUT),
+            stream=True,
+        )
+
+        with response:
+            response.raise_for_status()
+
+            # a server ignoring the range would send the whole document
+            if response.status_code != 206:
+                raise ValueError("Storage doesn't support ranged reads")
+
+            return response.content
+
+    return read_range
+
+
 def upload_file(source: str, destination: str):
-    supabase_client = clients.get_supabase_client()
+    storage = clients.get_storage()
+
+    # a redelivered job uploads over what its last attempt got to
+    file_options = {"cacheControl": "max-age=60", "upsert": "true"}
+
+    if destination.endswith(".mdpack"):
+        file_options["content-type"] = PAGE_PACK_CONTENT_TYPE
 
     with open(source, "rb") as fp:
-        supabase_client.storage.from_(
+        storage.from_(
             config.SUPABASE_JOBS_BUCKET,
-        ).upload(destination, fp, file_options={"cacheControl": "max-age=60"})
+        ).upload(destination, fp, file_options=file_options)
 
 
-def call_inference_api(request: InferenceRequest):
-    # TODO: add retries
-    try:
-        response = requests.post(
-            config.INFERENCE_API_ENDPOINT,
-            data=request.model_dump_json(),
-            timeout=30,
-        )
+def upload_files(
+    uploads: List[Tuple[str, str]],
+    max_workers: int = config.UPLOAD_CONCURRENCY,
+):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(upload_file, source, destination)
+            for source, destination in uploads
+        ]
 
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print("Error calling inference API:", e)
-        raise e
+    # every upload has finished by now, surface the first failure
+    for future in futures:
+        future.result()
 
 
-def update_status(job_id: str, status: str):
-    try:
-        response = requests.put(
-            f"{config.API_ENDPOINT}/api/jobs/{job_id}",
-            json={"status": status},
-        )
-        print("updated status:", status)
+def copy_files(
+    copies: List[Tuple[str, str]],
+    max_workers: int = config.UPLOAD_CONCURRENCY,
+):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(copy_file, source, destination)
+            for source, destination in copies
+        ]
+
+    for future in futures:
+        future.result()
+
+
+def get_file_metadata(source: str) -> Optional[dict]:
+    storage = clients.get_storage()
+    folder, filename = os.path.split(source)
+
+    files = storage.from_(
+        config.SUPABASE_UPLOADS_BUCKET,
+    ).list(folder, {"search": filename})
+
+    for file in files:
+        if file["name"] == filename:
+            return file.get("metadata")
+
+    return None
+
+
+def copy_file(source: str, destination: str):
+    storage = clients.get_storage()
+    bucket = storage.from_(
+        config.SUPABASE_JOBS_BUCKET,
+    )
+
+    # copies can't overwrite, clear what a redelivered job's last attempt made
+    bucket.remove([destination])
+    bucket.copy(source, destination)
+
+
+def post_inference_request(
+    client: http_client.HttpClient,
+    request: InferenceRequest,
+    blobs: Optional[List[bytes]] = None,
+    **kwargs,
+):
+    if blobs is None:
+        data, headers = request.model_dump_json(), None
+    else:
+        data = wire.encode_request(request, blobs)
+        headers = {"Content-Type": wire.CONTENT_TYPE}
+
+    get_telemetry().observe("inference_request_bytes", len(data), BYTES_BUCKETS)
+
+    return client.post(data=data, headers=headers, **kwargs)
+
+
+def stream_inference_api(
+    request: InferenceRequest, blobs: Optional[List[bytes]] = None
+) -> Iterator[str]:
+    response = post_inference_request(
+        http_client.get_inference_stream_client(), request, blobs, stream=True
+    )
+
+    # closing the response early hangs up, which stops generation on the server
+    with response:
         response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print("Error updating job status:", e)
+
+        for event, data in streaming.iter_sse_events(
+            response.iter_lines(decode_unicode=True)
+        ):
+            if event == "done":
+                return
+
+            yield data["text"]
+
+
+def request_inference(request: InferenceRequest, blobs: Optional[List[bytes]] = None):
+    if config.INFERENCE_STREAMING:
+        chunks = stream_inference_api(request, blobs)
+
+        try:
+            output = streaming.collect_stream(
+                chunks, request.stop_after_markdown_blocks
+            )
+        finally:
+            chunks.close()
+
+        return {"outputs": [output]}
+
+    response = post_inference_request(
+        http_client.get_inference_client(), request, blobs
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def call_inference_api(request: InferenceRequest, blobs: Optional[List[bytes]] = None):
+    # waits for a slot under the process wide limit on requests in flight
+    limiter = http_client.get_inference_limiter()
+
+    # the limited clients don't retry, every overloaded response reaches the
+    # limiter and is retried here after a backoff, in a new slot
+    attempts = config.HTTP_MAX_RETRIES + 1 if limiter is not None else 1
+
+    for attempt in range(attempts):
+        slot = limiter.acquire() if limiter is not None else contextlib.nullcontext()
+
+        try:
+            with slot:
+                return request_inference(request, blobs)
+        except requests.exceptions.RequestException as e:
+            print("Error calling inference API:", e)
+
+            retry = (
+                attempt + 1 < attempts
+                and http_client.is_overload_error(e)
+                and not isinstance(e, http_client.CircuitOpenError)
+            )
+
+            if not retry:
+                raise e
+
+            time.sleep(http_client.get_backoff_seconds(attempt))
 
 
 def parse_markdown_page(page: str):
@@ -109,164 +317,844 @@ def parse_markdown_page(page: str):
     return markdown_blocks
 
 
-def convert_page_to_markdown(
-    # image: Image.Image,
-    image_base64_string: str,
-):
-    response = call_inference_api(
-        request=InferenceRequest(
-            messages=[
-                InferenceMessage(
-                    role="user",
-                    content=[
-                        InferenceMessageContent(
-                            type="image",
-                            image=image_base64_string,
-                            # image=f"data:image;base64,{base64.b64encode(image.tobytes()).decode('utf-8')}",
-                            # resized_height=image.height,
-                            # resized_width=image.width,
-                        ),
-                        InferenceMessageContent(
-                            type="text",
-                            text=CONVERSTION_PROMPT,
-                        ),
-                    ],
-                )
-            ],
+def is_complete_output(output: str) -> bool:
+    # generation stopped before the closing fence, or produced nothing
+    blocks = parse_markdown_page(output)
+    return output.count("```") % 2 == 0 and bool(blocks) and bool(blocks[0])
+
+
+def convert_page_to_markdown(image: PageImage, complete_only: bool = False):
+    page_cache = get_page_cache()
+
+    if page_cache is not None:
+        cache_key = page_cache_key(
+            image, CONVERSTION_PROMPT, config.INFERENCE_MODEL_NAME
         )
+        cached_page = page_cache.get(cache_key)
+        get_telemetry().counter(
+            "page_cache_requests_total",
+            result="miss" if cached_page is None else "hit",
+        )
+
+        if cached_page is not None:
+            return cached_page
+
+    if config.INFERENCE_WIRE_FORMAT == "binary":
+        image_ref, blobs = f"{wire.BLOB_PREFIX}0", [image.data]
+    else:
+        image_ref, blobs = image.to_data_uri(), None
+
+    request = InferenceRequest(
+        messages=[
+            InferenceMessage(
+                role="user",
+                content=[
+                    InferenceMessageContent(
+                        type="image",
+                        image=image_ref,
+                        resized_height=image.height,
+                        resized_width=image.width,
+                    ),
+                    InferenceMessageContent(
+                        type="text",
+                        text=CONVERSTION_PROMPT,
+                    ),
+                ],
+            )
+        ],
+        stop_after_markdown_blocks=1,
     )
 
-    return parse_markdown_page(response["outputs"][0])[0]
+    with get_telemetry().span("inference"):
+        response = call_inference_api(request=request, blobs=blobs)
+
+    output = response["outputs"][0]
+
+    if complete_only and not is_complete_output(output):
+        get_telemetry().counter("incomplete_outputs_total")
+        return None
+
+    page = parse_markdown_page(output)[0]
+
+    if page_cache is not None:
+        page_cache.set(cache_key, page)
+
+    return page
+
+
+def is_table_row(line: str) -> bool:
+    return line.strip().startswith("|")
+
+
+def split_trailing_table(page: str) -> Tuple[str, str]:
+    lines = page.rstrip().split("\n")
+    start = len(lines)
+
+    while start > 0 and is_table_row(lines[start - 1]):
+        start -= 1
+
+    return "\n".join(lines[:start]), "\n".join(lines[start:])
+
+
+def split_leading_table(page: str) -> Tuple[str, str]:
+    lines = page.lstrip().split("\n")
+    end = 0
+
+    while end < len(lines) and is_table_row(lines[end]):
+        end += 1
+
+    return "\n".join(lines[:end]), "\n".join(lines[end:])
+
+
+def join_fragments(*fragments: str) -> str:
+    return "\n".join(fragment for fragment in fragments if fragment)
 
 
 def correct_page_overlap(last_page: str, current_page: str):
-    response = call_inference_api(
-        request=InferenceRequest(
-            messages=[
-                InferenceMessage(
-                    role="user",
-                    content=[
-                        InferenceMessageContent(
-                            type="text", text=CORRECT_PAGE_OVERLAP_PROMPT
-                        ),
-                        InferenceMessageContent(
-                            type="text", text=f"Last page: {last_page}"
-                        ),
-                        InferenceMessageContent(
-                            type="text", text=f"Current page: {current_page}"
-                        ),
-                    ],
-                )
-            ],
-        )
+    # only a table running across the page break needs correcting, and only
+    # the rows on either side of the break are sent to the model
+    last_page_head, last_page_table = split_trailing_table(last_page)
+    current_page_table, current_page_tail = split_leading_table(current_page)
+
+    if not last_page_table or not current_page_table:
+        return last_page, current_page
+
+    request = InferenceRequest(
+        messages=[
+            InferenceMessage(
+                role="user",
+                content=[
+                    InferenceMessageContent(
+                        type="text", text=CORRECT_PAGE_OVERLAP_PROMPT
+                    ),
+                    InferenceMessageContent(
+                        type="text", text=f"Last page: {last_page_table}"
+                    ),
+                    InferenceMessageContent(
+                        type="text", text=f"Current page: {current_page_table}"
+                    ),
+                ],
+            )
+        ],
+        stop_after_markdown_blocks=2,
     )
 
+    with get_telemetry().span("overlap_correction"):
+        response = call_inference_api(request=request)
+
     print("corrected_pages:", response["outputs"])
     corrected_pages = parse_markdown_page(response["outputs"][0])
 
     if len(corrected_pages) != 2:
         return last_page, current_page
 
-    return corrected_pages[0], corrected_pages[1]
+    return (
+        join_fragments(last_page_head, corrected_pages[0]),
+        join_fragments(corrected_pages[1], current_page_tail),
+    )
+
+
+def get_resolution_policy(job: Optional[ParseJob] = None) -> ResolutionPolicy:
+    return ResolutionPolicy(
+        mode=(job and job.resolution_mode) or config.PAGE_RESOLUTION_MODE,
+        dpi=config.PAGE_RENDER_DPI,
+        max_dpi=config.PAGE_MAX_DPI,
+        min_pixels=config.PAGE_MIN_PIXELS,
+        max_pixels=(job and job.max_pixels) or config.PAGE_MAX_PIXELS,
+        adaptive_start_pixels=config.PAGE_ADAPTIVE_START_PIXELS,
+    )
+
+
+def encode_page(
+    doc: fitz.Document,
+    page_number: int,
+    resolution_policy: Optional[ResolutionPolicy] = None,
+    attempt: int = 0,
+    image_format: str = config.PAGE_IMAGE_FORMAT,
+    quality: int = config.PAGE_IMAGE_QUALITY,
+    render_pool: Optional[RenderPool] = None,
+) -> PageImage:
+    if resolution_policy is None:
+        resolution_policy = get_resolution_policy()
+
+    telemetry = get_telemetry()
+
+    if render_pool is not None:
+        with telemetry.span("render", attempt=attempt, pool=True):
+            image = render_pool.render(
+                doc.name, page_number, resolution_policy, attempt
+            )
+    else:
+        # PyMuPDF is not thread safe, only the PIL encoding runs concurrently
+        with _render_lock:
+            with telemetry.span("render", attempt=attempt):
+                image = render_page(doc[page_number], resolution_policy, attempt)
+
+    with telemetry.span("encode", attempt=attempt):
+        page_image = encode_image(image, image_format, quality)
+
+    telemetry.observe("page_image_bytes", len(page_image.data), BYTES_BUCKETS)
+    # one visual token per 28x28 pixels
+    telemetry.observe(
+        "page_visual_tokens",
+        page_image.width * page_image.height // (28 * 28),
+        COUNT_BUCKETS,
+    )
+
+    return page_image
 
 
-def convert_document(input_file_path: str):
+def warm_up_rendering():
+    # loads fitz's fonts and PIL's encoders before the first real page
+    doc = fitz.open()
+    doc.new_page(width=72, height=72).insert_text((10, 36), "warm up")
+
+    try:
+        encode_page(doc, 0)
+    finally:
+        doc.close()
+
+
+def convert_document(
+    input_file_path: str,
+    max_in_flight_pages: Optional[int] = None,
+    render_concurrency: int = config.PAGE_RENDER_CONCURRENCY,
+    conversion_concurrency: int = config.PAGE_CONVERSION_CONCURRENCY,
+    text_layer_mode: str = config.TEXT_LAYER_MODE,
+    resolution_policy: Optional[ResolutionPolicy] = None,
+    report: Optional[ConversionReport] = None,
+    checkpoint: Optional[ConversionCheckpoint] = None,
+    on_checkpoint: Optional[Callable[[ConversionCheckpoint], None]] = None,
+    page_range: Optional[Tuple[int, int]] = None,
+    job_id: Optional[str] = None,
+):
+    telemetry = get_telemetry()
     doc = fitz.open(input_file_path)
-    last_page = None
-    page_counter = 0
+    start_page, end_page = page_range or (0, doc.page_count)
+    render_pool = get_render_pool()
+
+    # with a render pool, rendering is only bound by its processes
+    if render_pool is not None:
+        render_concurrency = max(render_concurrency, render_pool.processes)
+
+    render_slots = threading.Semaphore(render_concurrency)
+    render_pool_lock = threading.Lock()
+
+    # the adaptive limiter in call_inference_api is the only gate on inference
+    # requests, there must be enough pages in flight for it to grow into. Off,
+    # a fixed number of pages convert at once
+    if http_client.get_inference_limiter() is not None:
+        conversion_slots = contextlib.nullcontext()
+        default_in_flight_pages = max(
+            config.PAGE_PIPELINE_MAX_IN_FLIGHT, config.INFERENCE_MAX_CONCURRENCY
+        )
+    else:
+        conversion_slots = threading.Semaphore(conversion_concurrency)
+        default_in_flight_pages = config.PAGE_PIPELINE_MAX_IN_FLIGHT
+
+    if max_in_flight_pages is None:
+        max_in_flight_pages = default_in_flight_pages
+
+    if report is None:
+        report = ConversionReport()
+
+    if resolution_policy is None:
+        resolution_policy = get_resolution_policy()
+
+    report.total_pages = end_page - start_page
+
+    def render(page_number: int, attempt: int = 0) -> PageImage:
+        nonlocal render_pool
+        pool = render_pool
+
+        if pool is not None:
+            try:
+                return encode_page(
+                    doc, page_number, resolution_policy, attempt, render_pool=pool
+                )
+            except BrokenProcessPool as e:
+                # a render process died, the rest of the document renders here
+                print(f"Error rendering page {page_number} in render pool:", e)
+
+                with render_pool_lock:
+                    if render_pool is pool:
+                        render_pool = None
+                        discard_render_pool(pool)
+
+        return encode_page(doc, page_number, resolution_policy, attempt)
+
+    def convert_page(page_number: int) -> Tuple[str, Optional[str]]:
+        # spans on this pipeline thread are logged with the job and page
+        with telemetry.bind(job_id=job_id, page=page_number):
+            with telemetry.span("page"):
+                return route_page(page_number)
+
+    def route_page(page_number: int) -> Tuple[str, Optional[str]]:
+        with render_slots:
+            with _render_lock:
+                with telemetry.span("classify"):
+                    route = classify_page(doc[page_number], text_layer_mode)
+
+                if route == PAGE_ROUTE_TEXT:
+                    with telemetry.span("text_layer"):
+                        return route, page_text_to_markdown(doc[page_number])
+
+            if route == PAGE_ROUTE_BLANK:
+                return route, None
+
+            image = render(page_number)
 
-    for page in doc:
-        pix = page.get_pixmap()  # type: ignore
+        # adaptive resolution retries truncated or empty pages at a larger size
+        for attempt in range(1, resolution_policy.attempts):
+            with conversion_slots:
+                page = convert_page_to_markdown(image, complete_only=True)
 
-        image = Image.open(io.BytesIO(pix.tobytes()))
+            if page is not None:
+                return route, page
 
-        new_width = min(((image.width + 27) // 28) * 28, 16384)
-        new_height = min(((image.height + 27) // 28) * 28, 16384)
+            with render_slots:
+                image = render(page_number, attempt)
 
-        # pix = fitz.Pixmap(pix, new_width, new_height)
+        with conversion_slots:
+            return route, convert_page_to_markdown(image)
 
-        # image = image.copy()
-        # encoded_string_bytes = base64.b64encode(pix.tobytes())
+    # resume after the last page recorded by a previous attempt
+    if checkpoint is None:
+        checkpoint = ConversionCheckpoint(next_page_number=start_page)
 
-        with tempfile.TemporaryFile() as temp_file:
-            image.save(temp_file, format="PNG")
+    last_page = checkpoint.last_page
+    page_counter = checkpoint.page_counter
 
-            temp_file.seek(0)
-            encoded_string_bytes = base64.b64encode(temp_file.read())
-            # The image is loaded into memory, but the file handle is closed
-            # We need to create a copy to ensure it persists after the temp file is removed
-            # image = Image.open(temp_file).copy()
+    # pages are converted ahead of the consumer, bounded by max_in_flight_pages.
+    # overlap correction runs here, in page order, as soon as both neighbours
+    # are available since each pair depends on the previous corrected page.
+    executor = ThreadPoolExecutor(max_workers=max_in_flight_pages)
+
+    try:
+        in_flight = deque()
+        next_page_number = checkpoint.next_page_number
+
+        while in_flight or next_page_number < end_page:
+            while len(in_flight) < max_in_flight_pages and next_page_number < end_page:
+                in_flight.append(
+                    (next_page_number, executor.submit(convert_page, next_page_number))
+                )
+                next_page_number += 1
+
+            page_number, future = in_flight.popleft()
+
+            try:
+                route, current_page = future.result()
+                telemetry.counter("pages_total", route=route)
+
+                if route == PAGE_ROUTE_BLANK:
+                    report.blank_pages += 1
+                else:
+                    if last_page is not None:
+                        last_page, current_page = correct_page_overlap(
+                            last_page, current_page
+                        )
+                        yield (last_page, f"page_{page_counter}.md")
+
+                    last_page = current_page
+                    page_counter += 1
+
+                    if route == PAGE_ROUTE_TEXT:
+                        report.text_pages += 1
+                    else:
+                        report.image_pages += 1
+            except Exception as e:
+                report.failed_pages += 1
+                telemetry.counter("pages_total", route="failed")
+                print(f"Error processing page {page_number}: {str(e)}")
+                # Skip this page and continue with the next one
+
+            # the consumer has handled every page yielded so far
+            if on_checkpoint is not None:
+                on_checkpoint(
+                    ConversionCheckpoint(
+                        next_page_number=page_number + 1,
+                        page_counter=page_counter,
+                        last_page=last_page,
+                        report=report.model_copy(),
+                    )
+                )
+    finally:
+        # a consumer that stops early, or a failed checkpoint, doesn't wait for
+        # the pages still queued. Running ones finish before doc is closed
+        executor.shutdown(wait=True, cancel_futures=True)
+        doc.close()
+
+    if last_page is not None:
+        yield (last_page, f"page_{page_counter}.md")
+
+
+def get_conversion_settings_digest(job: ParseJob) -> str:
+    settings = [
+        config.INFERENCE_MODEL_NAME,
+        job.text_layer_mode or config.TEXT_LAYER_MODE,
+        CONVERSTION_PROMPT,
+        CORRECT_PAGE_OVERLAP_PROMPT,
+        dataclasses.asdict(get_resolution_policy(job)),
+        config.PAGE_IMAGE_FORMAT,
+        config.PAGE_IMAGE_QUALITY,
+        # a document converted to another format has no output to reuse
+        get_output_format(job.output_format),
+    ]
+
+    return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+
+def copy_existing_output(
+    document_index: Optional[DocumentIndex],
+    fingerprint: Optional[str],
+    output_path: str,
+) -> bool:
+    if document_index is None or fingerprint is None:
+        return False
+
+    try:
+        existing_output = document_index.lookup(fingerprint)
+
+        if existing_output is None or existing_output.output_path == output_path:
+            return False
+
+        # without the list of page files the copy would be missing them
+        if existing_output.page_files is None:
+            return False
+
+        existing_directory = os.path.dirname(existing_output.output_path)
+        output_directory = os.path.dirname(output_path)
+
+        # the document goes last, once it exists every page file does too
+        copy_files(
+            [
+                (
+                    os.path.join(existing_directory, page_file),
+                    os.path.join(output_directory, page_file),
+                )
+                for page_file in existing_output.page_files
+            ]
+        )
+        copy_file(existing_output.output_path, output_path)
+        print(f"reused {existing_output.output_path} for document {fingerprint}")
+        return True
+    except Exception as e:
+        # the previous output may have been deleted, convert the document again
+        print("Error reusing converted document:", e)
 
         try:
-            current_page = convert_page_to_markdown(
-                f"data:image;base64,{encoded_string_bytes.decode('utf-8')}",
-                # image
+            document_index.forget(fingerprint)
+        except Exception:
+            pass
+
+        return False
+
+
+def get_remote_page_count(job: ParseJob) -> int:
+    if job.page_count is not None:
+        return job.page_count
+
+    metadata = get_file_metadata(job.source_file)
+
+    if not metadata or metadata.get("size") is None:
+        raise FileNotFoundError(f"No size for source file: {job.source_file}")
+
+    size = int(metadata["size"])
+
+    # the trailer and page tree are a few small ranged reads, routing doesn't
+    # need the whole document
+    try:
+        return read_page_count(get_range_reader(job.source_file), size)
+    except Exception as e:
+        print("Error reading page count, estimating it from the file size:", e)
+
+    return max(1, -(-size // config.ESTIMATED_PAGE_BYTES))
+
+
+def get_page_ranges(source_file_path: str) -> List[Tuple[int, int]]:
+    with fitz.open(source_file_path) as doc:
+        page_count = doc.page_count
+
+    if page_count < config.FANOUT_MIN_PAGES:
+        return [(0, page_count)]
+
+    return [
+        (start, min(start + config.FANOUT_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, config.FANOUT_PAGES_PER_TASK)
+    ]
+
+
+def convert_with_checkpoints(
+    checkpoint_id: str,
+    settings_digest: str,
+    source_file_path: str,
+    report: ConversionReport,
+    **kwargs,
+):
+    checkpoint_store = get_checkpoint_store()
+    checkpoint = None
+    completed_pages = []
+
+    if checkpoint_store is not None:
+        try:
+            checkpoint, completed_pages = checkpoint_store.load(
+                checkpoint_id, settings_digest
             )
+        except Exception as e:
+            print("Error loading checkpoint:", e)
+
+    if checkpoint is not None:
+        print(f"resuming from page {checkpoint.next_page_number}:", checkpoint_id)
 
-            if last_page is not None:
-                last_page, current_page = correct_page_overlap(last_page, current_page)
-                yield (last_page, f"page_{page_counter}.md")
+        for name, value in checkpoint.report:
+            setattr(report, name, value)
 
-            last_page = current_page
-            page_counter += 1
+    def save_checkpoint(state: ConversionCheckpoint):
+        state.settings_digest = settings_digest
+
+        try:
+            checkpoint_store.save_state(checkpoint_id, state)
         except Exception as e:
-            print(f"Error processing page {page_counter}: {str(e)}")
-            # Skip this page and continue with the next one
-            continue
+            print("Error saving checkpoint:", e)
+
+    for title, page in completed_pages:
+        yield (page, title)
+
+    for page, title in convert_document(
+        source_file_path,
+        report=report,
+        checkpoint=checkpoint,
+        on_checkpoint=save_checkpoint if checkpoint_store is not None else None,
+        **kwargs,
+    ):
+        if checkpoint_store is not None:
+            try:
+                checkpoint_store.save_page(checkpoint_id, title, page)
+            except Exception as e:
+                print("Error saving checkpoint:", e)
+
+        yield (page, title)
+
+
+def delete_checkpoints(checkpoint_ids: List[str]):
+    checkpoint_store = get_checkpoint_store()
+
+    if checkpoint_store is None:
+        return
+
+    for checkpoint_id in checkpoint_ids:
+        try:
+            checkpoint_store.delete(checkpoint_id)
+        except Exception as e:
+            print("Error deleting checkpoint:", e)
+
+
+def upload_document(
+    job: ParseJob,
+    pages: Iterable[Tuple[str, str]],
+    tempdir: str,
+    output_path: str,
+    report: ConversionReport,
+) -> List[str]:
+    uploads = []
+    page_files = []
+    final_document_path = os.path.join(tempdir, os.path.basename(output_path))
+    _, codec = get_output_format(job.output_format)
+
+    # pages are appended as they arrive, so memory holds one page at a time
+    # however long the document is
+    with open(final_document_path, "wb") as document:
+        writer = get_output_writer(document, job.output_format)
+
+        for page, title in pages:
+            print(f"page converted: {title} ({len(page)} chars)")
+            writer.write_page(page, title)
+
+            # a page pack indexes its own pages, markdown gets a file per page
+            if codec is None:
+                page_path = os.path.join(tempdir, title)
+
+                with open(page_path, "w") as fp:
+                    fp.write(page)
+
+                uploads.append((page_path, os.path.join("jobs", job.job_id, title)))
+                page_files.append(title)
+
+        writer.finish()
+
+    print("final document:", final_document_path)
+
+    # upload final document to remote storage
+    get_status_reporter().report(
+        job.job_id,
+        "uploading",
+        pages_done=report.pages_done,
+        pages_total=report.total_pages,
+    )
+
+    # upload each page and the final document to remote storage together,
+    # uploads stream from the files on disk
+    uploads.append((final_document_path, output_path))
+
+    with get_telemetry().span("upload", files=len(uploads)):
+        upload_files(uploads)
+
+    return page_files
+
+
+def record_converted_document(
+    job: ParseJob,
+    fingerprints: List[Optional[str]],
+    output_path: str,
+    page_files: List[str],
+    report: ConversionReport,
+):
+    # pages fail while the inference endpoint is down, an output missing them
+    # mustn't be served to every later upload of the document
+    if report.failed_pages > 0:
+        print(f"not reusable, {report.failed_pages} pages failed:", job.job_id)
+        return
+
+    document_index = get_document_index(get_conversion_settings_digest(job))
+
+    if document_index is None:
+        return
+
+    try:
+        document_index.record(fingerprints, output_path, page_files)
+    except Exception as e:
+        print("Error recording converted document:", e)
 
-    if last_page is not None:
-        yield (last_page, f"page_{page_counter}.md")
 
+def get_output_path(job: ParseJob) -> str:
+    extension, _ = get_output_format(job.output_format)
+    return os.path.join("jobs", job.job_id, f"{job.job_id}{extension}")
+
+
+def process_remote_document(
+    job: ParseJob,
+    dispatch_page_ranges: Optional[
+        Callable[[List[Tuple[int, int]], List[Optional[str]]], None]
+    ] = None,
+) -> ConversionReport:
+    report = ConversionReport()
+    output_path = get_output_path(job)
+    settings_digest = get_conversion_settings_digest(job)
+    document_index = get_document_index(settings_digest)
+    fingerprints = []
+
+    if document_index is not None:
+        storage_fingerprint = None
+
+        try:
+            storage_fingerprint = get_storage_fingerprint(
+                get_file_metadata(job.source_file)
+            )
+        except Exception as e:
+            print("Error reading source file metadata:", e)
+
+        fingerprints.append(storage_fingerprint)
+
+        if copy_existing_output(document_index, storage_fingerprint, output_path):
+            report.reused_output = True
+            return report
 
-def process_remote_document(job: ParseJob):
     with tempfile.TemporaryDirectory() as tempdir:
         # download source file
         source_file_path = os.path.join(tempdir, os.path.basename(job.source_file))
 
-        download_file(job.source_file, source_file_path)
-        update_status(job.job_id, "processing")
-        page_contents = []
+        with get_telemetry().span("download"):
+            download_file(job.source_file, source_file_path)
+
+        if document_index is not None:
+            fingerprints.append(get_file_fingerprint(source_file_path))
+
+            if copy_existing_output(document_index, fingerprints[-1], output_path):
+                report.reused_output = True
+                return report
+
+        status_reporter = get_status_reporter()
+
+        # large documents are converted by several workers, one page range each
+        page_ranges = get_page_ranges(source_file_path)
+
+        if dispatch_page_ranges is not None and len(page_ranges) > 1:
+            report.total_pages = page_ranges[-1][1]
+            report.page_ranges = len(page_ranges)
+
+            # other workers report the final status, ours must land first
+            status_reporter.report(
+                job.job_id, "processing", pages_done=0, pages_total=report.total_pages
+            )
+            status_reporter.flush(config.STATUS_FLUSH_TIMEOUT)
+
+            dispatch_page_ranges(page_ranges, fingerprints)
+            return report
+
+        status_reporter.report(job.job_id, "processing")
+
+        def report_progress(pages):
+            for page, title in pages:
+                status_reporter.report(
+                    job.job_id,
+                    "processing",
+                    pages_done=report.pages_done,
+                    pages_total=report.total_pages,
+                )
+                yield (page, title)
 
         # convert to markdown
-        # upload each page to remote storage
-        for page, title in convert_document(source_file_path):
-            page_contents.append(page)
-            print("page contents:", page)
-            update_status(job.job_id, f"processed {title}")
-
-            # TODO: post status updates
-
-            # with open(os.path.join(tempdir, title), "w") as fp:
-            #     print("page:", title)
-            #     fp.write(page)
-            #     upload_file(
-            #         fp.name,
-            #         os.path.join(
-            #             "jobs",
-            #             job.job_id,
-            #             title,
-            #         ),
-            #     )
-
-        # upload final document to remote storage
-        update_status(job.job_id, "uploading final document")
-        final_document_path = os.path.join(tempdir, f"{job.job_id}.md")
-
-        with open(final_document_path, "w") as fp:
-            print("page contents:", page_contents)
-            fp.write("\n".join(page_contents))
-            # TODO: upload all docs + final doc as batch
-            print("final document:", final_document_path)
-
-        upload_file(
-            final_document_path,
-            os.path.join(
-                "jobs",
-                job.job_id,
-                f"{job.job_id}.md",
-            ),
+        pages = convert_with_checkpoints(
+            job.job_id,
+            settings_digest,
+            source_file_path,
+            report,
+            text_layer_mode=job.text_layer_mode or config.TEXT_LAYER_MODE,
+            resolution_policy=get_resolution_policy(job),
+            job_id=job.job_id,
+        )
+        page_files = upload_document(
+            job, report_progress(pages), tempdir, output_path, report
         )
 
+        print("conversion report:", report.model_dump())
+        page_cache = get_page_cache()
+
+        if page_cache is not None:
+            print("page cache:", page_cache.stats())
+
+        delete_checkpoints([job.job_id])
+
+    record_converted_document(job, fingerprints, output_path, page_files, report)
+
+    return report
+
+
+def get_page_range_checkpoint_id(job: ParseJob, start: int, end: int) -> str:
+    return f"{job.job_id}:pages-{start}-{end}"
+
+
+def get_page_range_path(job: ParseJob, start: int, end: int) -> str:
+    return os.path.join("jobs", job.job_id, "ranges", f"pages-{start}-{end}.mdpack")
+
+
+def process_remote_page_range(
+    job: ParseJob, start: int, end: int
+) -> Tuple[str, ConversionReport]:
+    report = ConversionReport()
+    range_path = get_page_range_path(job, start, end)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        source_file_path = os.path.join(tempdir, os.path.basename(job.source_file))
+
+        with get_telemetry().span("download"):
+            download_file(job.source_file, source_file_path)
+
+        pages = convert_with_checkpoints(
+            get_page_range_checkpoint_id(job, start, end),
+            get_conversion_settings_digest(job),
+            source_file_path,
+            report,
+            text_layer_mode=job.text_layer_mode or config.TEXT_LAYER_MODE,
+            resolution_policy=get_resolution_policy(job),
+            job_id=job.job_id,
+            page_range=(start, end),
+        )
+
+        # pages go to storage rather than through the result backend, the
+        # assembler reads them back one range at a time
+        pack_path = os.path.join(tempdir, os.path.basename(range_path))
+
+        with open(pack_path, "wb") as fp:
+            writer = PagePackWriter(fp, "gzip")
+
+            for page, title in pages:
+                writer.write_page(page, title)
+
+            writer.finish()
+
+        upload_file(pack_path, range_path)
+
+    return range_path, report
+
+
+def assemble_remote_document(
+    job: ParseJob,
+    page_ranges: List[Tuple[int, int]],
+    range_paths: List[str],
+    range_reports: List[ConversionReport],
+    fingerprints: List[Optional[str]],
+) -> ConversionReport:
+    report = ConversionReport(page_ranges=len(page_ranges))
+
+    for range_report in range_reports:
+        report.total_pages += range_report.total_pages
+        report.text_pages += range_report.text_pages
+        report.image_pages += range_report.image_pages
+        report.blank_pages += range_report.blank_pages
+        report.failed_pages += range_report.failed_pages
+
+    def read_range_pages(range_path: str, tempdir: str) -> Iterator[str]:
+        pack_path = os.path.join(tempdir, os.path.basename(range_path))
+        download_job_file(range_path, pack_path)
+
+        try:
+            with open(pack_path, "rb") as fp:
+                reader = PagePackReader.from_file(fp)
+
+                for page_number in range(len(reader)):
+                    yield reader.read_page(page_number)
+        finally:
+            os.remove(pack_path)
+
+    def join_page_ranges(tempdir: str):
+        last_page = None
+        page_counter = 0
+
+        # ranges were corrected internally, only the pages on either side of
+        # a range boundary still need their overlap corrected
+        for range_path in range_paths:
+            pages = read_range_pages(range_path, tempdir)
+
+            for index, current_page in enumerate(pages):
+                if last_page is not None:
+                    if index == 0:
+                        try:
+                            last_page, current_page = correct_page_overlap(
+                                last_page, current_page
+                            )
+                        except Exception as e:
+                            print("Error correcting page range boundary:", e)
+
+                    yield (last_page, f"page_{page_counter}.md")
+
+                last_page = current_page
+                page_counter += 1
+
+        if last_page is not None:
+            yield (last_page, f"page_{page_counter}.md")
+
+    output_path = get_output_path(job)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        page_files = upload_document(
+            job, join_page_ranges(tempdir), tempdir, output_path, report
+        )
+
+    print("conversion report:", report.model_dump())
+    delete_checkpoints(
+        [get_page_range_checkpoint_id(job, start, end) for start, end in page_ranges]
+    )
+
+    try:
+        remove_job_files(range_paths)
+    except Exception as e:
+        print("Error removing page ranges:", e)
+    record_converted_document(job, fingerprints, output_path, page_files, report)
+
+    return report
+
 
 # async def convert_pdf_page_markdown(page: pymupdf.Page, semaphore: asyncio.Semaphore):
 #     pix = page.get_pixmap()  # render page to an image
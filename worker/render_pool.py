@@ -0,0 +1,136 @@
+import functools
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple, Union
+
+import fitz
+from PIL import Image
+
+from worker import config
+from worker.rendering import render_page
+from worker.resolution import ResolutionPolicy
+
+# documents each render process keeps open, a job's pages all come from one
+MAX_OPEN_DOCUMENTS = 4
+
+_documents: "OrderedDict[tuple, fitz.Document]" = OrderedDict()
+
+
+def _get_document(path: str) -> fitz.Document:
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+
+    if key in _documents:
+        _documents.move_to_end(key)
+        return _documents[key]
+
+    _documents[key] = fitz.open(path)
+
+    while len(_documents) > MAX_OPEN_DOCUMENTS:
+        _, doc = _documents.popitem(last=False)
+        doc.close()
+
+    return _documents[key]
+
+
+def _render_to_shared_memory(
+    path: str,
+    page_number: int,
+    resolution: Union[int, ResolutionPolicy],
+    attempt: int,
+) -> Tuple[str, str, Tuple[int, int]]:
+    image = render_page(_get_document(path)[page_number], resolution, attempt)
+    data = image.tobytes()
+    segment = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+
+    try:
+        segment.buf[: len(data)] = data
+    finally:
+        segment.close()
+
+    # the parent unlinks the segment once it has copied the pixels out, this
+    # process's resource tracker mustn't remove it first
+    resource_tracker.unregister(segment._name, "shared_memory")
+
+    return segment.name, image.mode, image.size
+
+
+def _read_shared_memory(name: str, mode: str, size: Tuple[int, int]) -> Image.Image:
+    segment = shared_memory.SharedMemory(name=name)
+
+    try:
+        return Image.frombytes(mode, size, segment.buf)
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def _ping() -> bool:
+    return True
+
+
+class RenderPool:
+    """
+    Renders pages in separate processes, so rendering runs on every core
+    instead of behind the lock fitz needs in this one. Each process opens a
+    document once and hands pixels back through shared memory rather than
+    pickling them.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        # spawned rather than forked, the worker has threads and open sockets
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def start(self, timeout: float = 60):
+        # processes are started on the first submit, fail here rather than
+        # on a job's first page if this process can't have children
+        self._executor.submit(_ping).result(timeout=timeout)
+
+    def render(
+        self,
+        path: str,
+        page_number: int,
+        resolution: Union[int, ResolutionPolicy],
+        attempt: int = 0,
+    ) -> Image.Image:
+        future = self._executor.submit(
+            _render_to_shared_memory, path, page_number, resolution, attempt
+        )
+        return _read_shared_memory(*future.result())
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_render_pool() -> Optional[RenderPool]:
+    if config.PAGE_RENDER_PROCESSES <= 0:
+        return None
+
+    pool = RenderPool(config.PAGE_RENDER_PROCESSES)
+
+    try:
+        pool.start()
+    except Exception as e:
+        # e.g. a pool process that isn't allowed children of its own
+        print("Error starting render processes, rendering in this one:", e)
+        pool.close()
+        return None
+
+    return pool
+
+
+def discard_render_pool(pool: RenderPool):
+    # a pool that lost a process can't render again, the next caller of
+    # get_render_pool starts a fresh one
+    if get_render_pool.cache_info().currsize and get_render_pool() is pool:
+        get_render_pool.cache_clear()
+
+    pool.close()
@@ -0,0 +1,77 @@
+import base64
+import io
+from dataclasses import dataclass
+from typing import Union
+
+import fitz
+from PIL import Image
+
+from worker.resolution import ResolutionPolicy, snap_to_grid
+
+IMAGE_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+@dataclass
+class PageImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+
+    def to_data_uri(self) -> str:
+        encoded_string = base64.b64encode(self.data).decode("utf-8")
+        return f"data:{self.mime_type};base64,{encoded_string}"
+
+
+def get_render_size(
+    page: fitz.Page, resolution: Union[int, ResolutionPolicy], attempt: int = 0
+):
+    if isinstance(resolution, ResolutionPolicy):
+        return resolution.get_size(page.rect.width, page.rect.height, attempt)
+
+    scale = resolution / 72
+    return (
+        snap_to_grid(page.rect.width * scale),
+        snap_to_grid(page.rect.height * scale),
+    )
+
+
+def render_page(
+    page: fitz.Page, resolution: Union[int, ResolutionPolicy], attempt: int = 0
+) -> Image.Image:
+    width, height = get_render_size(page, resolution, attempt)
+
+    # scale each axis separately so the pixmap lands on the 28px grid directly
+    matrix = fitz.Matrix(width / page.rect.width, height / page.rect.height)
+    pix = page.get_pixmap(matrix=matrix, alpha=False)  # type: ignore
+    image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    # pixmap bounds are rounded outwards, so they can be a pixel off the grid
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+    return image
+
+
+def encode_image(image: Image.Image, image_format: str, quality: int) -> PageImage:
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported page image format: {image_format}")
+
+    pil_format, mime_type = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+
+    if image_format == "png":
+        image.save(buffer, format=pil_format, optimize=False)
+    else:
+        image.save(buffer, format=pil_format, quality=quality)
+
+    return PageImage(
+        data=buffer.getvalue(),
+        mime_type=mime_type,
+        width=image.width,
+        height=image.height,
+    )
@@ -0,0 +1,130 @@
+import math
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# Qwen2-VL merges 14px patches 2x2, so image sides must be multiples of 28 and
+# every 28x28 tile of the image becomes one visual token
+IMAGE_FACTOR = 28
+MAX_IMAGE_SIDE = 16384
+
+RESOLUTION_MODES = ("dpi", "budget", "adaptive")
+# adaptive mode multiplies the pixel budget by this on every retry
+ADAPTIVE_BUDGET_GROWTH = 2
+
+
+def snap_to_grid(value: float) -> int:
+    snapped = round(value / IMAGE_FACTOR) * IMAGE_FACTOR
+    return min(max(snapped, IMAGE_FACTOR), MAX_IMAGE_SIDE)
+
+
+def fit_to_pixel_budget(
+    width: float, height: float, min_pixels: int, max_pixels: int
+) -> Tuple[int, int]:
+    """
+    Snaps width and height to the 28px grid, keeping the aspect ratio and
+    the area within [min_pixels, max_pixels].
+    """
+    snapped_width, snapped_height = snap_to_grid(width), snap_to_grid(height)
+
+    if snapped_width * snapped_height > max_pixels:
+        beta = math.sqrt(width * height / max_pixels)
+        snapped_width = math.floor(width / beta / IMAGE_FACTOR) * IMAGE_FACTOR
+        snapped_height = math.floor(height / beta / IMAGE_FACTOR) * IMAGE_FACTOR
+    elif snapped_width * snapped_height < min_pixels:
+        beta = math.sqrt(min_pixels / (width * height))
+        snapped_width = math.ceil(width * beta / IMAGE_FACTOR) * IMAGE_FACTOR
+        snapped_height = math.ceil(height * beta / IMAGE_FACTOR) * IMAGE_FACTOR
+
+    return (
+        min(max(snapped_width, IMAGE_FACTOR), MAX_IMAGE_SIDE),
+        min(max(snapped_height, IMAGE_FACTOR), MAX_IMAGE_SIDE),
+    )
+
+
+@dataclass
+class ResolutionPolicy:
+    """
+    How large page images are rendered, which sets the number of visual
+    tokens the model has to prefill for every page.
+
+    dpi renders at a fixed DPI, budget fills max_pixels whatever the page
+    size, adaptive starts at adaptive_start_pixels and lets a page be retried
+    at a larger budget until max_pixels. Every mode is capped at max_dpi and
+    clamped to [min_pixels, max_pixels].
+    """
+
+    mode: str = "dpi"
+    dpi: int = 72
+    max_dpi: int = 200
+    min_pixels: int = 4 * IMAGE_FACTOR * IMAGE_FACTOR
+    max_pixels: int = 1280 * IMAGE_FACTOR * IMAGE_FACTOR
+    adaptive_start_pixels: int = 256 * IMAGE_FACTOR * IMAGE_FACTOR
+
+    def __post_init__(self):
+        if self.mode not in RESOLUTION_MODES:
+            raise ValueError(f"Unknown resolution mode: {self.mode}")
+
+    def get_pixel_budgets(self) -> List[int]:
+        if self.mode != "adaptive":
+            return [self.max_pixels]
+
+        budgets = [min(self.adaptive_start_pixels, self.max_pixels)]
+
+        while budgets[-1] < self.max_pixels:
+            budgets.append(min(budgets[-1] * ADAPTIVE_BUDGET_GROWTH, self.max_pixels))
+
+        return budgets
+
+    @property
+    def attempts(self) -> int:
+        return len(self.get_pixel_budgets())
+
+    def get_size(
+        self, page_width: float, page_height: float, attempt: int = 0
+    ) -> Tuple[int, int]:
+        # page sizes are in points, 72 to the inch
+        scale = min(self.dpi, self.max_dpi) / 72
+        max_pixels = self.get_pixel_budgets()[attempt]
+
+        if self.mode != "dpi":
+            scale = min(
+                math.sqrt(max_pixels / (page_width * page_height)), self.max_dpi / 72
+            )
+
+        return fit_to_pixel_budget(
+            page_width * scale, page_height * scale, self.min_pixels, max_pixels
+        )
+
+
+def apply_pixel_budget(
+    messages: List[dict], min_pixels: int, max_pixels: int
+) -> List[dict]:
+    """
+    Clamps every image in the request to the deployment's pixel budget, a
+    request can ask for fewer pixels than the deployment allows but not more.
+    """
+    for message in messages:
+        for content in message["content"]:
+            if content.get("type") != "image":
+                continue
+
+            content_max_pixels = min(content.get("max_pixels", max_pixels), max_pixels)
+            content_min_pixels = min(
+                max(content.get("min_pixels", min_pixels), min_pixels),
+                content_max_pixels,
+            )
+            content["min_pixels"] = content_min_pixels
+            content["max_pixels"] = content_max_pixels
+
+            if "resized_width" in content and "resized_height" in content:
+                (
+                    content["resized_width"],
+                    content["resized_height"],
+                ) = fit_to_pixel_budget(
+                    content["resized_width"],
+                    content["resized_height"],
+                    content_min_pixels,
+                    content_max_pixels,
+                )
+
+    return messages
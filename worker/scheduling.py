@@ -0,0 +1,181 @@
+import time
+from typing import Dict, Optional
+
+from worker import config
+from worker.telemetry import get_telemetry
+from worker.types import ParseJob
+
+SIZE_CLASSES = ("small", "medium", "large")
+
+# Redis transport message priorities, lower runs first. Celery keeps one list
+# per step, the highest priority one under the plain queue name
+PRIORITIES = {"high": 0, "normal": 3, "low": 6}
+PRIORITY_STEPS = (0, 3, 6, 9)
+PRIORITY_SEPARATOR = "\x06\x16"
+
+
+def get_size_class(page_count: int) -> str:
+    if page_count <= config.SMALL_JOB_MAX_PAGES:
+        return "small"
+
+    if page_count <= config.MEDIUM_JOB_MAX_PAGES:
+        return "medium"
+
+    return "large"
+
+
+def get_queue(size_class: str) -> str:
+    return f"{config.JOB_QUEUE_PREFIX}{size_class}"
+
+
+def get_routing(job: ParseJob) -> Dict[str, object]:
+    """
+    Celery routing options for a job and every task it spawns, empty when
+    routing is off or the page count isn't known yet.
+    """
+    if not config.JOB_ROUTING_ENABLED or job.page_count is None:
+        return {}
+
+    return {
+        "queue": get_queue(get_size_class(job.page_count)),
+        "priority": PRIORITIES[job.priority or config.JOB_DEFAULT_PRIORITY],
+    }
+
+
+def get_queue_depth(redis_client, queue: str) -> int:
+    return sum(
+        redis_client.llen(queue if step == 0 else f"{queue}{PRIORITY_SEPARATOR}{step}")
+        for step in PRIORITY_STEPS
+    )
+
+
+def get_queue_depths(redis_client) -> Dict[str, int]:
+    return {
+        get_queue(size_class): get_queue_depth(redis_client, get_queue(size_class))
+        for size_class in SIZE_CLASSES
+    }
+
+
+def record_queue_depths():
+    from worker import clients
+
+    try:
+        depths = get_queue_depths(clients.get_redis_client())
+    except Exception as e:
+        print("Error reading queue depths:", e)
+        return
+
+    for queue, depth in depths.items():
+        get_telemetry().gauge("queue_depth", depth, queue=queue)
+
+
+class TenantLimiter:
+    """
+    Caps the jobs a tenant runs at once in a queue, so one bulk uploader can't
+    hold every worker. Slots are leases that expire, a worker that dies
+    doesn't keep its slot for longer than lease_seconds.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        max_active_jobs: int,
+        lease_seconds: int,
+        prefix: str = "tenant-jobs:",
+    ):
+        self._redis = redis_client
+        self._max_active_jobs = max_active_jobs
+        self._lease_seconds = lease_seconds
+        self._prefix = prefix
+
+    def _key(self, tenant_id: str, queue: str) -> str:
+        return f"{self._prefix}{queue}:{tenant_id}"
+
+    def acquire(self, tenant_id: str, queue: str, job_id: str) -> bool:
+        key = self._key(tenant_id, queue)
+        now = time.time()
+
+        # a redelivered job renews the slot it already holds
+        pipeline = self._redis.pipeline()
+        pipeline.zremrangebyscore(key, "-inf", now)
+        pipeline.zadd(key, {job_id: now + self._lease_seconds})
+        pipeline.zcard(key)
+        pipeline.expire(key, self._lease_seconds)
+        active_jobs = pipeline.execute()[2]
+
+        if active_jobs > self._max_active_jobs:
+            self._redis.zrem(key, job_id)
+            return False
+
+        return True
+
+    def release(self, tenant_id: str, queue: str, job_id: str):
+        self._redis.zrem(self._key(tenant_id, queue), job_id)
+
+
+def get_tenant_limiter() -> Optional[TenantLimiter]:
+    if not config.JOB_ROUTING_ENABLED or config.TENANT_MAX_ACTIVE_JOBS <= 0:
+        return None
+
+    from worker import clients
+
+    return TenantLimiter(
+        clients.get_redis_client(),
+        max_active_jobs=config.TENANT_MAX_ACTIVE_JOBS,
+        lease_seconds=config.TASK_VISIBILITY_TIMEOUT,
+    )
+
+
+def acquire_tenant_slot(job: ParseJob) -> bool:
+    routing = get_routing(job)
+    tenant_limiter = get_tenant_limiter() if job.tenant_id and routing else None
+
+    if tenant_limiter is None:
+        return True
+
+    try:
+        return tenant_limiter.acquire(job.tenant_id, routing["queue"], job.job_id)
+    except Exception as e:
+        # a broken limiter mustn't stop every job, run this one
+        print("Error acquiring tenant slot:", e)
+        return True
+
+
+def release_tenant_slot(job: ParseJob):
+    routing = get_routing(job)
+    tenant_limiter = get_tenant_limiter() if job.tenant_id and routing else None
+
+    if tenant_limiter is None:
+        return
+
+    try:
+        tenant_limiter.release(job.tenant_id, routing["queue"], job.job_id)
+    except Exception as e:
+        # the slot's lease runs out on its own
+        print("Error releasing tenant slot:", e)
+
+
+class DispatchLog:
+    """
+    Jobs whose page ranges were handed to a chord. A job redelivered after
+    dispatching has nothing left to do, assemble_pdf finishes it.
+    """
+
+    def __init__(self, redis_client, ttl_seconds: int, prefix: str = "dispatched:"):
+        self._redis = redis_client
+        self._ttl_seconds = ttl_seconds
+        self._prefix = prefix
+
+    def record(self, job_id: str):
+        self._redis.set(f"{self._prefix}{job_id}", b"1", ex=self._ttl_seconds)
+
+    def was_dispatched(self, job_id: str) -> bool:
+        return self._redis.get(f"{self._prefix}{job_id}") is not None
+
+
+def get_dispatch_log() -> DispatchLog:
+    from worker import clients
+
+    return DispatchLog(
+        clients.get_redis_client(), ttl_seconds=config.TASK_VISIBILITY_TIMEOUT
+    )
@@ -1,14 +1,38 @@
+import asyncio
+
 import modal
+from fastapi import HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from worker.types import InferenceRequest
 
 
 def download_model():
-    from worker.model import get_model, MODEL_CACHE_PATH
+    from worker.model import (
+        MODEL_CACHE_PATH,
+        PROCESSOR_CACHE_PATH,
+        get_model,
+        get_processor,
+    )
 
+    # containers load these snapshots directly, see get_model/get_processor
     model = get_model()
-    model.save_pretrained(MODEL_CACHE_PATH)
+    model.save_pretrained(MODEL_CACHE_PATH, safe_serialization=True)
+    get_processor().save_pretrained(PROCESSOR_CACHE_PATH)
+
 
+# requests arriving within MAX_BATCH_WAIT_MS of each other share a generate call
+MAX_BATCH_SIZE = 8
+MAX_BATCH_WAIT_MS = 50
+# inputs beyond a batch queue up for the next generate call while one runs
+MAX_CONCURRENT_INPUTS = 2 * MAX_BATCH_SIZE
+# a request can wait out the batch ahead of it and then its own, each up to
+# MAX_NEW_TOKENS (4096) decoding steps at ~30ms a step on an A100
+REQUEST_TIMEOUT_SECONDS = 300
+# identical requests in flight share one generation, results are reused for
+# this long to absorb retries and re-submissions
+RESULT_CACHE_TTL_SECONDS = 60
+RESULT_CACHE_MAX_ENTRIES = 1024
 
 app = modal.App("pdf-comparison", secrets=[modal.Secret.from_name("huggingface")])
 
@@ -33,6 +57,7 @@ image = (
         "torch==2.4.*",
         "fastapi[standard]==0.115.*",
         "pydantic==2.9.*",
+        "python-dotenv",
         "ninja",
         "packaging",
         "wheel",
@@ -51,30 +76,171 @@ image = (
 
 @app.cls(
     gpu="A100:1",
-    timeout=30,
+    timeout=REQUEST_TIMEOUT_SECONDS,
     container_idle_timeout=15,
-    allow_concurrent_inputs=1,
+    allow_concurrent_inputs=MAX_CONCURRENT_INPUTS,
     image=image,
     retries=0,
 )
 class Model:
     @modal.enter()
     def start_runtime(self):
-        from worker.model import get_model, get_processor
+        import time
+
+        from worker.batching import DynamicBatcher, RequestCoalescer
+        from worker.model import (
+            MODEL_CACHE_PATH,
+            get_model,
+            get_processor,
+            has_local_snapshot,
+            warmup,
+        )
+        from worker.telemetry import get_telemetry
+
+        telemetry = get_telemetry()
+        started = time.perf_counter()
+        source = "snapshot" if has_local_snapshot(MODEL_CACHE_PATH) else "hub"
+
+        with telemetry.span("model_load", source=source):
+            self._model = get_model()
+            self._processor = get_processor()
+
+        loaded = time.perf_counter()
+
+        with telemetry.span("warmup"):
+            warmup(self._processor, self._model)
+
+        telemetry.observe("cold_start_seconds", time.perf_counter() - started)
+        telemetry.counter("model_loads_total", source=source)
+        print(
+            f"model loaded from {source} in {loaded - started:.1f}s,",
+            f"warmed up in {time.perf_counter() - loaded:.1f}s",
+        )
+
+        self._batcher = DynamicBatcher(
+            self._run_batch,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=MAX_BATCH_WAIT_MS,
+        )
+        self._coalescer = RequestCoalescer(
+            ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+        )
+
+    @modal.exit()
+    def stop_runtime(self):
+        self._batcher.close()
+
+    def _run_batch(self, batch):
+        from worker.model import run_batch_inference
+
+        return run_batch_inference(
+            [messages for messages, _ in batch],
+            processor=self._processor,
+            model=self._model,
+            stop_after_blocks=[stop_after_blocks for _, stop_after_blocks in batch],
+        )
+
+    async def _read_request(self, request: Request):
+        from worker.telemetry import BYTES_BUCKETS, get_telemetry
 
-        self._model = get_model()
-        self._processor = get_processor()
+        body = await request.body()
+        get_telemetry().observe("request_bytes", len(body), BYTES_BUCKETS)
+
+        # parsing and decoding images is CPU bound, keep it off the event loop
+        # so other requests are still read and batched meanwhile
+        return await asyncio.to_thread(
+            self._parse_request, body, request.headers.get("content-type", "")
+        )
+
+    def _parse_request(self, body: bytes, content_type: str):
+        from worker.model import MAX_PIXELS, MIN_PIXELS
+        from worker.resolution import apply_pixel_budget
+        from worker.wire import (
+            CONTENT_TYPE,
+            decode_request,
+            load_blob_images,
+            request_digest,
+        )
+
+        # binary envelopes carry raw image bytes, JSON bodies carry data URIs
+        try:
+            if content_type.startswith(CONTENT_TYPE):
+                inference_request, blobs = decode_request(body)
+            else:
+                inference_request = InferenceRequest.model_validate_json(body)
+                blobs = []
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        digest = request_digest(inference_request, blobs)
+        request_dict = inference_request.model_dump(exclude_none=True)
+        messages = apply_pixel_budget(request_dict["messages"], MIN_PIXELS, MAX_PIXELS)
+        messages = load_blob_images(messages, blobs)
+
+        return (messages, inference_request.stop_after_markdown_blocks), digest
 
     @modal.web_endpoint(method="POST", docs=True)
-    def generate(self, request: InferenceRequest):
-        from worker.model import run_inference
+    async def generate(self, request: Request):
+        from worker.telemetry import get_telemetry
+
+        telemetry = get_telemetry()
+
+        with telemetry.span("request"):
+            item, digest = await self._read_request(request)
+
+            future, outcome = self._coalescer.submit(
+                digest, lambda: self._batcher.submit(item)
+            )
+            telemetry.counter("coalesced_requests_total", outcome=outcome)
+            output = await asyncio.wrap_future(future)
+
+        return {"outputs": [output]}
 
-        request_dict = request.model_dump(exclude_none=True)
+    @modal.web_endpoint(method="GET")
+    def metrics(self):
+        from worker.telemetry import get_telemetry
 
-        outputs = run_inference(
-            messages=request_dict["messages"],
+        # metrics are per container, each scrape sees the one that answers
+        return PlainTextResponse(
+            get_telemetry().render_prometheus(),
+            media_type="text/plain; version=0.0.4",
+        )
+
+    @modal.web_endpoint(method="POST", docs=True)
+    async def generate_stream(self, request: Request):
+        import threading
+
+        from worker.model import stream_inference
+        from worker.streaming import SSE_CONTENT_TYPE, format_sse_event
+
+        (messages, stop_after_blocks), _ = await self._read_request(request)
+
+        # streamed requests run outside the batcher and the coalescer,
+        # TextIteratorStreamer only handles one sequence
+        cancelled = threading.Event()
+        chunks = stream_inference(
+            messages,
             processor=self._processor,
             model=self._model,
+            stop_after_blocks=stop_after_blocks,
+            cancelled=cancelled,
         )
 
-        return {"outputs": outputs}
+        async def events():
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(next, chunks, None)
+
+                    if chunk is None:
+                        break
+
+                    if chunk:
+                        yield format_sse_event({"text": chunk})
+
+                yield format_sse_event({}, event="done")
+            finally:
+                # the client hung up or got everything, stop generating
+                cancelled.set()
+
+        return StreamingResponse(events(), media_type=SSE_CONTENT_TYPE)
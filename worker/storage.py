@@ -0,0 +1,114 @@
+import hashlib
+import os
+import shutil
+from typing import BinaryIO, List, Optional, Union
+
+
+class LocalBucket:
+    """
+    A directory that answers the subset of the Supabase bucket API the worker
+    uses, so jobs can run without Supabase (benchmarks, local development).
+    """
+
+    def __init__(self, root: str):
+        self._root = root
+
+    def _path(self, path: str) -> str:
+        full_path = os.path.normpath(os.path.join(self._root, path))
+
+        if os.path.commonpath([self._root, full_path]) != self._root:
+            raise ValueError(f"Path escapes the bucket: {path}")
+
+        return full_path
+
+    def download(self, path: str) -> bytes:
+        with open(self._path(path), "rb") as fp:
+            return fp.read()
+
+    def download_range(self, path: str, offset: int, length: int) -> bytes:
+        # a ranged GET against Supabase storage
+        with open(self._path(path), "rb") as fp:
+            fp.seek(offset)
+            return fp.read(length)
+
+    def upload(
+        self,
+        path: str,
+        file: Union[BinaryIO, bytes],
+        file_options: Optional[dict] = None,
+    ):
+        full_path = self._path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        # like Supabase, an existing object is only replaced with upsert
+        if os.path.exists(full_path) and (file_options or {}).get("upsert") != "true":
+            raise FileExistsError(f"The resource already exists: {path}")
+
+        with open(full_path, "wb") as fp:
+            if isinstance(file, bytes):
+                fp.write(file)
+            else:
+                shutil.copyfileobj(file, fp)
+
+        return {"Key": path}
+
+    def list(self, path: Optional[str] = None, options: Optional[dict] = None):
+        folder = self._path(path or "")
+        search = (options or {}).get("search", "")
+        files: List[dict] = []
+
+        if not os.path.isdir(folder):
+            return files
+
+        for name in sorted(os.listdir(folder)):
+            full_path = os.path.join(folder, name)
+
+            if search not in name or not os.path.isfile(full_path):
+                continue
+
+            with open(full_path, "rb") as fp:
+                etag = hashlib.md5(fp.read()).hexdigest()
+
+            files.append(
+                {
+                    "name": name,
+                    "metadata": {
+                        "eTag": f'"{etag}"',
+                        "size": os.path.getsize(full_path),
+                    },
+                }
+            )
+
+        return files
+
+    def copy(self, from_path: str, to_path: str):
+        to_full_path = self._path(to_path)
+
+        if os.path.exists(to_full_path):
+            raise FileExistsError(f"The resource already exists: {to_path}")
+
+        os.makedirs(os.path.dirname(to_full_path), exist_ok=True)
+        shutil.copyfile(self._path(from_path), to_full_path)
+
+        return {"Key": to_path}
+
+    def remove(self, paths: List[str]):
+        removed = []
+
+        for path in paths:
+            try:
+                os.remove(self._path(path))
+            except FileNotFoundError:
+                continue
+
+            removed.append({"name": path})
+
+        return removed
+
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self._root = os.path.abspath(root)
+
+    def from_(self, bucket: str) -> LocalBucket:
+        return LocalBucket(os.path.join(self._root, bucket))
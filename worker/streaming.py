@@ -0,0 +1,55 @@
+import json
+from typing import Iterable, Iterator, Optional, Tuple
+
+MARKDOWN_FENCE = "```"
+SSE_CONTENT_TYPE = "text/event-stream"
+
+
+def count_closed_markdown_blocks(text: str) -> int:
+    # every block opens and closes with a fence, "```markdown" included
+    return text.count(MARKDOWN_FENCE) // 2
+
+
+def has_closed_markdown_blocks(text: str, blocks: Optional[int]) -> bool:
+    return blocks is not None and count_closed_markdown_blocks(text) >= blocks
+
+
+def format_sse_event(data: dict, event: Optional[str] = None) -> str:
+    # chunks are JSON encoded so newlines in generated text survive the framing
+    lines = [] if event is None else [f"event: {event}"]
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def iter_sse_events(lines: Iterable[str]) -> Iterator[Tuple[str, dict]]:
+    event, data = "message", []
+
+    for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:") :].strip())
+
+    if data:
+        yield event, json.loads("\n".join(data))
+
+
+def collect_stream(chunks: Iterable[str], stop_after_blocks: Optional[int]) -> str:
+    """
+    Joins streamed text chunks, returning as soon as stop_after_blocks
+    markdown blocks are closed so the rest of the stream is never read.
+    """
+    text = ""
+
+    for chunk in chunks:
+        text += chunk
+
+        if has_closed_markdown_blocks(text, stop_after_blocks):
+            break
+
+    return text
@@ -0,0 +1,271 @@
+import bisect
+import contextlib
+import functools
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+from worker import config
+
+TEXTFILE_NAME = re.compile(r"worker-(\d+)\.prom")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1024 * 4**i for i in range(10))  # 1KiB to 256MiB
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: LabelSet, extra: Optional[dict] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+
+    if not pairs:
+        return ""
+
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Telemetry:
+    """
+    In-process counters, histograms and timing spans, exported in the
+    Prometheus text format. Metric labels are kept low cardinality, job and
+    page IDs only go to the span log.
+    """
+
+    enabled = True
+
+    def __init__(self, prefix: str = "pdf_comparison_", log_spans: bool = False):
+        self._prefix = prefix
+        self._log_spans = log_spans
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, Histogram]] = {}
+        self._context = threading.local()
+
+    @contextlib.contextmanager
+    def bind(self, **attributes):
+        # attributes added to every span logged on this thread, e.g. job_id
+        previous = getattr(self._context, "attributes", {})
+        self._context.attributes = {**previous, **attributes}
+
+        try:
+            yield
+        finally:
+            self._context.attributes = previous
+
+    def counter(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+        **labels,
+    ):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _labels(labels)
+
+            if key not in series:
+                series[key] = Histogram(buckets)
+
+            series[key].observe(value)
+
+    @contextlib.contextmanager
+    def span(self, stage: str, **attributes):
+        started = time.perf_counter()
+        error = None
+
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.observe("stage_duration_seconds", duration, stage=stage)
+
+            if error is not None:
+                self.counter("stage_errors_total", stage=stage, error=error)
+
+            if self._log_spans:
+                print(
+                    json.dumps(
+                        {
+                            "span": stage,
+                            "duration_ms": round(duration * 1000, 3),
+                            "error": error,
+                            **getattr(self._context, "attributes", {}),
+                            **attributes,
+                        }
+                    )
+                )
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    def get_gauge(self, name: str, **labels) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(name, {}).get(_labels(labels))
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(_labels(labels))
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = self._prefix + name
+                lines.append(f"# TYPE {metric} counter")
+
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+            for name, series in sorted(self._gauges.items()):
+                metric = self._prefix + name
+                lines.append(f"# TYPE {metric} gauge")
+
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                metric = self._prefix + name
+                lines.append(f"# TYPE {metric} histogram")
+
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+
+                    for bound, count in zip(
+                        histogram.buckets + (float("inf"),), histogram.counts
+                    ):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(float(bound))
+                        lines.append(
+                            f"{metric}_bucket{_format_labels(labels, {'le': le})} "
+                            f"{cumulative}"
+                        )
+
+                    lines.append(
+                        f"{metric}_sum{_format_labels(labels)} {histogram.sum}"
+                    )
+                    lines.append(
+                        f"{metric}_count{_format_labels(labels)} {histogram.count}"
+                    )
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, directory: str):
+        # one file per process, for node_exporter's textfile collector
+        path = _get_textfile_path(directory, os.getpid())
+        temp_path = f"{path}.tmp"
+
+        with open(temp_path, "w") as fp:
+            fp.write(self.render_prometheus())
+
+        os.replace(temp_path, path)
+
+
+class NoopTelemetry(Telemetry):
+    enabled = False
+
+    def counter(self, name: str, value: float = 1, **labels):
+        pass
+
+    def gauge(self, name: str, value: float, **labels):
+        pass
+
+    def observe(self, name: str, value: float, buckets=SECONDS_BUCKETS, **labels):
+        pass
+
+    def bind(self, **attributes):
+        return contextlib.nullcontext()
+
+    def span(self, stage: str, **attributes):
+        return contextlib.nullcontext()
+
+    def write_textfile(self, directory: str):
+        pass
+
+
+def _get_textfile_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"worker-{pid}.prom")
+
+
+def _process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # running, as another user
+        return True
+
+
+def remove_textfile(directory: str, pid: Optional[int] = None):
+    # a process that's gone mustn't keep exporting its last counters
+    try:
+        os.remove(_get_textfile_path(directory, pid or os.getpid()))
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale_textfiles(directory: str):
+    """
+    Removes the files of processes that died without shutting down, e.g.
+    killed for running out of memory.
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+
+    for name in names:
+        match = TEXTFILE_NAME.fullmatch(name)
+
+        if match and not _process_exists(int(match.group(1))):
+            remove_textfile(directory, int(match.group(1)))
+
+
+@functools.lru_cache(maxsize=None)
+def get_telemetry() -> Telemetry:
+    if not config.TELEMETRY_ENABLED:
+        return NoopTelemetry()
+
+    return Telemetry(log_spans=config.TELEMETRY_LOG_SPANS)
@@ -0,0 +1,147 @@
+import statistics
+from typing import List
+
+import fitz
+from PIL import Image, ImageStat
+
+PAGE_ROUTE_TEXT = "text"
+PAGE_ROUTE_BLANK = "blank"
+PAGE_ROUTE_IMAGE = "image"
+
+# how clean a text layer has to be before the page skips image inference
+TEXT_LAYER_THRESHOLDS = {
+    "strict": {
+        "min_chars": 200,
+        "max_bad_char_ratio": 0.001,
+        "max_image_coverage": 0.05,
+    },
+    "lenient": {
+        "min_chars": 40,
+        "max_bad_char_ratio": 0.02,
+        "max_image_coverage": 0.35,
+    },
+}
+
+BLANK_PAGE_MAX_STDDEV = 2.0
+BLANK_PAGE_RENDER_SCALE = 0.25
+HEADING_FONT_SIZE_RATIO = 1.3
+
+
+def is_blank_page(page: fitz.Page) -> bool:
+    if page.get_text("text").strip():
+        return False
+
+    # a tiny grayscale render is enough to spot ink, scanned blanks are noisy
+    pix = page.get_pixmap(  # type: ignore
+        matrix=fitz.Matrix(BLANK_PAGE_RENDER_SCALE, BLANK_PAGE_RENDER_SCALE),
+        colorspace=fitz.csGRAY,
+        alpha=False,
+    )
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+    return ImageStat.Stat(image).stddev[0] <= BLANK_PAGE_MAX_STDDEV
+
+
+def get_image_coverage(page: fitz.Page) -> float:
+    page_area = abs(page.rect)
+
+    if page_area == 0:
+        return 0.0
+
+    covered = sum(
+        abs(fitz.Rect(image["bbox"]) & page.rect) for image in page.get_image_info()
+    )
+    return min(covered / page_area, 1.0)
+
+
+def get_bad_char_ratio(text: str) -> float:
+    chars = [char for char in text if not char.isspace()]
+
+    if not chars:
+        return 1.0
+
+    # U+FFFD and control characters come from fonts without a usable ToUnicode map
+    bad_chars = sum(1 for char in chars if char == "\ufffd" or not char.isprintable())
+    return bad_chars / len(chars)
+
+
+def has_clean_text_layer(page: fitz.Page, mode: str) -> bool:
+    thresholds = TEXT_LAYER_THRESHOLDS[mode]
+    text = page.get_text("text")
+
+    return (
+        len(text.strip()) >= thresholds["min_chars"]
+        and get_bad_char_ratio(text) <= thresholds["max_bad_char_ratio"]
+        and get_image_coverage(page) <= thresholds["max_image_coverage"]
+    )
+
+
+def classify_page(page: fitz.Page, mode: str) -> str:
+    if mode != "off" and mode not in TEXT_LAYER_THRESHOLDS:
+        raise ValueError(f"Unknown text layer mode: {mode}")
+
+    if is_blank_page(page):
+        return PAGE_ROUTE_BLANK
+
+    if mode != "off" and has_clean_text_layer(page, mode):
+        return PAGE_ROUTE_TEXT
+
+    return PAGE_ROUTE_IMAGE
+
+
+def _block_to_markdown(block: dict, body_font_size: float) -> str:
+    lines = []
+    max_font_size = 0.0
+
+    for line in block["lines"]:
+        text = "".join(span["text"] for span in line["spans"]).strip()
+
+        if text:
+            lines.append(text)
+            max_font_size = max(
+                [max_font_size] + [span["size"] for span in line["spans"]]
+            )
+
+    if not lines:
+        return ""
+
+    text = " ".join(lines)
+
+    if max_font_size >= body_font_size * HEADING_FONT_SIZE_RATIO:
+        level = 1 if max_font_size >= body_font_size * 1.8 else 2
+        return f"{'#' * level} {text}"
+
+    return text
+
+
+def page_text_to_markdown(page: fitz.Page) -> str:
+    tables = page.find_tables().tables
+    table_rects = [fitz.Rect(table.bbox) for table in tables]
+
+    blocks = [
+        block
+        for block in page.get_text("dict", sort=True)["blocks"]
+        if block["type"] == 0
+        and not any(fitz.Rect(block["bbox"]).intersects(rect) for rect in table_rects)
+    ]
+
+    font_sizes = [
+        span["size"]
+        for block in blocks
+        for line in block["lines"]
+        for span in line["spans"]
+        if span["text"].strip()
+    ]
+    body_font_size = statistics.median(font_sizes) if font_sizes else 0.0
+
+    # (top, left, markdown) so tables land between the surrounding paragraphs
+    parts: List[tuple] = [
+        (block["bbox"][1], block["bbox"][0], _block_to_markdown(block, body_font_size))
+        for block in blocks
+    ]
+    parts += [
+        (table.bbox[1], table.bbox[0], table.to_markdown(clean=False).strip())
+        for table in tables
+    ]
+
+    return "\n\n".join(markdown for _, _, markdown in sorted(parts) if markdown)
@@ -1,19 +1,53 @@
 from typing import List, Literal, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+
+from worker.output import normalize_output_format
 
 
 class ParseJob(BaseModel):
     job_id: str
-    output_format: str
+    output_format: str = "md"  # md|mdpack|mdpack+gzip|mdpack+zstd
     source_file: str
+    # how clean a page's text layer must be to skip image inference
+    text_layer_mode: Optional[Literal["off", "strict", "lenient"]] = None
+    # page image size, overrides PAGE_RESOLUTION_MODE and PAGE_MAX_PIXELS
+    resolution_mode: Optional[Literal["dpi", "budget", "adaptive"]] = None
+    max_pixels: Optional[int] = None
+    # scheduling, the page count is read from the source file when missing
+    tenant_id: Optional[str] = None
+    priority: Optional[Literal["high", "normal", "low"]] = None
+    page_count: Optional[int] = None
+
+    @field_validator("output_format")
+    @classmethod
+    def check_output_format(cls, output_format: str) -> str:
+        return normalize_output_format(output_format)
+
+
+class ConversionReport(BaseModel):
+    total_pages: int = 0
+    text_pages: int = 0
+    image_pages: int = 0
+    blank_pages: int = 0
+    failed_pages: int = 0
+    reused_output: bool = False
+    # number of subtasks the document was split across
+    page_ranges: int = 1
+
+    @property
+    def pages_done(self) -> int:
+        return self.text_pages + self.image_pages + self.blank_pages + self.failed_pages
 
 
 class InferenceMessageContent(BaseModel):
     type: Literal["image", "text"]
-    image: Optional[str] = None  # starts with data:image;base64,
+    image: Optional[str] = None  # data:image;base64, or blob:<index>
     text: Optional[str] = None
     resized_height: Optional[int] = None
     resized_width: Optional[int] = None
+    # capped by the deployment's own pixel budget
+    min_pixels: Optional[int] = None
+    max_pixels: Optional[int] = None
 
 
 class InferenceMessage(BaseModel):
@@ -23,3 +57,16 @@ class InferenceMessage(BaseModel):
 
 class InferenceRequest(BaseModel):
     messages: List[InferenceMessage]
+    # generation stops once this many ```markdown``` blocks are closed
+    stop_after_markdown_blocks: Optional[int] = None
+
+
+class ConversionCheckpoint(BaseModel):
+    # source page to continue from
+    next_page_number: int = 0
+    # pages already handed to the consumer
+    page_counter: int = 0
+    # last converted page, not yet corrected against the page after it
+    last_page: Optional[str] = None
+    report: ConversionReport = ConversionReport()
+    settings_digest: Optional[str] = None
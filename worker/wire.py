@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import io
+import json
+import struct
+from typing import List, Tuple
+
+from worker.types import InferenceRequest
+
+# Binary inference request envelope, images travel as raw bytes instead of
+# base64 data URIs inside the JSON body:
+#
+#   magic (4 bytes) | version (1 byte)
+#   header length (uint32) | header (InferenceRequest JSON)
+#   blob count (uint32) | blob length (uint64) | blob bytes | ...
+#
+# image contents in the header refer to blobs as "blob:<index>".
+CONTENT_TYPE = "application/x-inference-envelope"
+MAGIC = b"PDFI"
+VERSION = 1
+BLOB_PREFIX = "blob:"
+
+
+def encode_request(request: InferenceRequest, blobs: List[bytes]) -> bytes:
+    header = request.model_dump_json(exclude_none=True).encode("utf-8")
+    parts = [
+        MAGIC,
+        struct.pack(">BI", VERSION, len(header)),
+        header,
+        struct.pack(">I", len(blobs)),
+    ]
+
+    for blob in blobs:
+        parts.append(struct.pack(">Q", len(blob)))
+        parts.append(blob)
+
+    return b"".join(parts)
+
+
+def decode_request(body: bytes) -> Tuple[InferenceRequest, List[bytes]]:
+    view = memoryview(body)
+
+    def take(size: int) -> memoryview:
+        nonlocal view
+
+        if len(view) < size:
+            raise ValueError("Truncated inference request envelope")
+
+        chunk, view = view[:size], view[size:]
+        return chunk
+
+    if bytes(take(len(MAGIC))) != MAGIC:
+        raise ValueError("Not an inference request envelope")
+
+    version, header_length = struct.unpack(">BI", take(5))
+
+    if version != VERSION:
+        raise ValueError(f"Unsupported inference request envelope version: {version}")
+
+    request = InferenceRequest.model_validate_json(bytes(take(header_length)))
+    (blob_count,) = struct.unpack(">I", take(4))
+    blobs = []
+
+    for _ in range(blob_count):
+        (blob_length,) = struct.unpack(">Q", take(8))
+        blobs.append(bytes(take(blob_length)))
+
+    if len(view) != 0:
+        raise ValueError("Trailing bytes after inference request envelope")
+
+    return request, blobs
+
+
+def load_blob_images(messages: List[dict], blobs: List[bytes]) -> List[dict]:
+    from PIL import Image
+
+    for message in messages:
+        for content in message["content"]:
+            image = content.get("image")
+
+            if isinstance(image, str) and image.startswith(BLOB_PREFIX):
+                blob = blobs[int(image[len(BLOB_PREFIX) :])]
+                content["image"] = Image.open(io.BytesIO(blob))
+                # decoded now rather than lazily on the thread running the batch
+                content["image"].load()
+
+    return messages
+
+
+def request_digest(request: InferenceRequest, blobs: List[bytes]) -> str:
+    """
+    Hash of what a request asks the model to do. Images are hashed by their
+    bytes, so the same page sent as a data URI or a blob gets the same digest.
+    """
+    request_dict = request.model_dump(exclude_none=True)
+
+    for message in request_dict["messages"]:
+        for content in message["content"]:
+            image = content.get("image")
+
+            if image is None:
+                continue
+
+            if image.startswith(BLOB_PREFIX):
+                data = blobs[int(image[len(BLOB_PREFIX) :])]
+            elif image.startswith("data:") and "," in image:
+                data = base64.b64decode(image.split(",", 1)[1])
+            else:
+                data = image.encode("utf-8")
+
+            content["image"] = hashlib.sha256(data).hexdigest()
+
+    canonical = json.dumps(request_dict, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()